@@ -12,6 +12,11 @@ from routes.playlists import playlists_bp
 from routes.stats import stats_bp
 from routes.recommendations import recommendations_bp
 from routes.misc import misc_bp
+from routes.metrics import metrics_bp
+from routes.images import images_bp
+from instrumentation import register_instrumentation
+from profiler import register_profiler
+from responses import register_response_hooks
 from utils import getenv_stripped
 
 app = Flask(__name__, static_folder='static/dist', static_url_path='')
@@ -29,6 +34,12 @@ app.register_blueprint(playlists_bp)
 app.register_blueprint(stats_bp)
 app.register_blueprint(recommendations_bp)
 app.register_blueprint(misc_bp)
+app.register_blueprint(metrics_bp)
+app.register_blueprint(images_bp)
+
+register_response_hooks(app)
+register_instrumentation(app)
+register_profiler(app)
 
 if not app.debug:
     logging.basicConfig(level=logging.INFO)
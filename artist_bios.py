@@ -0,0 +1,221 @@
+"""Artist bios from the intro section of each artist's English Wikipedia article.
+
+Lookups are batched: every artist that is not in the store is resolved through multi-title
+action=query requests (20 titles each, the most MediaWiki returns intro extracts for at once).
+Results, including "no article" answers, are kept for 24 hours in a zlib-compressed SQLite store
+(ORPHEUS_DATA_DIR/bios.sqlite3), so they survive restarts and are shared by every worker.
+
+Concurrent lookups of the same artist share one request, and /api/user-stats prefetches the bios
+of the user's top artists in the background so the artist overlays rarely wait on Wikipedia.
+"""
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from instrumentation import instrumented_get, record_cache
+from utils import data_dir
+
+logger = logging.getLogger(__name__)
+
+# ---------- Constants ----------
+BIO_TTL = 86400                      # 24 hours (bios rarely change)
+_WIKI_API = "https://en.wikipedia.org/w/api.php"
+_TITLES_PER_QUERY = 20               # exlimit maximum for intro-only extracts
+_MAX_CONTINUES = 5
+_FLIGHT_WAIT_S = 20
+_PREFETCH_MAX = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bios (
+    artist_id TEXT PRIMARY KEY,
+    ts        REAL NOT NULL,
+    source    TEXT,                  -- article URL; NULL with bio for "no article"
+    bio       BLOB                   -- zlib-compressed UTF-8 extract
+) WITHOUT ROWID;
+"""
+
+Bio = Dict[str, Optional[str]]       # {"bio": str|None, "source": str|None}
+_NO_BIO: Bio = {"bio": None, "source": None}
+
+
+def _query_pages(titles: List[str]) -> Dict[str, Bio]:
+    """title -> bio for one batch of titles, following redirects and title normalization."""
+    params: Dict[str, Any] = {
+        "action": "query",
+        "titles": "|".join(titles),
+        "prop": "extracts|info",
+        "exintro": True,
+        "explaintext": True,
+        "exlimit": "max",
+        "inprop": "url",
+        "format": "json",
+        "redirects": 1,
+    }
+    pages: Dict[str, Dict[str, Any]] = {}
+    aliases: Dict[str, str] = {}
+    for _ in range(_MAX_CONTINUES):
+        resp = instrumented_get("wikipedia", _WIKI_API, params=params, timeout=8,
+                                headers={"User-Agent": "Orpheus/2.0"})
+        resp.raise_for_status()
+        data = resp.json()
+        query = data.get("query") or {}
+        for hop in (query.get("normalized") or []) + (query.get("redirects") or []):
+            aliases[hop.get("from")] = hop.get("to")
+        for page in (query.get("pages") or {}).values():
+            merged = pages.setdefault(page.get("title"), {})
+            merged.update({k: v for k, v in page.items() if v is not None})
+        if not data.get("continue"):
+            break
+        params.update(data["continue"])
+
+    out: Dict[str, Bio] = {}
+    for title in titles:
+        final, hops = title, 0
+        while final in aliases and hops < 3:
+            final, hops = aliases[final], hops + 1
+        page = pages.get(final) or {}
+        extract = (page.get("extract") or "").strip()
+        if "missing" in page or "invalid" in page or not extract:
+            out[title] = dict(_NO_BIO)
+        else:
+            out[title] = {"bio": extract, "source": page.get("fullurl")}
+    return out
+
+
+class _Flight:
+    __slots__ = ("event", "bio")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.bio: Optional[Bio] = None
+
+
+class BioService:
+    def __init__(self, path=None, ttl: int = BIO_TTL):
+        self.ttl = ttl
+        self.path = path or data_dir() / "bios.sqlite3"
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._db_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Flight] = {}
+
+    # ---------- Store ----------
+    def cached(self, artist_ids: Iterable[str]) -> Dict[str, Bio]:
+        ids = list(dict.fromkeys(i for i in artist_ids if i))
+        cutoff = time.time() - self.ttl
+        found: Dict[str, Bio] = {}
+        with self._db_lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT artist_id, source, bio FROM bios WHERE artist_id IN ({','.join('?' * len(batch))}) "
+                    "AND ts >= ?", (*batch, cutoff)).fetchall()
+                for artist_id, source, blob in rows:
+                    found[artist_id] = {"bio": zlib.decompress(blob).decode("utf-8") if blob else None,
+                                        "source": source}
+        return found
+
+    def _store(self, bios: Dict[str, Bio]) -> None:
+        now = time.time()
+        rows = [(aid, now, b["source"], zlib.compress(b["bio"].encode("utf-8")) if b["bio"] else None)
+                for aid, b in bios.items()]
+        with self._db_lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO bios VALUES (?, ?, ?, ?)", rows)
+            self._conn.execute("DELETE FROM bios WHERE ts < ?", (now - self.ttl,))
+
+    # ---------- Lookups ----------
+    def get_many(self, artists: Dict[str, str], record: bool = True) -> Dict[str, Bio]:
+        """artist_id -> bio for {artist_id: artist name}; misses go to Wikipedia in batched queries.
+
+        Raises requests.RequestException when Wikipedia fails for artists this call had to fetch.
+        """
+        found = self.cached(artists)
+        if record:
+            for artist_id in artists:
+                record_cache("bio", artist_id in found)
+        missing = [aid for aid in artists if aid not in found and artists[aid]]
+        if not missing:
+            return {aid: found.get(aid, dict(_NO_BIO)) for aid in artists}
+
+        leading: List[str] = []
+        waiting: List[Tuple[str, _Flight]] = []
+        with self._lock:
+            for artist_id in missing:
+                flight = self._inflight.get(artist_id)
+                if flight is None:
+                    self._inflight[artist_id] = _Flight()
+                    leading.append(artist_id)
+                else:
+                    waiting.append((artist_id, flight))
+
+        try:
+            if leading:
+                found.update(self._fetch({aid: artists[aid] for aid in leading}))
+        finally:
+            with self._lock:
+                flights = [self._inflight.pop(aid) for aid in leading]
+            for artist_id, flight in zip(leading, flights):
+                flight.bio = found.get(artist_id)
+                flight.event.set()
+
+        retry = {}
+        for artist_id, flight in waiting:
+            if flight.event.wait(_FLIGHT_WAIT_S) and flight.bio is not None:
+                found[artist_id] = flight.bio
+            else:
+                retry[artist_id] = artists[artist_id]
+        if retry:
+            found.update(self._fetch(retry))
+        return {aid: found.get(aid, dict(_NO_BIO)) for aid in artists}
+
+    def _fetch(self, artists: Dict[str, str]) -> Dict[str, Bio]:
+        titles = list(dict.fromkeys(artists.values()))
+        by_title: Dict[str, Bio] = {}
+        for start in range(0, len(titles), _TITLES_PER_QUERY):
+            by_title.update(_query_pages(titles[start:start + _TITLES_PER_QUERY]))
+        bios = {aid: by_title.get(name, dict(_NO_BIO)) for aid, name in artists.items()}
+        self._store(bios)
+        return bios
+
+    def prefetch(self, artists: Dict[str, str]) -> None:
+        """Warm the store for these artists on a background thread; already-stored ones cost nothing."""
+        artists = dict(list(((aid, name) for aid, name in artists.items() if aid and name))[:_PREFETCH_MAX])
+        cached = self.cached(artists)
+        missing = {aid: name for aid, name in artists.items() if aid not in cached}
+        if not missing:
+            return
+
+        def run() -> None:
+            try:
+                self.get_many(missing, record=False)
+            except Exception:
+                logger.warning("Bio prefetch failed for %d artists", len(missing), exc_info=True)
+
+        threading.Thread(target=run, name="bio-prefetch", daemon=True).start()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._db_lock:
+            total, empty = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bio IS NULL), 0) FROM bios").fetchone()
+        with self._lock:
+            inflight = len(self._inflight)
+        return {"entries": total, "without_article": empty, "inflight": inflight}
+
+
+_service: Optional[BioService] = None
+_service_lock = threading.Lock()
+
+
+def get_bio_service() -> BioService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = BioService()
+        return _service
@@ -0,0 +1,221 @@
+"""Asyncio Spotify client for the I/O-heavy blueprints (stats, playlists).
+
+The app is still a WSGI Flask app. This is not an ASGI mode: a request thread that needs several
+Spotify calls submits one coroutine with run_async() and waits for it. What the async path buys
+is that every coroutine of a worker process runs on one long-lived event loop (a daemon thread),
+over one pooled httpx.AsyncClient. So:
+
+  - a request's calls (top items for every range, all pages of a playlist) run concurrently,
+    up to SPOTIFY_ASYNC_CONCURRENCY per request;
+  - connections and TLS sessions to api.spotify.com are kept alive and shared by every request
+    in the process (up to SPOTIFY_ASYNC_POOL), instead of a fresh client per request.
+
+The request thread itself stays blocked while it waits, so how many requests a worker serves at
+once is still set by the gunicorn profile (threads or greenlets); see gunicorn.conf.py.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+try:
+    import httpx
+except ImportError:  # optional: routes fall back to the sync spotipy client
+    httpx = None
+
+from spotipy.exceptions import SpotifyException
+
+from http_cache import ETAG_CACHE, SPOTIFY_API_PREFIX, CachedBody, etag_cache_key
+from instrumentation import record_upstream_call
+from utils import getenv_stripped
+
+# ---------- Constants ----------
+# Upstream requests allowed in flight per client; keeps fan-out well under Spotify's rate limits.
+_MAX_CONCURRENCY = int(getenv_stripped("SPOTIFY_ASYNC_CONCURRENCY") or 8)
+# Connections the process-wide client keeps to Spotify, shared by all requests of a worker.
+_POOL_SIZE = int(getenv_stripped("SPOTIFY_ASYNC_POOL") or 64)
+_TIMEOUT_S = 5
+_RETRY_CODES = (429, 500, 502, 503, 504)
+_RETRIES = 3
+_BACKOFF_FACTOR = 0.3
+
+ASYNC_ENABLED = httpx is not None and (getenv_stripped("ORPHEUS_ASYNC") or "1") != "0"
+
+# httpx logs every request at INFO, which would flood the app log during fan-out.
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+# ---------- Event loop ----------
+class _LoopThread:
+    """One event loop per worker process, on a daemon thread, with the shared HTTP client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.client = None
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # Started lazily, and again after a fork: a preloaded gunicorn master must not hand
+            # its loop thread (which does not survive fork) to the workers.
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._start()
+            return self.loop
+
+    def _start(self) -> None:
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run() -> None:
+            asyncio.set_event_loop(loop)
+            self.client = httpx.AsyncClient(
+                timeout=_TIMEOUT_S,
+                limits=httpx.Limits(max_connections=_POOL_SIZE, max_keepalive_connections=_POOL_SIZE),
+            )
+            ready.set()
+            loop.run_forever()
+
+        self.loop, self._pid = loop, os.getpid()
+        self._thread = threading.Thread(target=run, name="spotify-async", daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def in_loop_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+
+_loop = _LoopThread()
+
+
+# ---------- Client ----------
+class AsyncSpotify:
+    """Minimal asyncio Spotify Web API client mirroring the spotipy calls the blueprints use.
+
+    Errors surface as SpotifyException so route error handling is shared with the sync path,
+    and GETs revalidate against the same ETag cache as ConditionalSession. Instances are per
+    request (token, concurrency cap); the HTTP connections underneath are the process's.
+    """
+
+    def __init__(self, access_token: str, prefix: str = SPOTIFY_API_PREFIX):
+        self.prefix = prefix
+        self._headers = {"Authorization": f"Bearer {access_token}"}
+        self._client = _loop.client
+        self._semaphore = asyncio.Semaphore(_MAX_CONCURRENCY)
+
+    async def __aenter__(self) -> "AsyncSpotify":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        # The shared client outlives the request; nothing to close.
+        return None
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        url = path if path.startswith("http") else self.prefix + path
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        key = etag_cache_key(url, params, self._headers)
+        cached = ETAG_CACHE.get(key)
+        headers = dict(self._headers)
+        if cached is not None:
+            headers["If-None-Match"] = cached.etag
+
+        start = time.perf_counter()
+        for attempt in range(_RETRIES + 1):
+            async with self._semaphore:
+                resp = await self._client.get(url, params=params, headers=headers)
+            if resp.status_code not in _RETRY_CODES or attempt == _RETRIES:
+                break
+            if resp.status_code == 429:
+                delay = float(resp.headers.get("Retry-After") or 2)
+            else:
+                delay = _BACKOFF_FACTOR * (2 ** attempt)
+            await asyncio.sleep(delay)
+
+        record_upstream_call("spotify", url, resp.status_code, (time.perf_counter() - start) * 1000,
+                             retries=attempt, nbytes=len(resp.content or b""))
+
+        if resp.status_code == 304 and cached is not None:
+            ETAG_CACHE.record(revalidated=True)
+            return json.loads(cached.content)
+        if resp.status_code >= 400:
+            try:
+                error = (resp.json() or {}).get("error") or {}
+                msg, reason = error.get("message"), error.get("reason")
+            except ValueError:
+                msg, reason = resp.text or None, None
+            raise SpotifyException(resp.status_code, -1, f"{resp.url}:\n {msg}", reason=reason, headers=resp.headers)
+
+        ETAG_CACHE.record(revalidated=False)
+        etag = resp.headers.get("ETag")
+        if etag:
+            ETAG_CACHE.put(key, CachedBody(etag, resp.content, resp.headers.get("Content-Type")))
+        return resp.json() if resp.content else None
+
+    # ----- spotipy-compatible helpers -----
+    async def current_user(self) -> Dict[str, Any]:
+        return await self.get("me/")
+
+    async def current_user_top_artists(self, limit: int = 20, offset: int = 0, time_range: str = "medium_term"):
+        return await self.get("me/top/artists", {"limit": limit, "offset": offset, "time_range": time_range})
+
+    async def current_user_top_tracks(self, limit: int = 20, offset: int = 0, time_range: str = "medium_term"):
+        return await self.get("me/top/tracks", {"limit": limit, "offset": offset, "time_range": time_range})
+
+    async def current_user_recently_played(self, limit: int = 50, after: Optional[int] = None, before: Optional[int] = None):
+        return await self.get("me/player/recently-played", {"limit": limit, "after": after, "before": before})
+
+    async def artists(self, artist_ids: List[str]):
+        return await self.get("artists", {"ids": ",".join(artist_ids)})
+
+    async def current_user_playlists(self, limit: int = 50, offset: int = 0):
+        return await self.get("me/playlists", {"limit": limit, "offset": offset})
+
+    async def tracks(self, track_ids: List[str]):
+        return await self.get("tracks", {"ids": ",".join(track_ids)})
+
+    async def playlist_items(self, playlist_id: str, limit: int = 100, offset: int = 0):
+        return await self.get(f"playlists/{playlist_id}/items", {
+            "limit": limit, "offset": offset, "additional_types": "track,episode",
+        })
+
+
+# ---------- Fan-out helpers ----------
+async def fetch_all_pages(fetch_page: Callable[[int, int], Awaitable[Any]], page_size: int) -> List[Dict[str, Any]]:
+    """Every item of a paged endpoint: one request to learn the total, then the remaining pages concurrently.
+
+    fetch_page(limit, offset) returns one Spotify paging object.
+    """
+    first = await fetch_page(page_size, 0) or {}
+    items: List[Dict[str, Any]] = list(first.get("items") or [])
+    if not first.get("next"):
+        return items
+    total = first.get("total") or 0
+    pages = await asyncio.gather(*(fetch_page(page_size, offset) for offset in range(page_size, total, page_size)))
+    for page in pages:
+        items.extend((page or {}).get("items") or [])
+    return items
+
+
+async def fetch_all_playlist_items(client: AsyncSpotify, playlist_id: str, page_size: int = 100) -> List[Dict[str, Any]]:
+    return await fetch_all_pages(lambda limit, offset: client.playlist_items(playlist_id, limit=limit, offset=offset),
+                                 page_size)
+
+
+async def fetch_all_user_playlists(client: AsyncSpotify, page_size: int = 50) -> List[Dict[str, Any]]:
+    return await fetch_all_pages(lambda limit, offset: client.current_user_playlists(limit=limit, offset=offset),
+                                 page_size)
+
+
+def run_async(coro):
+    """Run a coroutine on the process's event loop and wait for its result from sync Flask code.
+
+    The coroutine is scheduled from this thread, so it sees this request's context (session,
+    request) just as a direct call would.
+    """
+    if _loop.in_loop_thread():
+        raise RuntimeError("run_async() called from the event loop thread; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, _loop.get()).result()
@@ -0,0 +1,114 @@
+"""End-to-end latency / upstream-call / memory benchmark against the fake Spotify server.
+
+Drives the real Flask app (test client, authenticated session) with every Spotify call routed to
+benchmarks.fake_spotify. For each scenario it reports p50/p99 latency, upstream calls per request
+and peak RSS, so regressions in the hot paths show up without live Spotify.
+
+    python -m benchmarks.bench_e2e                          # all scenarios, 1k/10k/50k playlists
+    python -m benchmarks.bench_e2e --sizes 1000,10000 --iterations 10 --latency-ms 80 --rate-429 0.01
+    python -m benchmarks.bench_e2e --only filter-sweep --json results.json
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from benchmarks.fake_spotify import FakeSpotify, playlist_id
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--jitter-ms", type=float, default=5)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--only", action="append", help="run only scenarios whose name starts with this")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    fake = FakeSpotify(args.latency_ms, args.jitter_ms, args.rate_429, sizes)
+    base_url = fake.start()
+
+    # Configure before the app (and http_cache) are imported.
+    os.environ["SPOTIFY_API_BASE"] = base_url
+    for key in ("SPOTIPY_CLIENT_ID", "SPOTIPY_CLIENT_SECRET"):
+        os.environ.setdefault(key, "bench")
+    os.environ.setdefault("SPOTIPY_REDIRECT_URI", "http://127.0.0.1:5000/callback")
+
+    from app import app
+    from routes import stats as stats_routes
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["token_info"] = {"access_token": "bench-token", "refresh_token": "bench", "expires_at": int(time.time()) + 86400}
+
+    def cold_stats() -> Any:
+        stats_routes._STATS_CACHE.clear()
+        stats_routes._STATS_PARTS.clear()
+        return client.get("/api/user-stats")
+
+    scenarios: Dict[str, Callable[[], Any]] = {
+        "user-stats (cold)": cold_stats,
+        "user-stats (warm)": lambda: client.get("/api/user-stats"),
+    }
+    for size in sizes:
+        a, b = playlist_id("A", size), playlist_id("B", size)
+        scenarios[f"playlist {size:,}"] = lambda a=a: client.get(f"/api/playlist/{a}")
+        scenarios[f"check-duplicates {size:,}"] = lambda a=a: client.get(f"/api/check-duplicates/{a}")
+        scenarios[f"remove-duplicates {size:,}"] = lambda a=a: client.post(f"/api/remove-duplicates/{a}")
+        scenarios[f"filter-sweep {size:,}"] = lambda a=a, b=b: client.post(
+            "/api/filter-sweep", data={"playlist_a_id": a, "playlist_b_id": b})
+
+    results = []
+    print(f"{'scenario':<28} {'p50 ms':>9} {'p99 ms':>9} {'calls/req':>10} {'peak RSS MB':>12}")
+    for name, run in scenarios.items():
+        if args.only and not any(name.startswith(prefix) for prefix in args.only):
+            continue
+        latencies: List[float] = []
+        calls = 0
+        for _ in range(args.iterations):
+            fake.reset()
+            fake.take_calls()
+            start = time.perf_counter()
+            resp = run()
+            latencies.append((time.perf_counter() - start) * 1000)
+            calls += sum(fake.take_calls().values())
+            if resp.status_code >= 500:
+                print(f"  ! {name}: HTTP {resp.status_code} {resp.get_data(as_text=True)[:200]}")
+        ordered = sorted(latencies)
+        row = {
+            "scenario": name,
+            "p50_ms": round(statistics.median(ordered), 1),
+            "p99_ms": round(_percentile(ordered, 0.99), 1),
+            "upstream_calls_per_request": round(calls / args.iterations, 1),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+        }
+        results.append(row)
+        print(f"{name:<28} {row['p50_ms']:9.1f} {row['p99_ms']:9.1f} {row['upstream_calls_per_request']:10.1f} {row['peak_rss_mb']:12.1f}")
+
+    fake.stop()
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Cache-hit latency for large cached payloads: per-hit jsonify + gzip vs. pre-serialized bytes.
+
+Run from the repo root:  python -m benchmarks.bench_payload_cache [--hits 500]
+"""
+import argparse
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from flask import Flask, jsonify
+
+from responses import _finalize_response, cached_json_response
+
+
+def synthetic_stats_payload() -> Dict[str, Any]:
+    """Roughly the shape and size of a real /api/user-stats response."""
+    ranges = ("short_term", "medium_term", "long_term")
+    artists = {r: [{
+        "id": f"{r[:1]}{i:021d}",
+        "name": f"Artist {i}",
+        "url": f"https://open.spotify.com/artist/{i}",
+        "image": f"https://i.scdn.co/image/{i:040d}",
+        "genres": ["indie pop", "bedroom pop", "chillwave"],
+        "followers": 100000 + i,
+        "popularity": i % 100,
+        "bio": f"Artist {i} is a indie pop artist, followed by {100000 + i:,} Spotify listeners.",
+    } for i in range(50)] for r in ranges}
+    tracks = {r: [{
+        "name": f"Track {i}",
+        "artists": f"Artist {i}, Artist {i + 1}",
+        "url": f"https://open.spotify.com/track/{i}",
+        "album": f"Album {i // 2}",
+        "album_year": "2021",
+        "album_id": f"{i // 2:022d}",
+        "album_url": f"https://open.spotify.com/album/{i // 2}",
+        "cover": f"https://i.scdn.co/image/{i:040d}",
+        "artist_ids": [f"{i:022d}", f"{i + 1:022d}"],
+    } for i in range(50)] for r in ranges}
+    genres = [{"genre": f"Genre {i}", "count": 10 - i, "percentage": 10.0} for i in range(10)]
+    return {
+        "ok": True,
+        "user": {"name": "Bench", "image": None},
+        "top_artists": artists,
+        "top_tracks": tracks,
+        "top_genres": {"artists": {r: genres for r in ranges}, "tracks": {r: genres for r in ranges}},
+        "recently_played": tracks["short_term"][:30],
+    }
+
+
+def _time_hits(fn: Callable[[], Any], hits: int) -> List[float]:
+    samples = []
+    for _ in range(hits):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label: str, samples: List[float]) -> None:
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{label:<28} p50={statistics.median(ordered):7.3f}ms  p99={p99:7.3f}ms  mean={statistics.fmean(ordered):7.3f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hits", type=int, default=500)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    payload = synthetic_stats_payload()
+    entry = {"ts": time.time(), "data": payload}
+
+    with app.test_request_context("/api/user-stats", headers={"Accept-Encoding": "gzip"}):
+        before = _time_hits(lambda: _finalize_response(jsonify(entry["data"])), args.hits)
+        after = _time_hits(lambda: _finalize_response(cached_json_response(entry)), args.hits)
+        size = len(entry["body"])
+        compressed = len(entry["encoded"].get("gzip", b""))
+
+    print(f"payload: {size:,} bytes JSON, {compressed:,} bytes gzip, {args.hits} hits")
+    _report("jsonify + compress per hit", before)
+    _report("pre-serialized entry", after)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Throughput of the gunicorn server profile under concurrent load, per worker setting.
+
+Starts `gunicorn -c gunicorn.conf.py app:app` once per profile, drives it with N concurrent
+clients for a fixed duration and reports requests/s and latency percentiles.
+
+Run from the repo root, e.g.:
+
+    python -m benchmarks.bench_server --path /api/user-stats --cookie "session=..." \\
+        --profile sync:workers=1 --profile gthread:workers=2,threads=8 --profile gevent:workers=2
+
+Point it at an endpoint that waits on upstream I/O; extra `--env KEY=VALUE` pairs are passed to
+the server (e.g. to aim it at a local Spotify stand-in).
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import requests
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _profile_env(spec: str) -> Dict[str, str]:
+    """'gthread:workers=2,threads=8' -> ORPHEUS_WORKER_CLASS / ORPHEUS_WORKERS / ORPHEUS_THREADS."""
+    worker_class, _, opts = spec.partition(":")
+    env = {"ORPHEUS_WORKER_CLASS": worker_class}
+    for opt in filter(None, opts.split(",")):
+        key, _, value = opt.partition("=")
+        env[f"ORPHEUS_{key.strip().upper()}"] = value.strip()
+    return env
+
+
+def _wait_for_port(port: int, timeout: float = 20) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not start on port {port}")
+
+
+def _drive(url: str, cookie: str, concurrency: int, duration: float) -> Tuple[List[float], int]:
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def client() -> None:
+        nonlocal errors
+        session = requests.Session()
+        headers = {"Cookie": cookie} if cookie else {}
+        while time.time() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = session.get(url, headers=headers, timeout=60).status_code < 500
+            except requests.RequestException:
+                ok = False
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                errors += 0 if ok else 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    return latencies, errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--cookie", default="")
+    parser.add_argument("--profile", action="append", dest="profiles")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--env", action="append", default=[])
+    args = parser.parse_args()
+    profiles = args.profiles or ["sync:workers=1", "gthread:workers=2,threads=8", "gthread:workers=4,threads=16"]
+
+    print(f"{'profile':<32} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for spec in profiles:
+        port = _free_port()
+        env = dict(os.environ, PORT=str(port), **_profile_env(spec))
+        env.update(kv.split("=", 1) for kv in args.env)
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_for_port(port)
+            latencies, errors = _drive(f"http://127.0.0.1:{port}{args.path}", args.cookie, args.concurrency, args.duration)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+        ordered = sorted(latencies) or [0.0]
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        print(f"{spec:<32} {len(latencies) / args.duration:8.1f} {statistics.median(ordered):8.1f} {p99:8.1f} {errors:7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""Local stand-in for the Spotify Web API, for benchmarks that must not touch live Spotify.
+
+Profile endpoints (/me, top items, recently played) replay recorded fixtures from
+benchmarks/fixtures/spotify/. Playlists are synthetic and deterministic: for every configured size N
+there is an owned playlist `bnchA<N>` (N tracks, ~4% exact duplicates) and a reference playlist
+`bnchB<N>` that overlaps a fifth of it. Latency, jitter and 429 injection are configurable, GETs
+carry ETags, and every upstream call is counted.
+
+Point the app at it with SPOTIFY_API_BASE=http://127.0.0.1:<port>/v1.
+
+    python -m benchmarks.fake_spotify serve --port 8765 --latency-ms 80 --rate-429 0.02
+    python -m benchmarks.fake_spotify record --token <access token>   # refresh fixtures from real Spotify
+    python -m benchmarks.fake_spotify synthesize                      # regenerate anonymous fixtures
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+FIXTURES_DIR = Path(__file__).with_name("fixtures") / "spotify"
+FIXTURE_FILES = ("me", "top_artists", "top_tracks", "recently_played")
+BENCH_USER_ID = "bench_user"
+DEFAULT_SIZES = (1000, 10000, 50000)
+
+_GENRE_POOL = [
+    "indie pop", "bedroom pop", "art pop", "dream pop", "alternative rock", "indie rock", "shoegaze",
+    "neo soul", "alternative r&b", "uk garage", "deep house", "melodic techno", "trip hop",
+    "conscious hip hop", "jazz rap", "lo-fi beats", "chillwave", "synthpop", "post-punk", "emo",
+]
+
+
+# ---------- Synthetic catalog ----------
+def playlist_id(kind: str, size: int) -> str:
+    return f"bnch{kind}{size:017d}"
+
+
+def track_id(index: int) -> str:
+    return f"trk{index:019d}"
+
+
+def artist_id(index: int) -> str:
+    return f"art{index:019d}"
+
+
+def _image_set(seed: str) -> List[Dict[str, Any]]:
+    return [{"url": f"https://i.scdn.co/image/{seed}-{px}", "height": px, "width": px} for px in (640, 300, 64)]
+
+
+def synthetic_artist(index: int) -> Dict[str, Any]:
+    aid = artist_id(index)
+    rng = random.Random(index)
+    return {
+        "id": aid,
+        "name": f"Bench Artist {index}",
+        "uri": f"spotify:artist:{aid}",
+        "type": "artist",
+        "genres": rng.sample(_GENRE_POOL, 3),
+        "followers": {"href": None, "total": rng.randint(1000, 5_000_000)},
+        "popularity": rng.randint(10, 95),
+        "images": _image_set(aid),
+        "external_urls": {"spotify": f"https://open.spotify.com/artist/{aid}"},
+    }
+
+
+def synthetic_track(index: int) -> Dict[str, Any]:
+    tid = track_id(index)
+    artist_index = index % 2000
+    album_index = index // 12
+    return {
+        "id": tid,
+        "name": f"Bench Song {index}",
+        "uri": f"spotify:track:{tid}",
+        "type": "track",
+        "duration_ms": 150_000 + (index * 7919) % 150_000,
+        "explicit": index % 9 == 0,
+        "popularity": index % 100,
+        "artists": [{"id": artist_id(artist_index), "name": f"Bench Artist {artist_index}", "type": "artist"}],
+        "album": {
+            "id": f"alb{album_index:019d}",
+            "name": f"Bench Album {album_index}",
+            "release_date": f"{2000 + album_index % 25}-01-01",
+            "images": _image_set(f"alb{album_index}"),
+            "external_urls": {"spotify": f"https://open.spotify.com/album/alb{album_index:019d}"},
+        },
+        "external_urls": {"spotify": f"https://open.spotify.com/track/{tid}"},
+    }
+
+
+class FakePlaylist:
+    """Track indices in playlist order; items are materialized per page."""
+
+    def __init__(self, pid: str, name: str, indices: List[int], owner: str = BENCH_USER_ID):
+        self.id = pid
+        self.name = name
+        self.owner = owner
+        self.indices = indices
+        self.version = 0
+
+    @property
+    def snapshot_id(self) -> str:
+        return f"{self.id}-v{self.version}"
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "owner": {"id": self.owner, "display_name": "Bench User"},
+            "snapshot_id": self.snapshot_id,
+            "public": False,
+            "images": _image_set(self.id),
+            "tracks": {"total": len(self.indices)},
+            "external_urls": {"spotify": f"https://open.spotify.com/playlist/{self.id}"},
+        }
+
+
+def build_playlists(sizes=DEFAULT_SIZES, extra_playlists: int = 150) -> Dict[str, FakePlaylist]:
+    playlists: Dict[str, FakePlaylist] = {}
+    for size in sizes:
+        base = 1_000_000 * (len(playlists) + 1)
+        indices = []
+        for i in range(size):
+            # Every 25th slot repeats the previous track, giving ~4% exact duplicates.
+            indices.append(base + i - 1 if i % 25 == 24 else base + i)
+        playlists[playlist_id("A", size)] = FakePlaylist(playlist_id("A", size), f"Bench {size:,}", indices)
+        overlap = [base + i for i in range(size // 2, size // 2 + size // 5)]
+        playlists[playlist_id("B", size)] = FakePlaylist(
+            playlist_id("B", size), f"Bench {size:,} reference", overlap, owner="someone_else")
+    for n in range(extra_playlists):
+        pid = f"bnchX{n:017d}"
+        playlists[pid] = FakePlaylist(pid, f"Extra playlist {n}", list(range(n * 40, n * 40 + 40)))
+    return playlists
+
+
+def _iso_to_ms(value: str) -> int:
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+def _rebase_played_at(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Shift recorded plays so the newest one happened a minute ago, keeping their spacing."""
+    if not items:
+        return []
+    newest = max(_iso_to_ms(it["played_at"]) for it in items)
+    shift = int(time.time() * 1000) - 60_000 - newest
+    rebased = []
+    for it in items:
+        ts = datetime.fromtimestamp((_iso_to_ms(it["played_at"]) + shift) / 1000, timezone.utc)
+        rebased.append(dict(it, played_at=ts.strftime("%Y-%m-%dT%H:%M:%S.000Z")))
+    return sorted(rebased, key=lambda it: it["played_at"], reverse=True)
+
+
+# ---------- Server ----------
+class FakeSpotify:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_429: float = 0.0,
+                 sizes=DEFAULT_SIZES, fixtures_dir: Path = FIXTURES_DIR, seed: int = 7):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.sizes = tuple(sizes)
+        self.fixtures = {name: json.loads((fixtures_dir / f"{name}.json").read_text()) for name in FIXTURE_FILES}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls: Counter = Counter()
+        self.playlists = build_playlists(self.sizes)
+        self.app = self._build_app()
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ----- lifecycle -----
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = make_server(host, port, self.app, threaded=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return f"http://{host}:{self._server.server_port}/v1"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+    def reset(self) -> None:
+        """Restore playlists mutated by removals (remove-duplicates, filter sweep)."""
+        with self._lock:
+            self.playlists = build_playlists(self.sizes)
+
+    def take_calls(self) -> Counter:
+        with self._lock:
+            calls, self.calls = self.calls, Counter()
+        return calls
+
+    # ----- request handling -----
+    def _before(self) -> Optional[Response]:
+        with self._lock:
+            self.calls[f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"] += 1
+            throttle = self.rate_429 and self._rng.random() < self.rate_429
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        if delay:
+            time.sleep(delay)
+        if throttle:
+            resp = jsonify({"error": {"status": 429, "message": "API rate limit exceeded"}})
+            resp.status_code = 429
+            resp.headers["Retry-After"] = "0"
+            return resp
+        return None
+
+    @staticmethod
+    def _after(resp: Response) -> Response:
+        if request.method == "GET" and resp.status_code == 200:
+            etag = hashlib.sha1(resp.get_data()).hexdigest()
+            resp.set_etag(etag)
+            if request.if_none_match.contains(etag):
+                return Response(status=304, headers={"ETag": resp.headers["ETag"]})
+        return resp
+
+    def _playlist(self, pid: str) -> FakePlaylist:
+        pl = self.playlists.get(pid)
+        if pl is None:
+            from flask import abort
+            abort(404)
+        return pl
+
+    def _build_app(self) -> Flask:
+        app = Flask("fake_spotify")
+        app.before_request(self._before)
+        app.after_request(self._after)
+
+        def page(items: List[Any], limit: int, offset: int, total: int) -> Dict[str, Any]:
+            has_next = offset + limit < total
+            return {"items": items, "limit": limit, "offset": offset, "total": total,
+                    "next": f"{request.base_url}?offset={offset + limit}&limit={limit}" if has_next else None}
+
+        @app.get("/v1/me/")
+        @app.get("/v1/me")
+        def me():
+            return jsonify(self.fixtures["me"])
+
+        @app.get("/v1/me/top/<kind>")
+        def top(kind: str):
+            data = self.fixtures["top_artists" if kind == "artists" else "top_tracks"]
+            items = list(data.get("items") or [])
+            # One recorded page serves all ranges; rotate it so ranges differ.
+            shift = {"short_term": 0, "medium_term": 7, "long_term": 19}.get(request.args.get("time_range"), 0)
+            items = items[shift:] + items[:shift]
+            limit = request.args.get("limit", 20, type=int)
+            return jsonify(page(items[:limit], limit, 0, len(items)))
+
+        @app.get("/v1/me/player/recently-played")
+        def recently_played():
+            data = dict(self.fixtures["recently_played"])
+            items = _rebase_played_at(data.get("items") or [])
+            after = request.args.get("after", type=int)
+            if after:
+                items = [it for it in items if _iso_to_ms(it["played_at"]) > after]
+            data["items"] = items[:request.args.get("limit", 50, type=int)]
+            return jsonify(data)
+
+        @app.get("/v1/artists/")
+        @app.get("/v1/artists")
+        def artists():
+            ids = [i for i in (request.args.get("ids") or "").split(",") if i]
+            return jsonify({"artists": [synthetic_artist(int(i[3:])) if i.startswith("art") else None for i in ids]})
+
+        @app.get("/v1/tracks/")
+        @app.get("/v1/tracks")
+        def tracks():
+            ids = [i for i in (request.args.get("ids") or "").split(",") if i]
+            return jsonify({"tracks": [synthetic_track(int(i[3:])) if i.startswith("trk") else None for i in ids]})
+
+        @app.get("/v1/me/playlists")
+        def my_playlists():
+            limit = request.args.get("limit", 50, type=int)
+            offset = request.args.get("offset", 0, type=int)
+            listed = list(self.playlists.values())
+            return jsonify(page([pl.summary() for pl in listed[offset:offset + limit]], limit, offset, len(listed)))
+
+        @app.get("/v1/playlists/<pid>")
+        @app.get("/v1/playlists/<pid>/")
+        def playlist(pid: str):
+            return jsonify(self._playlist(pid).summary())
+
+        @app.get("/v1/playlists/<pid>/items")
+        @app.get("/v1/playlists/<pid>/tracks")
+        def playlist_items(pid: str):
+            pl = self._playlist(pid)
+            limit = min(request.args.get("limit", 100, type=int), 100)
+            offset = request.args.get("offset", 0, type=int)
+            chunk = pl.indices[offset:offset + limit]
+            items = [{"added_at": f"2024-01-{1 + (i % 28):02d}T00:00:00Z", "track": synthetic_track(i)} for i in chunk]
+            return jsonify(page(items, limit, offset, len(pl.indices)))
+
+        @app.delete("/v1/playlists/<pid>/items")
+        @app.delete("/v1/playlists/<pid>/tracks")
+        def remove_items(pid: str):
+            pl = self._playlist(pid)
+            body = request.get_json(force=True, silent=True) or {}
+            specs = body.get("tracks") or body.get("items") or []
+            with self._lock:
+                drop_positions: Set[int] = set()
+                drop_all: Set[int] = set()
+                for spec in specs:
+                    index = int(spec["uri"].rsplit(":", 1)[-1][3:])
+                    if spec.get("positions"):
+                        drop_positions.update(spec["positions"])
+                    else:
+                        drop_all.add(index)
+                pl.indices = [i for pos, i in enumerate(pl.indices) if pos not in drop_positions and i not in drop_all]
+                pl.version += 1
+            return jsonify({"snapshot_id": pl.snapshot_id})
+
+        @app.post("/v1/playlists/<pid>/items")
+        @app.post("/v1/playlists/<pid>/tracks")
+        def add_items(pid: str):
+            pl = self._playlist(pid)
+            body = request.get_json(force=True, silent=True) or {}
+            uris = body if isinstance(body, list) else body.get("uris") or []
+            new = [int(uri.rsplit(":", 1)[-1][3:]) for uri in uris]
+            with self._lock:
+                position = request.args.get("position", type=int)
+                if position is None:
+                    pl.indices.extend(new)
+                else:
+                    pl.indices[position:position] = new
+                pl.version += 1
+            return jsonify({"snapshot_id": pl.snapshot_id}), 201
+
+        @app.put("/v1/playlists/<pid>/items")
+        @app.put("/v1/playlists/<pid>/tracks")
+        def reorder_items(pid: str):
+            pl = self._playlist(pid)
+            body = request.get_json(force=True, silent=True) or {}
+            with self._lock:
+                start = int(body.get("range_start", 0))
+                length = int(body.get("range_length", 1))
+                before = int(body.get("insert_before", 0))
+                block = pl.indices[start:start + length]
+                del pl.indices[start:start + length]
+                at = before - length if before > start else before
+                pl.indices[at:at] = block
+                pl.version += 1
+            return jsonify({"snapshot_id": pl.snapshot_id})
+
+        @app.post("/v1/users/<user_id>/playlists")
+        @app.post("/v1/me/playlists")
+        def create_playlist(user_id: str = BENCH_USER_ID):
+            body = request.get_json(force=True, silent=True) or {}
+            with self._lock:
+                pid = f"bnchN{len(self.playlists):017d}"
+                self.playlists[pid] = FakePlaylist(pid, body.get("name") or "New playlist", [])
+            return jsonify(self.playlists[pid].summary()), 201
+
+        @app.get("/__stats")
+        def stats():
+            return jsonify(dict(self.calls))
+
+        return app
+
+
+# ---------- Fixtures ----------
+def record_fixtures(access_token: str, out_dir: Path = FIXTURES_DIR) -> None:
+    """Capture real responses for the profile endpoints (user id, name and images anonymized)."""
+    import spotipy
+
+    sp = spotipy.Spotify(auth=access_token)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    me = sp.me() or {}
+    me.update({"id": BENCH_USER_ID, "display_name": "Bench User", "email": None, "images": []})
+    recorded = {
+        "me": me,
+        "top_artists": sp.current_user_top_artists(limit=50, time_range="medium_term"),
+        "top_tracks": sp.current_user_top_tracks(limit=50, time_range="medium_term"),
+        "recently_played": sp.current_user_recently_played(limit=50),
+    }
+    for name, data in recorded.items():
+        (out_dir / f"{name}.json").write_text(json.dumps(data, indent=1))
+
+
+def write_synthetic_fixtures(out_dir: Path = FIXTURES_DIR) -> None:
+    """Write fixtures in the recorded format from the synthetic catalog (used when no recording is available)."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    fixtures = {
+        "me": {"id": BENCH_USER_ID, "display_name": "Bench User", "images": [], "type": "user",
+               "uri": f"spotify:user:{BENCH_USER_ID}"},
+        "top_artists": {"items": [synthetic_artist(i * 37) for i in range(50)], "total": 50, "limit": 50, "offset": 0},
+        "top_tracks": {"items": [synthetic_track(i * 101) for i in range(50)], "total": 50, "limit": 50, "offset": 0},
+        "recently_played": {"items": [
+            {"track": synthetic_track(i * 13), "played_at": f"2025-01-01T{i // 4 % 24:02d}:{i * 7 % 60:02d}:00.000Z"}
+            for i in range(50)
+        ], "limit": 50},
+    }
+    for name, data in fixtures.items():
+        (out_dir / f"{name}.json").write_text(json.dumps(data, indent=1))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--latency-ms", type=float, default=50)
+    serve.add_argument("--jitter-ms", type=float, default=10)
+    serve.add_argument("--rate-429", type=float, default=0.0)
+    serve.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES))
+    record = sub.add_parser("record")
+    record.add_argument("--token", required=True)
+    sub.add_parser("synthesize")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_fixtures(args.token)
+    elif args.command == "synthesize":
+        write_synthetic_fixtures()
+    else:
+        fake = FakeSpotify(args.latency_ms, args.jitter_ms, args.rate_429, [int(s) for s in args.sizes.split(",")])
+        print(f"Fake Spotify listening at {fake.start(port=args.port)}")
+        threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""Cross-user cache for Spotify catalog metadata (artists, albums, top tracks, search results).
+
+Catalog objects are the same for every user, so they are cached by kind + Spotify id and shared:
+
+  1. in-process LRU       - per worker, no serialization
+  2. local SQLite file    - shared by every worker on the host (ORPHEUS_DATA_DIR/catalog.sqlite3)
+  3. Redis (optional)     - shared by every host when ORPHEUS_REDIS_URL is set
+
+Reads fall through the tiers and promote hits upwards; writes go to every tier. Concurrent misses
+for the same key inside a worker are coalesced so only one upstream fetch runs.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from instrumentation import record_cache
+from utils import data_dir, getenv_stripped
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is fine for cache bodies
+    orjson = None
+
+try:
+    import redis
+except ImportError:  # optional: the Redis tier is simply skipped
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# ---------- Constants ----------
+# Freshness per kind, in seconds. Unknown kinds use _DEFAULT_TTL.
+CATALOG_TTLS: Dict[str, int] = {
+    "artist": 6 * 3600,
+    "artist_top_tracks": 6 * 3600,
+    "artist_albums": 86400,
+    "artist_page": 1800,
+    "album_page": 86400,
+    "search": 600,
+    "track": 86400,
+    "missing_track": 3600,      # negative seed-validation results (seed_validation.py)
+    "missing_artist": 3600,
+}
+_DEFAULT_TTL = 3600
+_L1_MAX = int(getenv_stripped("ORPHEUS_CATALOG_L1_MAX") or 20_000)
+_REDIS_URL = getenv_stripped("ORPHEUS_REDIS_URL")
+_REDIS_PREFIX = "orpheus:catalog:"
+_REDIS_RETRY_S = 30
+_PURGE_EVERY = 500
+_FLIGHT_WAIT_S = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog (
+    key  TEXT PRIMARY KEY,   -- "<kind>:<id>"
+    ts   REAL NOT NULL,
+    body BLOB NOT NULL       -- JSON
+) WITHOUT ROWID;
+"""
+
+
+def _dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(body: bytes) -> Any:
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+class _Flight:
+    __slots__ = ("event", "entry", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+class CatalogCache:
+    """Tiered read-through cache of {"ts", "data"} entries keyed by (kind, id)."""
+
+    def __init__(self, path=None, redis_url: Optional[str] = _REDIS_URL, l1_max: int = _L1_MAX):
+        self.l1_max = l1_max
+        self._l1: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Flight] = {}
+        self._puts = 0
+
+        self.path = path or data_dir() / "catalog.sqlite3"
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._db_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+        self._redis = None
+        self._redis_down_until = 0.0
+        if redis_url and redis is not None:
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        elif redis_url:
+            logger.warning("ORPHEUS_REDIS_URL is set but the redis package is not installed")
+
+    # ---------- Lookups ----------
+    @staticmethod
+    def ttl(kind: str) -> int:
+        return CATALOG_TTLS.get(kind, _DEFAULT_TTL)
+
+    def get_entry(self, kind: str, item_id: str) -> Optional[Dict[str, Any]]:
+        """Fresh {"ts", "data"} entry from the nearest tier, or None."""
+        return self.get_entries(kind, [item_id]).get(item_id)
+
+    def get(self, kind: str, item_id: str) -> Any:
+        entry = self.get_entry(kind, item_id)
+        return entry["data"] if entry else None
+
+    def get_entries(self, kind: str, item_ids: Iterable[str], record: bool = True) -> Dict[str, Dict[str, Any]]:
+        ids = [i for i in dict.fromkeys(item_ids) if i]
+        cutoff = time.time() - self.ttl(kind)
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for item_id in ids:
+                entry = self._l1.get(f"{kind}:{item_id}")
+                if entry is not None and entry["ts"] >= cutoff:
+                    self._l1.move_to_end(f"{kind}:{item_id}")
+                    found[item_id] = entry
+
+        missing = [i for i in ids if i not in found]
+        if missing:
+            for item_id, entry in self._sqlite_get(kind, missing, cutoff).items():
+                found[item_id] = self._promote(kind, item_id, entry)
+            missing = [i for i in missing if i not in found]
+        if missing:
+            for item_id, entry in self._redis_get(kind, missing, cutoff).items():
+                found[item_id] = self._promote(kind, item_id, entry)
+                self._sqlite_put(kind, {item_id: entry})
+
+        if record:
+            for item_id in ids:
+                record_cache(f"catalog.{kind}", item_id in found)
+        return found
+
+    def get_many(self, kind: str, item_ids: Iterable[str], record: bool = True) -> Dict[str, Any]:
+        return {i: e["data"] for i, e in self.get_entries(kind, item_ids, record).items()}
+
+    # ---------- Writes ----------
+    def put(self, kind: str, item_id: str, data: Any) -> Dict[str, Any]:
+        return self.put_many(kind, {item_id: data})[item_id]
+
+    def put_many(self, kind: str, items: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        entries = {i: {"ts": now, "data": data} for i, data in items.items() if i and data is not None}
+        if not entries:
+            return {}
+        for item_id, entry in entries.items():
+            self._promote(kind, item_id, entry)
+        self._sqlite_put(kind, entries)
+        self._redis_put(kind, entries)
+        return entries
+
+    def get_or_fetch(self, kind: str, item_id: str, fetch: Callable[[], Any]) -> Optional[Dict[str, Any]]:
+        """Entry for (kind, id), calling fetch() on a miss; concurrent misses share one fetch.
+
+        fetch() returning None is not cached. Exceptions propagate to every waiter.
+        """
+        entry = self.get_entry(kind, item_id)
+        if entry is not None:
+            return entry
+
+        key = f"{kind}:{item_id}"
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            if flight.event.wait(_FLIGHT_WAIT_S):
+                if flight.error is not None:
+                    raise flight.error
+                if flight.entry is not None:
+                    return flight.entry
+            data = fetch()
+            return self.put(kind, item_id, data) if data is not None else None
+
+        try:
+            data = fetch()
+            flight.entry = self.put(kind, item_id, data) if data is not None else None
+            return flight.entry
+        except BaseException as err:
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def invalidate(self, kind: str, item_id: str) -> None:
+        key = f"{kind}:{item_id}"
+        with self._lock:
+            self._l1.pop(key, None)
+        with self._db_lock, self._conn:
+            self._conn.execute("DELETE FROM catalog WHERE key = ?", (key,))
+        if self._redis_available():
+            try:
+                self._redis.delete(_REDIS_PREFIX + key)
+            except redis.RedisError:
+                self._redis_failed()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            l1 = len(self._l1)
+        with self._db_lock:
+            l2 = self._conn.execute("SELECT COUNT(*) FROM catalog").fetchone()[0]
+        return {"memory_entries": l1, "sqlite_entries": l2,
+                "redis": "disabled" if self._redis is None else ("up" if self._redis_available() else "down")}
+
+    # ---------- Tiers ----------
+    def _promote(self, kind: str, item_id: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._l1[f"{kind}:{item_id}"] = entry
+            self._l1.move_to_end(f"{kind}:{item_id}")
+            while len(self._l1) > self.l1_max:
+                self._l1.popitem(last=False)
+        return entry
+
+    def _sqlite_get(self, kind: str, ids: List[str], cutoff: float) -> Dict[str, Dict[str, Any]]:
+        keys = [f"{kind}:{i}" for i in ids]
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._db_lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, ts, body FROM catalog WHERE key IN ({','.join('?' * len(batch))}) AND ts >= ?",
+                    (*batch, cutoff)).fetchall()
+                for key, ts, body in rows:
+                    found[key.split(":", 1)[1]] = {"ts": ts, "data": _loads(body)}
+        return found
+
+    def _sqlite_put(self, kind: str, entries: Dict[str, Dict[str, Any]]) -> None:
+        rows = [(f"{kind}:{i}", e["ts"], _dumps(e["data"])) for i, e in entries.items()]
+        with self._db_lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO catalog VALUES (?, ?, ?)", rows)
+            self._puts += len(rows)
+            if self._puts >= _PURGE_EVERY:
+                self._puts = 0
+                oldest = time.time() - max([_DEFAULT_TTL, *CATALOG_TTLS.values()])
+                self._conn.execute("DELETE FROM catalog WHERE ts < ?", (oldest,))
+
+    def _redis_available(self) -> bool:
+        return self._redis is not None and time.time() >= self._redis_down_until
+
+    def _redis_failed(self) -> None:
+        logger.warning("Redis catalog tier unavailable; retrying in %ss", _REDIS_RETRY_S)
+        self._redis_down_until = time.time() + _REDIS_RETRY_S
+
+    def _redis_get(self, kind: str, ids: List[str], cutoff: float) -> Dict[str, Dict[str, Any]]:
+        if not self._redis_available():
+            return {}
+        try:
+            values = self._redis.mget([f"{_REDIS_PREFIX}{kind}:{i}" for i in ids])
+        except redis.RedisError:
+            self._redis_failed()
+            return {}
+        found: Dict[str, Dict[str, Any]] = {}
+        for item_id, value in zip(ids, values):
+            if value:
+                entry = _loads(value)
+                if entry.get("ts", 0) >= cutoff:
+                    found[item_id] = entry
+        return found
+
+    def _redis_put(self, kind: str, entries: Dict[str, Dict[str, Any]]) -> None:
+        if not self._redis_available():
+            return
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            for item_id, entry in entries.items():
+                pipe.set(f"{_REDIS_PREFIX}{kind}:{item_id}", _dumps(entry), ex=self.ttl(kind))
+            pipe.execute()
+        except redis.RedisError:
+            self._redis_failed()
+
+
+_catalog: Optional[CatalogCache] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> CatalogCache:
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = CatalogCache()
+        return _catalog
@@ -13,14 +13,21 @@ function App() {
   const [statsData, setStatsData] = useState(null)
 
   useEffect(() => {
-    // Check authentication status by trying to fetch user stats
-    fetch('/api/user-stats')
+    // Check authentication status by fetching the dashboard's default range first;
+    // the remaining ranges load in the background from the same server-side cache.
+    fetch('/api/user-stats?range=long_term')
       .then(res => res.json())
       .then(data => {
         if (data.ok) {
           setIsAuthenticated(true)
           setStatsData(data) // Cache the stats data
           setUser(data.user || null)
+          fetch('/api/user-stats')
+            .then(res => res.json())
+            .then(full => {
+              if (full.ok) setStatsData(full)
+            })
+            .catch(() => {})
         } else {
           setIsAuthenticated(false)
         }
@@ -1,6 +1,8 @@
 import AnimatedList from '../ui/AnimatedList'
 
-function RecentlyPlayed({ tracks, recentMinutes, compact }) {
+function RecentlyPlayed({ tracks, recentMinutes, recentMinutesLabel, compact }) {
+  const minutesText = recentMinutesLabel ? `${recentMinutes} min · ${recentMinutesLabel}` : `${recentMinutes} min`
+
   const previewTracks = tracks.slice(0, compact ? 30 : 40)
 
   const renderCompactItem = (track) => (
@@ -47,7 +49,7 @@ function RecentlyPlayed({ tracks, recentMinutes, compact }) {
             <p className="feature-label m-0">Recently Played</p>
           </div>
           {recentMinutes && (
-            <span className="text-[12px] text-gray-400">{recentMinutes} min</span>
+            <span className="text-[12px] text-gray-400">{minutesText}</span>
           )}
         </div>
         <div className="card-content -mt-2 pb-2 -mx-2">
@@ -74,7 +76,7 @@ function RecentlyPlayed({ tracks, recentMinutes, compact }) {
       <div className="flex items-center justify-between mb-3">
         <h3 className="text-lg font-semibold m-0">Recently Played</h3>
         {recentMinutes && (
-          <span className="text-base text-gray-400">{recentMinutes} min</span>
+          <span className="text-base text-gray-400">{minutesText}</span>
         )}
       </div>
 
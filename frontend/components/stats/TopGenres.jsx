@@ -107,7 +107,9 @@ function TopGenres({ genresData, activeSource, activeRange, rangeOptions, rangeL
 
   const sourceData = genresData[activeSource] || {}
   const rawGenres = sourceData[activeRange] || []
-  const genres = groupByParentGenre(rawGenres)
+  // Server-side rollup through the genre taxonomy; older payloads fall back to last-word grouping
+  const parentGenres = genresData.parents?.[activeSource]?.[activeRange]
+  const genres = parentGenres || groupByParentGenre(rawGenres)
   const displayGenres = compact ? genres.slice(0, 5) : genres
 
   if (compact) {
@@ -1,7 +1,9 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import AlbumPreviewOverlay from '../overlays/AlbumPreviewOverlay'
 
 const SPOTLIGHT_STORAGE_KEY = 'orpheus_spotlight_selection'
+const SEARCH_DEBOUNCE_MS = 200
+const SEARCH_LIMIT = 5
 
 function SpotlightCard({ fallbackTrack, trackRangeLabel }) {
   const [spotlightItem, setSpotlightItem] = useState(null)
@@ -11,6 +13,8 @@ function SpotlightCard({ fallbackTrack, trackRangeLabel }) {
   const [spotlightEditing, setSpotlightEditing] = useState(false)
   const [spotlightSearchType, setSpotlightSearchType] = useState('album')
   const [previewTrack, setPreviewTrack] = useState(null)
+  const searchTimer = useRef(null)
+  const searchSeq = useRef(0)
 
   const normalizeSpotlightItem = (item) => {
     if (!item) return null
@@ -67,25 +71,54 @@ function SpotlightCard({ fallbackTrack, trackRangeLabel }) {
   }, [spotlightEditing, spotlightSearchType])
 
   const searchSpotlight = async (query) => {
+    // Only the latest query may update results; slower earlier responses are dropped
+    const seq = ++searchSeq.current
     if (!query.trim()) {
       setSpotlightResults([])
+      setSearchingSpotlight(false)
       return
     }
     setSearchingSpotlight(true)
     try {
       const typeParam = spotlightSearchType === 'track' ? 'track' : 'album'
-      const res = await fetch(`/api/search?q=${encodeURIComponent(query)}&type=${typeParam}&limit=5`)
-      const data = await res.json()
-      if (data.ok) {
-        setSpotlightResults(data.results || [])
+      const url = `/api/search?q=${encodeURIComponent(query)}&type=${typeParam}&limit=${SEARCH_LIMIT}`
+      // The user's own playlists answer from the server's local index and Spotify fills the gaps.
+      // Both requests start together; library results show first and catalog ones are appended.
+      const catalogAbort = new AbortController()
+      const results = (request) => request
+        .then(res => res.json())
+        .then(data => (data.ok ? data.results || [] : []))
+        .catch(err => {
+          if (err.name !== 'AbortError') console.error('Search error:', err)
+          return []
+        })
+      const libraryRequest = results(fetch(`${url}&scope=library`))
+      const catalogRequest = results(fetch(url, { signal: catalogAbort.signal }))
+      const own = await libraryRequest
+      if (seq !== searchSeq.current || own.length >= SEARCH_LIMIT) catalogAbort.abort()
+      if (seq !== searchSeq.current) return
+      setSpotlightResults(own)
+      if (own.length >= SEARCH_LIMIT) return
+      const catalog = await catalogRequest
+      if (seq === searchSeq.current) {
+        const ownIds = new Set(own.map(item => item.id))
+        const extra = catalog.filter(item => !ownIds.has(item.id))
+        setSpotlightResults([...own, ...extra].slice(0, SEARCH_LIMIT))
       }
     } catch (err) {
       console.error('Search error:', err)
     } finally {
-      setSearchingSpotlight(false)
+      if (seq === searchSeq.current) setSearchingSpotlight(false)
     }
   }
 
+  const scheduleSearch = (query) => {
+    clearTimeout(searchTimer.current)
+    searchTimer.current = setTimeout(() => searchSpotlight(query), SEARCH_DEBOUNCE_MS)
+  }
+
+  useEffect(() => () => clearTimeout(searchTimer.current), [])
+
   const selectSpotlightItem = (item) => {
     const normalized = normalizeSpotlightItem(item)
     if (!normalized) return
@@ -187,7 +220,7 @@ function SpotlightCard({ fallbackTrack, trackRangeLabel }) {
               value={spotlightSearch}
               onChange={(e) => {
                 setSpotlightSearch(e.target.value)
-                searchSpotlight(e.target.value)
+                scheduleSearch(e.target.value)
               }}
             />
             {searchingSpotlight && <span className="spotlight-loading">Searching...</span>}
@@ -17,11 +17,13 @@ export function usePlaylists(options = {}) {
   const [error, setError] = useState(null)
   const [hasMore, setHasMore] = useState(false)
   const offsetRef = useRef(0)
+  const cursorRef = useRef(null)
 
   const fetchPlaylists = useCallback(async ({ append = false } = {}) => {
     const targetOffset = paginated ? (append ? offsetRef.current : 0) : 0
     if (!append) {
       offsetRef.current = targetOffset
+      cursorRef.current = null
       setLoading(true)
     } else {
       setLoadingMore(true)
@@ -31,7 +33,11 @@ export function usePlaylists(options = {}) {
       const params = new URLSearchParams()
       if (paginated) {
         params.set('limit', String(pageSize))
-        params.set('offset', String(targetOffset))
+        if (append && cursorRef.current) {
+          params.set('cursor', cursorRef.current)
+        } else {
+          params.set('offset', String(targetOffset))
+        }
         if (ownedOnly) {
           params.set('owned_only', 'true')
         }
@@ -59,12 +65,14 @@ export function usePlaylists(options = {}) {
 
       if (paginated) {
         setHasMore(Boolean(data.has_more))
+        cursorRef.current = data.next_cursor || null
         offsetRef.current = typeof data.next_offset === 'number'
           ? data.next_offset
           : targetOffset + pageSize
       } else {
         setHasMore(false)
         offsetRef.current = 0
+        cursorRef.current = null
       }
 
       setError(null)
@@ -28,7 +28,8 @@ function Dashboard({ initialData }) {
 
   useEffect(() => {
     if (initialData) {
-      // Use cached data and set up range options
+      // Use cached data and set up range options (App swaps the single-range payload for the full one)
+      setStatsData(initialData)
       const availableRanges = Object.keys(initialData.top_artists || {})
       if (availableRanges.length > 0) {
         setRangeOptions(availableRanges)
@@ -209,6 +210,7 @@ function Dashboard({ initialData }) {
           <RecentlyPlayed
             tracks={statsData?.recently_played || []}
             recentMinutes={statsData?.recent_minutes_listened}
+            recentMinutesLabel={statsData?.recent_minutes_label}
             compact
           />
         </section>
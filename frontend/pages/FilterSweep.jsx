@@ -240,8 +240,8 @@ function FilterSweep() {
                             disabled={playlistsLoading}
                           >
                             <div className="w-14 h-14 rounded-lg overflow-hidden bg-white/10 flex-shrink-0">
-                              {playlist.images?.[0]?.url ? (
-                                <img src={playlist.images[0].url} alt={playlist.name} className="w-full h-full object-cover" />
+                              {playlist.image ? (
+                                <img src={playlist.image} alt={playlist.name} className="w-full h-full object-cover" />
                               ) : (
                                 <div className="w-full h-full flex items-center justify-center text-[10px] uppercase tracking-[0.2em] text-white/40">cover</div>
                               )}
@@ -345,8 +345,8 @@ function FilterSweep() {
                         disabled={playlistsLoading}
                       />
                       <div className="w-12 h-12 rounded-lg overflow-hidden bg-white/10 flex-shrink-0">
-                        {playlist.images?.[0]?.url ? (
-                          <img src={playlist.images[0].url} alt={playlist.name} className="w-full h-full object-cover" />
+                        {playlist.image ? (
+                          <img src={playlist.image} alt={playlist.name} className="w-full h-full object-cover" />
                         ) : (
                           <div className="w-full h-full flex items-center justify-center text-[10px] uppercase tracking-[0.2em] text-white/40">
                             cover
@@ -133,7 +133,7 @@ function ViewPlaylists() {
         name: activePlaylist.name,
         owner: activePlaylist.owner?.display_name || activePlaylist.owner?.id || 'Unknown',
         total: activePlaylist.tracks?.total ?? activePlaylist.trackCount ?? 0,
-        image: activePlaylist.images?.[0]?.url,
+        image: activePlaylist.image,
         url: activePlaylist.external_urls?.spotify
       }
     : null
@@ -264,9 +264,9 @@ function ViewPlaylists() {
                           background: '#2a2a2a'
                         }}
                       >
-                        {playlist.images?.[0]?.url ? (
+                        {playlist.image ? (
                           <img
-                            src={playlist.images[0].url}
+                            src={playlist.image}
                             alt={playlist.name}
                             style={{
                               width: '100%',
@@ -342,9 +342,9 @@ function ViewPlaylists() {
                           background: '#2a2a2a'
                         }}
                       >
-                        {playlist.images?.[0]?.url ? (
+                        {playlist.image ? (
                           <img
-                            src={playlist.images[0].url}
+                            src={playlist.image}
                             alt={playlist.name}
                             style={{
                               width: '100%',
@@ -0,0 +1,310 @@
+"""Parent-genre taxonomy for Spotify's micro-genres.
+
+Spotify tags artists with thousands of micro-genres ("melodic drill", "deep tech house"). The
+dashboard groups them under parent genres, which used to be guessed in the browser from the last
+word of the name. Here each genre is resolved once against a small curated vocabulary
+(_VOCABULARY: node, parent node, aliases): the rightmost vocabulary phrase in the name is its
+head ("indie rock" -> rock, "trap latino" -> latin), and unknown names fall back to their last
+word as before.
+
+Resolved genres are compiled into a flat binary index (interned UTF-8 string table, sorted-id
+table for binary search and two int32 columns: group id and parent id) that is memory-mapped on
+startup, so workers share the pages and nothing is parsed at import time. Genres missing from the
+index are resolved on first sight and memoized per process; `python genre_taxonomy.py build`
+recompiles the index with every genre seen in the listening history.
+"""
+import argparse
+import bisect
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils import data_dir, getenv_stripped
+
+logger = logging.getLogger(__name__)
+
+# ---------- Vocabulary ----------
+# (node, parent node or None, aliases). Aliases resolve to their node; node names match themselves.
+_VOCABULARY: Tuple[Tuple[str, Optional[str], Tuple[str, ...]], ...] = (
+    ("rock", None, ("grunge", "shoegaze", "britpop", "post-rock", "math rock", "stoner")),
+    ("indie", "rock", ()),
+    ("alternative", "rock", ("alt",)),
+    ("emo", "rock", ("midwest emo",)),
+    ("punk", "rock", ("hardcore", "post-punk", "pop punk", "oi")),
+    ("metal", None, ("metalcore", "deathcore", "djent", "doom", "sludge", "nu metal", "grindcore")),
+    ("pop", None, ("synthpop", "electropop", "hyperpop", "dance pop", "k-pop", "j-pop", "c-pop", "afropop")),
+    ("hip hop", None, ("hip-hop", "boom bap", "crunk", "phonk", "hyphy", "horrorcore")),
+    ("rap", "hip hop", ()),
+    ("trap", "hip hop", ()),
+    ("drill", "hip hop", ()),
+    ("grime", "hip hop", ()),
+    ("r&b", None, ("rnb", "r and b", "new jack swing")),
+    ("soul", None, ("neo soul", "motown")),
+    ("funk", None, ("funk carioca", "boogie", "g-funk")),
+    ("disco", "funk", ("nu disco", "italo disco")),
+    ("jazz", None, ("bebop", "swing", "big band", "bossa nova", "fusion")),
+    ("blues", None, ()),
+    ("electronic", None, ("edm", "electronica", "electro", "idm", "breakbeat", "big beat", "glitch")),
+    ("house", "electronic", ("garage", "uk garage", "2-step")),
+    ("techno", "electronic", ("minimal", "acid")),
+    ("trance", "electronic", ("psytrance", "goa")),
+    ("drum and bass", "electronic", ("dnb", "drum n bass", "jungle", "liquid funk", "neurofunk")),
+    ("dubstep", "electronic", ("brostep", "riddim", "bass music")),
+    ("hardstyle", "electronic", ("gabber", "hardcore techno", "frenchcore")),
+    ("synthwave", "electronic", ("retrowave", "outrun", "darksynth", "vaporwave")),
+    ("ambient", "electronic", ("drone", "new age", "dark ambient")),
+    ("downtempo", "electronic", ("trip hop", "chillout", "chillwave", "lo-fi", "lofi")),
+    ("country", None, ("bluegrass", "honky tonk", "outlaw country")),
+    ("folk", None, ("singer-songwriter", "americana", "folk rock")),
+    ("classical", None, ("baroque", "opera", "choral", "orchestra", "chamber", "romantic era")),
+    ("soundtrack", None, ("score", "video game music", "anime", "musicals", "show tunes")),
+    ("latin", None, ("latino", "reggaeton", "salsa", "bachata", "cumbia", "urbano latino", "corridos",
+                     "mariachi", "banda", "norteno", "dembow")),
+    ("reggae", None, ("dancehall", "dub", "ska", "rocksteady")),
+    ("afrobeats", None, ("afrobeat", "amapiano", "afro house", "highlife", "afroswing")),
+    ("gospel", None, ("worship", "ccm", "christian")),
+    ("world", None, ("bollywood", "flamenco", "fado", "mpb", "samba", "forro", "sertanejo")),
+)
+
+_TOKEN_RE = re.compile(r"[a-z0-9&]+")
+_MAX_PHRASE = 3
+_MAGIC = b"OGTX"
+_HEADER = struct.Struct("<4sI20sI")   # magic, version, vocabulary digest, string count
+_VERSION = 1
+_MEMO_MAX = 50_000
+_SUBGENRES_SHOWN = 10
+_INDEX_PATH = getenv_stripped("ORPHEUS_GENRE_INDEX")
+
+
+def _vocabulary_digest() -> bytes:
+    return hashlib.sha1(repr(_VOCABULARY).encode("utf-8")).digest()
+
+
+def _phrases() -> Dict[Tuple[str, ...], str]:
+    phrases: Dict[Tuple[str, ...], str] = {}
+    for node, _parent, aliases in _VOCABULARY:
+        for phrase in (node, *aliases):
+            phrases[tuple(_TOKEN_RE.findall(phrase))] = node
+    return phrases
+
+
+_PHRASES = _phrases()
+_NODE_PARENT: Dict[str, Optional[str]] = {node: parent for node, parent, _ in _VOCABULARY}
+
+
+def resolve(genre: str) -> str:
+    """Group (parent) genre for a raw genre name, by its rightmost vocabulary phrase."""
+    tokens = _TOKEN_RE.findall((genre or "").lower())
+    if not tokens:
+        return "unknown"
+    for end in range(len(tokens), 0, -1):
+        for size in range(min(_MAX_PHRASE, end), 0, -1):
+            node = _PHRASES.get(tuple(tokens[end - size:end]))
+            if node:
+                return node
+    return tokens[-1]
+
+
+# ---------- Compiled index ----------
+def compile_index(genres: Iterable[str], path: Path) -> int:
+    """Write the binary index for the vocabulary plus `genres`; returns the string count."""
+    names = {node for node, _, _ in _VOCABULARY}
+    for node, _, aliases in _VOCABULARY:
+        names.update(aliases)
+    names.update(g.strip().lower() for g in genres if g and g.strip())
+    groups = {name: resolve(name) for name in names}
+    names.update(groups.values())
+
+    strings = sorted(names, key=lambda s: s.encode("utf-8"))   # id order == byte order
+    ids = {s: i for i, s in enumerate(strings)}
+    blob = bytearray()
+    offsets = [0]
+    for s in strings:
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+    group_col = [ids[groups.get(s, s)] for s in strings]
+    parent_col = [ids[_NODE_PARENT[s]] if _NODE_PARENT.get(s) else -1 for s in strings]
+
+    n = len(strings)
+    # A unique temp file per writer: workers compiling at the same time never share a half-written file.
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-" + path.name)
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(_HEADER.pack(_MAGIC, _VERSION, _vocabulary_digest(), n))
+        fh.write(struct.pack(f"<{n + 1}I", *offsets))
+        fh.write(struct.pack(f"<{n}i", *group_col))
+        fh.write(struct.pack(f"<{n}i", *parent_col))
+        fh.write(bytes(blob))
+    os.replace(tmp, path)
+    return n
+
+
+class GenreTaxonomy:
+    """Memory-mapped genre index with a per-process memo for genres compiled after it."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._memo: Dict[str, Tuple[str, Tuple[str, ...]]] = {}
+        self._lock = threading.Lock()
+        self._map: Optional[mmap.mmap] = None
+        self._count = 0
+        self._open()
+
+    def _open(self) -> None:
+        try:
+            with open(self.path, "rb") as fh:
+                mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        try:
+            magic, version, digest, n = _HEADER.unpack_from(mapped, 0)
+        except struct.error:
+            magic = version = digest = n = None
+        if magic != _MAGIC or version != _VERSION or digest != _vocabulary_digest():
+            mapped.close()
+            return
+        view = memoryview(mapped)
+        base = _HEADER.size
+        self._offsets = view[base:base + 4 * (n + 1)].cast("I")
+        base += 4 * (n + 1)
+        self._group = view[base:base + 4 * n].cast("i")
+        base += 4 * n
+        self._parent = view[base:base + 4 * n].cast("i")
+        base += 4 * n
+        self._blob = view[base:]
+        self._map = mapped
+        self._count = n
+
+    @property
+    def loaded(self) -> bool:
+        return self._map is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _string(self, sid: int) -> str:
+        return bytes(self._blob[self._offsets[sid]:self._offsets[sid + 1]]).decode("utf-8")
+
+    def _find(self, name: str) -> int:
+        key = name.encode("utf-8")
+        blob, offsets = self._blob, self._offsets
+        pos = bisect.bisect_left(range(self._count), key,
+                                 key=lambda i: bytes(blob[offsets[i]:offsets[i + 1]]))
+        if pos < self._count and bytes(blob[offsets[pos]:offsets[pos + 1]]) == key:
+            return pos
+        return -1
+
+    def lineage(self, genre: str) -> Tuple[str, Tuple[str, ...]]:
+        """(group, ancestors of the group) for a raw genre name, e.g. ("house", ("electronic",))."""
+        name = (genre or "").strip().lower()
+        hit = self._memo.get(name)
+        if hit is not None:
+            return hit
+        sid = self._find(name) if self._count else -1
+        if sid >= 0:
+            gid = self._group[sid]
+            ancestors: List[str] = []
+            pid = self._parent[gid]
+            while pid >= 0 and len(ancestors) < 8:
+                ancestors.append(self._string(pid))
+                pid = self._parent[pid]
+            result = (self._string(gid), tuple(ancestors))
+        else:
+            group = resolve(name)
+            ancestors = []
+            parent = _NODE_PARENT.get(group)
+            while parent and len(ancestors) < 8:
+                ancestors.append(parent)
+                parent = _NODE_PARENT.get(parent)
+            result = (group, tuple(ancestors))
+        with self._lock:
+            if len(self._memo) >= _MEMO_MAX:
+                self._memo.clear()
+            self._memo[name] = result
+        return result
+
+    def group_of(self, genre: str) -> str:
+        return self.lineage(genre)[0]
+
+
+def index_path() -> Path:
+    return Path(_INDEX_PATH) if _INDEX_PATH else data_dir() / "genre_taxonomy.idx"
+
+
+_taxonomy: Optional[GenreTaxonomy] = None
+_taxonomy_lock = threading.Lock()
+
+
+def get_taxonomy() -> GenreTaxonomy:
+    """Process-wide taxonomy; compiles the vocabulary-only index on first use if none exists."""
+    global _taxonomy
+    with _taxonomy_lock:
+        if _taxonomy is None:
+            path = index_path()
+            taxonomy = GenreTaxonomy(path)
+            if not taxonomy.loaded:
+                try:
+                    compile_index([], path)
+                    taxonomy = GenreTaxonomy(path)
+                except OSError:
+                    logger.exception("Could not write genre index %s; resolving genres in memory", path)
+            _taxonomy = taxonomy
+        return _taxonomy
+
+
+def group_counts(genre_names: Sequence[str], counts: Sequence[int], order: Sequence[int],
+                 limit: int = 10) -> List[dict]:
+    """Roll per-genre counts up to their parent groups.
+
+    Shape matches the dashboard's Top Genres card: {genre, family, percentage, subgenreCount,
+    subgenres: [{name, percentage}]} sorted by share, listing each group's largest subgenres.
+    """
+    taxonomy = get_taxonomy()
+    total = sum(counts[gid] for gid in order)
+    if not total:
+        return []
+    grouped: Dict[str, dict] = {}
+    for gid in sorted(order, key=lambda g: -counts[g]):
+        group, ancestors = taxonomy.lineage(genre_names[gid])
+        entry = grouped.get(group)
+        if entry is None:
+            entry = grouped[group] = {"genre": group.title(), "family": (ancestors[-1] if ancestors else group).title(),
+                                      "count": 0, "subgenres": []}
+        entry["count"] += counts[gid]
+        entry["subgenreCount"] = entry.get("subgenreCount", 0) + 1
+        if len(entry["subgenres"]) < _SUBGENRES_SHOWN:
+            entry["subgenres"].append({"name": genre_names[gid].title(),
+                                       "percentage": round(counts[gid] / total * 100, 1)})
+    ranked = sorted(grouped.values(), key=lambda e: -e["count"])[:limit]
+    for entry in ranked:
+        entry["percentage"] = round(entry["count"] / total * 100, 1)
+    return ranked
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compile the parent-genre index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="compile vocabulary + known genres into the index")
+    build.add_argument("--genres", type=Path, help="extra newline-separated genre names")
+    build.add_argument("--no-history", action="store_true", help="skip genres from the listening history")
+    args = parser.parse_args(argv)
+
+    genres: List[str] = []
+    if args.genres:
+        genres.extend(line.strip() for line in args.genres.read_text().splitlines())
+    if not args.no_history:
+        from listening_history import get_store
+        genres.extend(get_store().genres())
+    path = index_path()
+    n = compile_index(genres, path)
+    print(f"Wrote {path} ({n} strings, {path.stat().st_size} bytes)")
+
+
+if __name__ == "__main__":
+    main()
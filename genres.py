@@ -0,0 +1,192 @@
+"""Artist genre cache and single-pass genre aggregation.
+
+Artist genres are public catalog data that change rarely, so they are cached process-wide for every
+user with a long TTL instead of being re-fetched from /artists on each stats rebuild.
+
+GenreMatrix interns genre strings to integer ids and stores the artist x genre relation as a CSR
+sparse matrix (sparse.CSR, the same helper the recommender builds on). Aggregating any number of
+"weighted artist lists" (ranges of top artists, ranges of top tracks, ...) is then one gather of
+the listed rows and one bincount per list, with no per-range string handling.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from genre_taxonomy import group_counts
+from instrumentation import record_cache
+from sparse import CSR
+from utils import getenv_stripped
+
+# ---------- Constants ----------
+_GENRE_TTL_S = int(getenv_stripped("ORPHEUS_GENRE_CACHE_TTL_S") or 7 * 86400)
+_GENRE_CACHE_MAX = int(getenv_stripped("ORPHEUS_GENRE_CACHE_MAX") or 200_000)
+
+
+# ---------- Artist -> genres cache ----------
+class ArtistGenreCache:
+    """Process-wide LRU of artist_id -> genres with a TTL, shared across users."""
+
+    def __init__(self, ttl_s: int = _GENRE_TTL_S, max_entries: int = _GENRE_CACHE_MAX):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Tuple[str, ...]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, artist_ids: Iterable[str]) -> Tuple[Dict[str, List[str]], List[str]]:
+        """Split ids into (cached genres, ids that still need fetching)."""
+        found: Dict[str, List[str]] = {}
+        missing: List[str] = []
+        now = time.time()
+        with self._lock:
+            for aid in artist_ids:
+                if not aid or aid in found:
+                    continue
+                entry = self._entries.get(aid)
+                if entry is not None and now - entry[0] < self.ttl_s:
+                    self._entries.move_to_end(aid)
+                    found[aid] = list(entry[1])
+                elif aid not in missing:
+                    missing.append(aid)
+        for _ in found:
+            record_cache("artist_genres", True)
+        for _ in missing:
+            record_cache("artist_genres", False)
+        return found, missing
+
+    def put_many(self, genre_map: Dict[str, List[str]]) -> None:
+        now = time.time()
+        with self._lock:
+            for aid, genres in genre_map.items():
+                if not aid:
+                    continue
+                self._entries.pop(aid, None)
+                self._entries[aid] = (now, tuple(genres or ()))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def artists_with_genres(self, genres: Iterable[str]) -> List[str]:
+        """Cached artist ids tagged with any of the given genres (case-insensitive)."""
+        wanted = {g.strip().lower() for g in genres if g and g.strip()}
+        if not wanted:
+            return []
+        with self._lock:
+            return [aid for aid, (_, tags) in self._entries.items()
+                    if any(t.lower() in wanted for t in tags)]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "ttl_s": self.ttl_s}
+
+
+ARTIST_GENRE_CACHE = ArtistGenreCache()
+
+
+# ---------- Sparse aggregation ----------
+class GenreMatrix:
+    """artist x genre incidence matrix in CSR form with interned genre ids.
+
+    Rows are collected with add_row and frozen into a CSR on the first count after a change.
+    """
+
+    def __init__(self, artist_genres: Dict[str, Sequence[str]]):
+        self.genre_ids: Dict[str, int] = {}
+        self.genre_names: List[str] = []
+        self.artist_rows: Dict[str, int] = {}
+        self._rows: List[List[int]] = []
+        self._csr: Optional[CSR] = None
+        for aid, genres in artist_genres.items():
+            self.add_row(aid, genres)
+
+    def add_row(self, artist_id: str, genres: Optional[Sequence[str]]) -> int:
+        row = self.artist_rows.get(artist_id)
+        if row is not None:
+            return row
+        gids: List[int] = []
+        for genre in genres or ():
+            name = (genre or "").strip()
+            if not name:
+                continue
+            gid = self.genre_ids.get(name)
+            if gid is None:
+                gid = self.genre_ids[name] = len(self.genre_names)
+                self.genre_names.append(name)
+            gids.append(gid)
+        self._rows.append(gids)
+        self._csr = None
+        row = self.artist_rows[artist_id] = len(self._rows) - 1
+        return row
+
+    @property
+    def csr(self) -> CSR:
+        if self._csr is None:
+            self._csr = CSR.from_rows(self._rows, len(self.genre_names))
+        return self._csr
+
+    def count(self, groups: Dict[str, List[int]]) -> Dict[str, Tuple[List[int], List[int]]]:
+        """Sum genre occurrences for each group of artist rows.
+
+        Returns {group: (counts by genre id, genre ids in first-seen order)}. The first-seen order
+        keeps ties ranked exactly like collections.Counter.most_common would.
+        """
+        csr, n_genres = self.csr, len(self.genre_names)
+        out: Dict[str, Tuple[List[int], List[int]]] = {}
+        for key, rows in groups.items():
+            entries = csr.gather(rows)
+            gids, first = np.unique(entries, return_index=True)
+            # Plain ints, so counts serialise as JSON and index like the lists they replace.
+            out[key] = (np.bincount(entries, minlength=n_genres).tolist(), gids[np.argsort(first)].tolist())
+        return out
+
+    def top(self, counts: List[int], order: List[int], limit: int = 10) -> List[Dict[str, Any]]:
+        total = sum(counts)
+        if not total:
+            return []
+        ranked = sorted(order, key=lambda gid: -counts[gid])[:limit]
+        return [{
+            "genre": self.genre_names[gid].title(),
+            "count": counts[gid],
+            "percentage": round((counts[gid] / total) * 100, 1),
+        } for gid in ranked]
+
+
+def summarize_genres_all_ranges(top_artists: Dict[str, List[Dict[str, Any]]],
+                                top_tracks: Dict[str, List[Dict[str, Any]]],
+                                artist_genres: Dict[str, List[str]],
+                                limit: int = 10) -> Dict[str, Any]:
+    """Genre breakdowns for every range of top artists and top tracks in one aggregation pass.
+
+    "artists" counts each top artist's genres per range, "tracks" each top track's artists' genres;
+    "parents" holds the same counts rolled up through the genre taxonomy (see genre_taxonomy).
+    """
+    genre_source: Dict[str, Sequence[str]] = {}
+    for artists in (top_artists or {}).values():
+        for artist in artists or []:
+            aid = artist.get("id") or f"__anon{id(artist)}"
+            genre_source.setdefault(aid, artist.get("genres") or [])
+    matrix = GenreMatrix(genre_source)
+    for aid, genres in (artist_genres or {}).items():
+        matrix.add_row(aid, genres)
+
+    groups: Dict[str, List[int]] = {}
+    for range_key, artists in (top_artists or {}).items():
+        groups[f"artists:{range_key}"] = [
+            matrix.artist_rows[artist.get("id") or f"__anon{id(artist)}"] for artist in artists or []]
+    for range_key, tracks in (top_tracks or {}).items():
+        groups[f"tracks:{range_key}"] = [
+            matrix.artist_rows[aid] for track in tracks or []
+            for aid in (track.get("artist_ids") or []) if aid in matrix.artist_rows]
+
+    counted = matrix.count(groups)
+    result: Dict[str, Any] = {"artists": {}, "tracks": {}, "parents": {"artists": {}, "tracks": {}}}
+    for key, (counts, order) in counted.items():
+        kind, range_key = key.split(":", 1)
+        result[kind][range_key] = matrix.top(counts, order, limit)
+        result["parents"][kind][range_key] = group_counts(matrix.genre_names, counts, order, limit)
+    return result
@@ -0,0 +1,48 @@
+"""Gunicorn server profile tuned for Orpheus' I/O-bound workload.
+
+Nearly all request time is spent waiting on Spotify/Wikipedia, so workers default to threads
+(gthread) rather than single-request sync workers. Every knob can be overridden by env var:
+
+    ORPHEUS_WORKER_CLASS   gthread (default) | gevent | sync
+    ORPHEUS_WORKERS        worker processes      (default: CPU count + 1, max 8)
+    ORPHEUS_THREADS        threads per worker    (gthread only; default: 4 x CPU count, max 32)
+    ORPHEUS_WORKER_CONNECTIONS  greenlets per worker (gevent only; default 1000)
+    ORPHEUS_TIMEOUT        seconds before a silent worker is killed (default 180, covers large sweeps)
+    ORPHEUS_KEEPALIVE      seconds to hold idle keep-alive connections (default 5)
+    PORT                   listen port (default 5000)
+"""
+import multiprocessing
+import os
+
+_cpus = multiprocessing.cpu_count()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = (os.environ.get(name) or "").strip()
+    return int(value) if value else default
+
+
+bind = f"0.0.0.0:{_env_int('PORT', 5000)}"
+worker_class = (os.environ.get("ORPHEUS_WORKER_CLASS") or "gthread").strip()
+workers = _env_int("ORPHEUS_WORKERS", min(_cpus + 1, 8))
+
+if worker_class == "gevent":
+    # Patch before the app is preloaded so requests/urllib3 sockets are cooperative.
+    from gevent import monkey
+    monkey.patch_all()
+    worker_connections = _env_int("ORPHEUS_WORKER_CONNECTIONS", 1000)
+    # Greenlets already overlap blocking Spotify calls, and the shared event-loop thread the
+    # async path uses would not cooperate with them; use the sequential spotipy path.
+    os.environ.setdefault("ORPHEUS_ASYNC", "0")
+elif worker_class == "gthread":
+    threads = _env_int("ORPHEUS_THREADS", min(_cpus * 4, 32))
+
+timeout = _env_int("ORPHEUS_TIMEOUT", 180)
+graceful_timeout = 30
+keepalive = _env_int("ORPHEUS_KEEPALIVE", 5)
+
+# Import the app once in the master so workers fork warm (routes, spotipy, caches' modules loaded).
+preload_app = True
+
+accesslog = "-"
+errorlog = "-"
@@ -0,0 +1,161 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrumentation import record_upstream_call
+from utils import getenv_stripped
+
+# ---------- Constants ----------
+# Overridable so benchmarks can point every Spotify call at a local stand-in (benchmarks/fake_spotify.py).
+SPOTIFY_API_PREFIX = (getenv_stripped("SPOTIFY_API_BASE") or "https://api.spotify.com/v1").rstrip("/") + "/"
+
+# Byte budget for stored response bodies; least recently used entries are evicted first.
+_ETAG_CACHE_BYTES = int(getenv_stripped("SPOTIFY_ETAG_CACHE_MB") or 64) * 1024 * 1024
+
+# Mirrors spotipy's own session defaults so swapping in our session keeps retry behaviour identical.
+_RETRY_CODES = (429, 500, 502, 503, 504)
+_RETRIES = 3
+_BACKOFF_FACTOR = 0.3
+
+
+class CachedBody(NamedTuple):
+    etag: str
+    content: bytes
+    content_type: Optional[str]
+
+
+# ---------- ETag store ----------
+class ETagCache:
+    """Size-bounded LRU of (etag, body) pairs keyed by request URL and bearer token."""
+
+    def __init__(self, max_bytes: int = _ETAG_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedBody]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: CachedBody) -> None:
+        if len(entry.content) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old.content)
+            self._entries[key] = entry
+            self._size += len(entry.content)
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.content)
+
+    def record(self, revalidated: bool) -> None:
+        with self._lock:
+            if revalidated:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size,
+                    "revalidated": self.hits, "full_responses": self.misses}
+
+
+ETAG_CACHE = ETagCache()
+
+
+def etag_cache_key(url: str, params: Any, headers: Dict[str, str]) -> str:
+    # Many endpoints (/me, /me/top/...) are per-user, so the bearer token is part of the key.
+    full_url = requests.Request("GET", url, params=params).prepare().url or url
+    auth = headers.get("Authorization") or ""
+    token_digest = hashlib.sha1(auth.encode("utf-8")).hexdigest()[:16]
+    return f"{token_digest} {full_url}"
+
+
+# ---------- Session ----------
+class ConditionalSession(requests.Session):
+    """requests.Session that revalidates GETs with If-None-Match and replays stored bodies on 304."""
+
+    def __init__(self, cache: Optional[ETagCache] = None):
+        super().__init__()
+        self.etag_cache = cache if cache is not None else ETAG_CACHE
+        retry = Retry(
+            total=_RETRIES,
+            connect=None,
+            read=False,
+            allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+            status=_RETRIES,
+            backoff_factor=_BACKOFF_FACTOR,
+            status_forcelist=_RETRY_CODES,
+        )
+        adapter = HTTPAdapter(max_retries=retry)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, params=None, headers=None, **kwargs):
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self._conditional_request(method, url, params, headers, **kwargs)
+            return response
+        finally:
+            status, nbytes, retries = 0, 0, 0
+            if response is not None:
+                revalidated = getattr(response, "revalidated", False)
+                status = 304 if revalidated else response.status_code
+                nbytes = 0 if revalidated else len(response.content or b"")
+                retries = len(getattr(getattr(response.raw, "retries", None), "history", None) or ())
+            record_upstream_call("spotify", url, status, (time.perf_counter() - start) * 1000,
+                                 retries=retries, nbytes=nbytes)
+
+    def _conditional_request(self, method, url, params, headers, **kwargs):
+        if (method or "").upper() != "GET":
+            return super().request(method, url, params=params, headers=headers, **kwargs)
+
+        headers = dict(headers or {})
+        key = etag_cache_key(url, params, headers)
+        entry = self.etag_cache.get(key)
+        if entry is not None:
+            headers["If-None-Match"] = entry.etag
+
+        response = super().request(method, url, params=params, headers=headers, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            self.etag_cache.record(revalidated=True)
+            # Present the stored body as a normal 200 so spotipy parses it as usual.
+            response.status_code = 200
+            response.revalidated = True
+            response._content = entry.content
+            if entry.content_type:
+                response.headers["Content-Type"] = entry.content_type
+            return response
+
+        if response.status_code == 200:
+            self.etag_cache.record(revalidated=False)
+            etag = response.headers.get("ETag")
+            if etag:
+                self.etag_cache.put(key, CachedBody(etag, response.content, response.headers.get("Content-Type")))
+        return response
+
+
+def etag_cache_stats() -> Dict[str, Any]:
+    return ETAG_CACHE.stats()
@@ -0,0 +1,158 @@
+"""Image variant selection and the optional local image proxy.
+
+Spotify returns each image in several sizes (typically 640, 300 and 64 px), largest first.
+pick_image() chooses the smallest variant that still covers the size it will be displayed at, so
+grids of 64 px tiles no longer download 640 px covers.
+
+With ORPHEUS_IMAGE_PROXY=1, i.scdn.co image URLs are rewritten to /img/<id>, served from a disk
+LRU under ORPHEUS_DATA_DIR/images with year-long immutable cache headers (Spotify image ids are
+content hashes, so a given id never changes). Other image hosts are left untouched.
+"""
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from instrumentation import instrumented_get, record_cache
+from utils import data_dir, getenv_stripped
+
+logger = logging.getLogger(__name__)
+
+# ---------- Constants ----------
+THUMB_PX = 64        # list rows, search results
+TILE_PX = 300        # grid tiles, cards
+FULL_PX = 640        # overlay heroes
+
+PROXY_ENABLED = getenv_stripped("ORPHEUS_IMAGE_PROXY") == "1"
+_CACHE_MAX_BYTES = int(float(getenv_stripped("ORPHEUS_IMAGE_CACHE_MB") or 512) * 1024 * 1024)
+_CDN_URL_RE = re.compile(r"^https://i\.scdn\.co/image/([0-9a-f]{40})$")
+IMAGE_ID_RE = re.compile(r"^[0-9a-f]{40}$")
+
+
+def _edge(image: Dict[str, Any]) -> Optional[int]:
+    sizes = [v for v in (image.get("width"), image.get("height")) if isinstance(v, int) and v > 0]
+    return max(sizes) if sizes else None
+
+
+def pick_image(images: Optional[List[Dict[str, Any]]], size: int = TILE_PX, proxy: bool = True) -> Optional[str]:
+    """URL of the smallest variant at least `size` px on its longer edge (else the largest one).
+
+    Variants without dimensions (playlist mosaics) are only used when nothing else is available.
+    Stored URLs should pass proxy=False and go through proxied() when served.
+    """
+    images = [img for img in images or [] if isinstance(img, dict) and img.get("url")]
+    if not images:
+        return None
+    sized = [(edge, img) for img in images for edge in [_edge(img)] if edge is not None]
+    if sized:
+        covering = [pair for pair in sized if pair[0] >= size]
+        _, chosen = min(covering, key=lambda p: p[0]) if covering else max(sized, key=lambda p: p[0])
+    else:
+        chosen = images[0]
+    return proxied(chosen["url"]) if proxy else chosen["url"]
+
+
+def proxied(url: Optional[str]) -> Optional[str]:
+    """Route a Spotify CDN image through /img/<id> when the proxy is enabled."""
+    if not PROXY_ENABLED or not url:
+        return url
+    match = _CDN_URL_RE.match(url)
+    return f"/img/{match.group(1)}" if match else url
+
+
+def cdn_url(image_id: str) -> str:
+    return f"https://i.scdn.co/image/{image_id}"
+
+
+def sniff_mimetype(head: bytes) -> str:
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+# ---------- Disk cache ----------
+class ImageCache:
+    """Size-bounded LRU of image files; recency survives restarts through file mtimes."""
+
+    def __init__(self, root: Optional[Path] = None, max_bytes: int = _CACHE_MAX_BYTES):
+        self.root = Path(root or data_dir() / "images")
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        files = [p for p in self.root.iterdir() if p.is_file() and IMAGE_ID_RE.match(p.name)]
+        for path in sorted(files, key=lambda p: p.stat().st_mtime):
+            self._sizes[path.name] = path.stat().st_size
+        self._total = sum(self._sizes.values())
+
+    def get(self, image_id: str) -> Optional[Path]:
+        """Path of the cached image, fetching it from the CDN on a miss; None when unavailable."""
+        path = self.root / image_id
+        with self._lock:
+            hit = image_id in self._sizes
+            if hit:
+                self._sizes.move_to_end(image_id)
+        record_cache("image_proxy", hit)
+        if hit:
+            try:
+                os.utime(path)
+                return path
+            except FileNotFoundError:
+                self._forget(image_id)
+        return self._fetch(image_id)
+
+    def _fetch(self, image_id: str) -> Optional[Path]:
+        try:
+            resp = instrumented_get("spotify_cdn", cdn_url(image_id), timeout=8)
+            resp.raise_for_status()
+        except Exception:
+            logger.warning("Could not fetch image %s", image_id, exc_info=True)
+            return None
+        body = resp.content or b""
+        if not body:
+            return None
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(body)
+        os.replace(tmp, self.root / image_id)
+        with self._lock:
+            self._total += len(body) - self._sizes.get(image_id, 0)
+            self._sizes[image_id] = len(body)
+            self._sizes.move_to_end(image_id)
+            evicted = []
+            while self._total > self.max_bytes and len(self._sizes) > 1:
+                old_id, old_size = self._sizes.popitem(last=False)
+                self._total -= old_size
+                evicted.append(old_id)
+        for old_id in evicted:
+            try:
+                (self.root / old_id).unlink()
+            except FileNotFoundError:
+                pass
+        return self.root / image_id
+
+    def _forget(self, image_id: str) -> None:
+        with self._lock:
+            self._total -= self._sizes.pop(image_id, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"files": len(self._sizes), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+_cache: Optional[ImageCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache()
+        return _cache
@@ -0,0 +1,160 @@
+import json
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Dict, List
+
+import requests
+from flask import Flask, Response, g, has_app_context, request
+
+logger = logging.getLogger("orpheus.requests")
+
+# ---------- Constants ----------
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+_ID_SEGMENT_RE = re.compile(r"(?<=/)[A-Za-z0-9]{16,}(?=/|$)")
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.count = 0
+
+    def observe(self, value_ms: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, value_ms)] += 1
+        self.total_ms += value_ms
+        self.count += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{b}" for b in LATENCY_BUCKETS_MS] + ["le_inf"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else None,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+# ---------- Process-wide aggregates ----------
+_lock = threading.Lock()
+_upstream_latency: Dict[str, _Histogram] = defaultdict(_Histogram)
+_upstream_status: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+_upstream_retries: Dict[str, int] = defaultdict(int)
+_upstream_bytes: Dict[str, int] = defaultdict(int)
+_request_latency: Dict[str, _Histogram] = defaultdict(_Histogram)
+_cache_lookups: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+
+def endpoint_template(url: str) -> str:
+    """'https://api.spotify.com/v1/playlists/37i9.../items?offset=100' -> '/v1/playlists/{id}/items'."""
+    path = requests.utils.urlparse(url).path or "/"
+    return _ID_SEGMENT_RE.sub("{id}", path)
+
+
+def record_upstream_call(service: str, url: str, status: int, latency_ms: float,
+                         retries: int = 0, nbytes: int = 0) -> None:
+    """Record one outbound call (service: "spotify" | "wikipedia") for the current request and globally."""
+    key = f"{service} {endpoint_template(url)}"
+    with _lock:
+        _upstream_latency[key].observe(latency_ms)
+        _upstream_status[key][status] += 1
+        _upstream_retries[key] += retries
+        _upstream_bytes[key] += nbytes
+    if has_app_context():
+        calls = g.setdefault("upstream_calls", [])
+        calls.append({"service": service, "endpoint": key.split(" ", 1)[1], "status": status,
+                      "ms": round(latency_ms, 1), "retries": retries, "bytes": nbytes})
+
+
+def record_cache(namespace: str, hit: bool) -> None:
+    with _lock:
+        _cache_lookups[namespace]["hits" if hit else "misses"] += 1
+
+
+def instrumented_get(service: str, url: str, **kwargs) -> requests.Response:
+    """requests.get that records latency/status/bytes for the current request."""
+    start = time.perf_counter()
+    status = 0
+    nbytes = 0
+    try:
+        resp = requests.get(url, **kwargs)
+        status = resp.status_code
+        nbytes = len(resp.content or b"")
+        return resp
+    finally:
+        record_upstream_call(service, url, status, (time.perf_counter() - start) * 1000, nbytes=nbytes)
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        upstream = {
+            key: {
+                "latency": hist.to_dict(),
+                "status": dict(_upstream_status[key]),
+                "retries": _upstream_retries[key],
+                "bytes": _upstream_bytes[key],
+            }
+            for key, hist in _upstream_latency.items()
+        }
+        caches = {
+            ns: dict(counts, hit_ratio=round(counts["hits"] / max(1, counts["hits"] + counts["misses"]), 3))
+            for ns, counts in _cache_lookups.items()
+        }
+        routes = {rule: hist.to_dict() for rule, hist in _request_latency.items()}
+    return {"upstream": upstream, "caches": caches, "requests": routes}
+
+
+# ---------- Request hooks ----------
+def _start_timer() -> None:
+    g.request_started = time.perf_counter()
+    g.upstream_calls = []
+
+
+def _emit_timing(resp: Response) -> Response:
+    started = g.get("request_started")
+    if started is None:
+        return resp
+    total_ms = (time.perf_counter() - started) * 1000
+    calls: List[Dict[str, Any]] = g.get("upstream_calls") or []
+    rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+    with _lock:
+        _request_latency[f"{request.method} {rule}"].observe(total_ms)
+
+    per_service: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "ms": 0.0, "retries": 0, "bytes": 0})
+    for call in calls:
+        agg = per_service[call["service"]]
+        agg["count"] += 1
+        agg["ms"] += call["ms"]
+        agg["retries"] += call["retries"]
+        agg["bytes"] += call["bytes"]
+
+    # Upstream durations are summed, so with concurrent fan-out they can exceed "total".
+    timings = [f'{svc};dur={agg["ms"]:.1f};desc="{agg["count"]} calls"' for svc, agg in per_service.items()]
+    timings.append(f"total;dur={total_ms:.1f}")
+    resp.headers.add("Server-Timing", ", ".join(timings))
+
+    if request.path.startswith("/api/"):
+        logger.info(json.dumps({
+            "event": "request",
+            "method": request.method,
+            "route": rule,
+            "status": resp.status_code,
+            "ms": round(total_ms, 1),
+            "upstream": {svc: {k: round(v, 1) for k, v in agg.items()} for svc, agg in per_service.items()},
+        }, separators=(",", ":")))
+    return resp
+
+
+def register_instrumentation(app: Flask) -> None:
+    """Time every request, aggregate its upstream calls and expose them as Server-Timing + a log line."""
+    app.before_request(_start_timer)
+    app.after_request(_emit_timing)
+
+
+def reset() -> None:
+    with _lock:
+        for store in (_upstream_latency, _upstream_status, _upstream_retries, _upstream_bytes,
+                      _request_latency, _cache_lookups):
+            store.clear()
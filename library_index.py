@@ -0,0 +1,309 @@
+"""Full-text index over the tracks in each user's playlists.
+
+Whenever a playlist's items are fetched (see spotify_client.playlist_items_with_positions) they
+are handed to a background thread, which writes the tracks to a per-user SQLite table with an FTS5
+index over the canonical title (spotify_client.canonical_title, so "Song - Remastered 2011" and
+"Song (feat. X)" index as "song"), artist names and album. Playlists whose track URIs have not
+changed since the last load are skipped before any row is built.
+
+/api/search?scope=library answers from this index without calling Spotify; every query term is
+matched as a word prefix, so it works for as-you-type input. The Spotlight search asks it first
+and only goes to Spotify when the library has too few matches.
+"""
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from images import TILE_PX, pick_image, proxied
+from utils import data_dir, getenv_stripped
+
+logger = logging.getLogger(__name__)
+
+# ---------- Constants ----------
+LIBRARY_ENABLED = getenv_stripped("ORPHEUS_LIBRARY_INDEX") != "0"
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+_MAX_TERMS = 8
+_MAX_PENDING = 32    # playlists waiting for the indexer thread; the oldest is dropped beyond this
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS library_tracks (
+    id          INTEGER PRIMARY KEY,
+    user_id     TEXT NOT NULL,
+    playlist_id TEXT NOT NULL,
+    track_id    TEXT NOT NULL,
+    uri         TEXT,
+    name        TEXT,
+    artists     TEXT,              -- display names, ", "-joined
+    album       TEXT,
+    album_id    TEXT,
+    album_year  TEXT,
+    cover       TEXT,
+    title       TEXT,              -- canonical_title(name)
+    artist_key  TEXT,              -- canonical_artists(artists)
+    album_key   TEXT,
+    artist_ids  TEXT,              -- ","-joined
+    duration_ms INTEGER,
+    explicit    INTEGER,
+    UNIQUE (user_id, playlist_id, track_id)
+);
+CREATE TABLE IF NOT EXISTS library_playlists (
+    user_id     TEXT NOT NULL,
+    playlist_id TEXT NOT NULL,
+    digest      TEXT NOT NULL,     -- sha1 of the playlist's track uris, to skip unchanged reloads
+    tracks      INTEGER NOT NULL,
+    indexed_at  REAL NOT NULL,
+    PRIMARY KEY (user_id, playlist_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS library_fts USING fts5(
+    title, artist_key, album_key,
+    content='library_tracks', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS library_tracks_ai AFTER INSERT ON library_tracks BEGIN
+    INSERT INTO library_fts (rowid, title, artist_key, album_key)
+    VALUES (new.id, new.title, new.artist_key, new.album_key);
+END;
+CREATE TRIGGER IF NOT EXISTS library_tracks_ad AFTER DELETE ON library_tracks BEGIN
+    INSERT INTO library_fts (library_fts, rowid, title, artist_key, album_key)
+    VALUES ('delete', old.id, old.title, old.artist_key, old.album_key);
+END;
+"""
+
+# Columns added after the first release of the table; existing databases get them via ALTER TABLE.
+_ADDED_COLUMNS = (("artist_ids", "TEXT"), ("duration_ms", "INTEGER"), ("explicit", "INTEGER"))
+_ROW_VERSION = "3"   # part of the playlist digest; bump when rows gain columns so playlists get re-indexed
+
+
+def _fts_query(query: str) -> Optional[str]:
+    terms = _TERM_RE.findall((query or "").lower())[:_MAX_TERMS]
+    if not terms:
+        return None
+    return " AND ".join(f'"{t}"*' for t in terms)
+
+
+def _indexable(track: Any) -> bool:
+    return isinstance(track, dict) and bool(track.get("id")) and track.get("type", "track") == "track"
+
+
+def _digest(items: Iterable[Dict[str, Any]]) -> str:
+    """sha1 of the URIs _track_row would index, computed without building the rows."""
+    keys = (track.get("uri") or track["id"] for track in ((it or {}).get("track") for it in items) if _indexable(track))
+    return hashlib.sha1("\n".join([_ROW_VERSION, *keys]).encode("utf-8")).hexdigest()
+
+
+def _track_row(user_id: str, playlist_id: str, item: Dict[str, Any]) -> Optional[tuple]:
+    # Imported lazily: spotify_client imports this module to index the playlists it loads.
+    from spotify_client import canonical_artists, canonical_title
+
+    track = (item or {}).get("track")
+    if not _indexable(track):
+        return None
+    name = track.get("name") or ""
+    artists = track.get("artists") or []
+    album = track.get("album") or {}
+    images = album.get("images") or []
+    release_date = album.get("release_date") or ""
+    return (
+        user_id, playlist_id, track["id"], track.get("uri"), name,
+        ", ".join(a.get("name", "") for a in artists if a),
+        album.get("name"), album.get("id"),
+        release_date[:4] if isinstance(release_date, str) else None,
+        pick_image(images, TILE_PX, proxy=False),
+        canonical_title(name) or name.lower(),
+        canonical_artists(artists) or ", ".join(a.get("name", "") for a in artists if a).lower(),
+        canonical_title(album.get("name")) or (album.get("name") or "").lower(),
+        ",".join(a.get("id") for a in artists if a and a.get("id")),
+        track.get("duration_ms"), int(bool(track.get("explicit"))),
+    )
+
+
+class LibraryIndex:
+    def __init__(self, path=None):
+        self.path = path or data_dir() / "library.sqlite3"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {r[1] for r in self._conn.execute("PRAGMA table_info(library_tracks)")}
+            for column, decl in _ADDED_COLUMNS:
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE library_tracks ADD COLUMN {column} {decl}")
+            self._conn.commit()
+
+    def index_playlist(self, user_id: str, playlist_id: str, items: Iterable[Dict[str, Any]]) -> bool:
+        """Replace the indexed tracks of one playlist; returns False when its contents were unchanged."""
+        items = list(items or [])
+        digest = _digest(items)
+        with self._lock:
+            current = self._conn.execute(
+                "SELECT digest FROM library_playlists WHERE user_id = ? AND playlist_id = ?",
+                (user_id, playlist_id)).fetchone()
+        if current and current[0] == digest:
+            return False
+        rows = [r for r in (_track_row(user_id, playlist_id, it) for it in items) if r]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM library_tracks WHERE user_id = ? AND playlist_id = ?",
+                                   (user_id, playlist_id))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO library_tracks (user_id, playlist_id, track_id, uri, name, artists, "
+                    "album, album_id, album_year, cover, title, artist_key, album_key, artist_ids, duration_ms, "
+                    "explicit) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+                self._conn.execute("INSERT OR REPLACE INTO library_playlists VALUES (?, ?, ?, ?, ?)",
+                                   (user_id, playlist_id, digest, len(rows), time.time()))
+        return True
+
+    def forget_playlist(self, user_id: str, playlist_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM library_tracks WHERE user_id = ? AND playlist_id = ?",
+                               (user_id, playlist_id))
+            self._conn.execute("DELETE FROM library_playlists WHERE user_id = ? AND playlist_id = ?",
+                               (user_id, playlist_id))
+
+    def search(self, user_id: str, query: str, types: Iterable[str] = ("track",), limit: int = 5) -> List[Dict[str, Any]]:
+        """Best matches among the user's indexed playlist tracks, shaped like /api/search results."""
+        match = _fts_query(query)
+        if not match or not user_id:
+            return []
+        types = set(types)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT t.*, bm25(library_fts, 10.0, 4.0, 2.0) AS score FROM library_fts "
+                "JOIN library_tracks t ON t.id = library_fts.rowid "
+                "WHERE library_fts MATCH ? AND t.user_id = ? ORDER BY score LIMIT ?",
+                (match, user_id, max(50, limit * 10))).fetchall()
+
+        tracks: List[Dict[str, Any]] = []
+        albums: List[Dict[str, Any]] = []
+        seen_tracks, seen_albums = set(), set()
+        for row in rows:
+            if "track" in types and len(tracks) < limit and row["track_id"] not in seen_tracks:
+                seen_tracks.add(row["track_id"])
+                tracks.append({
+                    "type": "track",
+                    "seedType": "track",
+                    "name": row["name"],
+                    "artist": row["artists"],
+                    "image": proxied(row["cover"]),
+                    "id": row["track_id"],
+                    "uri": row["uri"],
+                    "album": row["album"],
+                    "album_id": row["album_id"],
+                    "album_year": row["album_year"],
+                    "in_library": True,
+                })
+            if "album" in types and len(albums) < limit and row["album_id"] and row["album_id"] not in seen_albums:
+                seen_albums.add(row["album_id"])
+                albums.append({
+                    "type": "album",
+                    "name": row["album"],
+                    "artist": row["artists"],
+                    "image": proxied(row["cover"]),
+                    "id": row["album_id"],
+                    "uri": f"spotify:album:{row['album_id']}",
+                    "album": row["album"],
+                    "album_id": row["album_id"],
+                    "album_year": row["album_year"],
+                    "in_library": True,
+                })
+        results = tracks + albums
+        return results
+
+    def playlist_versions(self, user_id: str) -> Dict[str, float]:
+        """playlist_id -> when it was last (re)indexed, for one user's playlists."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT playlist_id, indexed_at FROM library_playlists WHERE user_id = ?", (user_id,)).fetchall()
+        return {r[0]: r[1] for r in rows}
+
+    def playlist_tracks(self, user_id: str, playlist_ids: Iterable[str]) -> Dict[str, List[tuple]]:
+        """playlist_id -> [(track_id, artist_ids)] from one user's indexed copy of each playlist."""
+        out: Dict[str, List[tuple]] = {}
+        with self._lock:
+            for playlist_id in playlist_ids:
+                out[playlist_id] = [tuple(r) for r in self._conn.execute(
+                    "SELECT track_id, artist_ids FROM library_tracks WHERE user_id = ? AND playlist_id = ?",
+                    (user_id, playlist_id))]
+        return out
+
+    def track_details(self, user_id: str, track_ids: Iterable[str]) -> Dict[str, sqlite3.Row]:
+        ids = list(track_ids)
+        out: Dict[str, sqlite3.Row] = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                for row in self._conn.execute(
+                        f"SELECT * FROM library_tracks WHERE user_id = ? AND track_id IN ({marks}) GROUP BY track_id",
+                        [user_id, *batch]):
+                    out[row["track_id"]] = row
+        return out
+
+    def stats(self, user_id: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tracks), 0) FROM library_playlists WHERE user_id = ?",
+                (user_id,)).fetchone()
+        return {"playlists": row[0], "tracks": row[1]}
+
+
+_index: Optional[LibraryIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_library_index() -> LibraryIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LibraryIndex()
+        return _index
+
+
+class _Indexer:
+    """Indexes fetched playlists on one background thread, newest load of each playlist only."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: "OrderedDict[Tuple[str, str], List[Dict[str, Any]]]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, user_id: str, playlist_id: str, items: List[Dict[str, Any]]) -> None:
+        with self._cond:
+            self._pending.pop((user_id, playlist_id), None)
+            self._pending[(user_id, playlist_id)] = items
+            while len(self._pending) > _MAX_PENDING:
+                # Dropped playlists are picked up again the next time they are loaded.
+                self._pending.popitem(last=False)
+            # Started lazily so preloaded gunicorn masters don't fork a running thread.
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="library-indexer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                (user_id, playlist_id), items = self._pending.popitem(last=False)
+            try:
+                get_library_index().index_playlist(user_id, playlist_id, items)
+            except Exception:
+                logger.exception("Could not index playlist %s for %s", playlist_id, user_id)
+
+
+_indexer = _Indexer()
+
+
+def index_playlist_items(user_id: Optional[str], playlist_id: str, items: Iterable[Dict[str, Any]]) -> None:
+    """Opportunistically index playlist items a request already fetched, off the request path."""
+    if LIBRARY_ENABLED and user_id and playlist_id:
+        _indexer.submit(user_id, playlist_id, list(items or []))
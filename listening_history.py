@@ -0,0 +1,509 @@
+"""Local listening history beyond Spotify's 50-play recently-played window.
+
+Plays are appended to a SQLite table clustered on (user_id, played_at), so the primary key doubles
+as the time index: range queries ("last 30 days") seek straight to the window no matter how many
+plays are stored. Rows are only ever inserted (duplicates from overlapping polls are ignored).
+
+A background collector polls each known user's recently-played feed with the `after` cursor.
+Users become known when their session token is used (see spotify_client.get_access_token).
+Every worker runs a collector, but a lease table under data_dir() lets only one worker per host
+poll a given user; another worker that knows the user takes over if the holder stops renewing.
+"""
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from images import THUMB_PX, pick_image, proxied
+from utils import data_dir, getenv_stripped
+
+logger = logging.getLogger(__name__)
+
+GenreLookup = Callable[[List[str]], Dict[str, List[str]]]
+
+# ---------- Constants ----------
+HISTORY_ENABLED = (getenv_stripped("ORPHEUS_HISTORY") or "1") != "0"
+_POLL_INTERVAL_S = int(getenv_stripped("ORPHEUS_HISTORY_POLL_S") or 900)
+_HOUR_MS = 3_600_000
+_DAY_MS = 86_400_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plays (
+    user_id     TEXT    NOT NULL,
+    played_at   INTEGER NOT NULL,  -- epoch ms
+    track_id    TEXT,
+    track_uri   TEXT,
+    name        TEXT,
+    artists     TEXT,              -- display string, "A, B"
+    artist_ids  TEXT,              -- comma separated
+    album       TEXT,
+    album_id    TEXT,
+    cover       TEXT,
+    duration_ms INTEGER,
+    explicit    INTEGER,
+    url         TEXT,
+    PRIMARY KEY (user_id, played_at)
+) WITHOUT ROWID;
+
+-- Rollups, maintained incrementally as plays are appended (see HistoryStore._roll_up).
+CREATE TABLE IF NOT EXISTS rollup_hourly (
+    user_id    TEXT    NOT NULL,
+    hour_start INTEGER NOT NULL,   -- epoch ms, UTC hour boundary
+    plays      INTEGER NOT NULL,
+    ms         INTEGER NOT NULL,
+    PRIMARY KEY (user_id, hour_start)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_daily (
+    user_id TEXT    NOT NULL,
+    day     TEXT    NOT NULL,      -- UTC, YYYY-MM-DD
+    plays   INTEGER NOT NULL,
+    ms      INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_artist_daily (
+    user_id   TEXT    NOT NULL,
+    day       TEXT    NOT NULL,
+    artist_id TEXT    NOT NULL,
+    name      TEXT,
+    plays     INTEGER NOT NULL,
+    ms        INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day, artist_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_genre_daily (
+    user_id TEXT    NOT NULL,
+    day     TEXT    NOT NULL,
+    genre   TEXT    NOT NULL,
+    plays   INTEGER NOT NULL,
+    ms      INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day, genre)
+) WITHOUT ROWID;
+-- Plays stored while their artists' genres could not be looked up; folded into
+-- rollup_genre_daily (and removed from here) by the next append that has a working lookup.
+CREATE TABLE IF NOT EXISTS genre_pending (
+    user_id   TEXT    NOT NULL,
+    played_at INTEGER NOT NULL,
+    PRIMARY KEY (user_id, played_at)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_HOURLY = """INSERT INTO rollup_hourly VALUES (?, ?, 1, ?)
+    ON CONFLICT (user_id, hour_start) DO UPDATE SET plays = plays + 1, ms = ms + excluded.ms"""
+_UPSERT_DAILY = """INSERT INTO rollup_daily VALUES (?, ?, 1, ?)
+    ON CONFLICT (user_id, day) DO UPDATE SET plays = plays + 1, ms = ms + excluded.ms"""
+_UPSERT_ARTIST = """INSERT INTO rollup_artist_daily VALUES (?, ?, ?, ?, 1, ?)
+    ON CONFLICT (user_id, day, artist_id) DO UPDATE SET plays = plays + 1, ms = ms + excluded.ms, name = excluded.name"""
+_UPSERT_GENRE = """INSERT INTO rollup_genre_daily VALUES (?, ?, ?, 1, ?)
+    ON CONFLICT (user_id, day, genre) DO UPDATE SET plays = plays + 1, ms = ms + excluded.ms"""
+
+# Named windows for /api/listening-stats, resolved against "now" at request time.
+RANGE_PRESETS = {
+    "last_24_hours": "Last 24 Hours",
+    "last_7_days": "Last 7 Days",
+    "last_30_days": "Last 30 Days",
+    "this_month": "This Month",
+    "this_year": "This Year",
+    "all_time": "All Time",
+}
+
+
+def played_at_ms(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    try:
+        return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+def utc_day(ts_ms: int) -> str:
+    return datetime.fromtimestamp(ts_ms / 1000, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _artist_pairs(item: Dict[str, Any]) -> List[Tuple[str, str]]:
+    artists = ((item or {}).get("track") or {}).get("artists") or []
+    return [(a["id"], a.get("name") or "") for a in artists if a.get("id")]
+
+
+def _play_row(user_id: str, item: Dict[str, Any]) -> Optional[tuple]:
+    track = (item or {}).get("track") or {}
+    ts = played_at_ms((item or {}).get("played_at"))
+    if not track or ts is None:
+        return None
+    artists = track.get("artists") or []
+    album = track.get("album") or {}
+    images = album.get("images") or []
+    return (
+        user_id, ts, track.get("id"), track.get("uri"), track.get("name"),
+        ", ".join(a.get("name", "") for a in artists),
+        ",".join(a.get("id") for a in artists if a.get("id")),
+        album.get("name"), album.get("id"),
+        pick_image(images, THUMB_PX, proxy=False),
+        track.get("duration_ms"), int(bool(track.get("explicit"))),
+        (track.get("external_urls") or {}).get("spotify"),
+    )
+
+
+# ---------- Store ----------
+class HistoryStore:
+    def __init__(self, path=None):
+        self.path = path or data_dir() / "history.sqlite3"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            self._backfill_rollups()
+
+    def append_plays(self, user_id: str, items: Iterable[Dict[str, Any]],
+                     genre_lookup: Optional[GenreLookup] = None) -> List[tuple]:
+        """Insert recently-played items and fold the new ones into the rollups; returns the new rows.
+
+        Genre rollups need artist genres, which come from genre_lookup (artist ids -> genres). They
+        are resolved before the insert, only for plays not stored yet, so each play and all of its
+        rollups are written in one transaction. When there is no lookup or it fails, the play is
+        marked in genre_pending instead and picked up by a later call that has a working lookup.
+        """
+        parsed = [(row, _artist_pairs(it)) for row, it in ((_play_row(user_id, it), it) for it in items or []) if row]
+        if not user_id or not parsed:
+            return []
+        with self._lock:
+            stamps = [row[1] for row, _ in parsed]
+            stored = {r[0] for r in self._conn.execute(
+                f"SELECT played_at FROM plays WHERE user_id = ? AND played_at IN ({','.join('?' * len(stamps))})",
+                [user_id, *stamps])}
+        candidates = [(row, pairs) for row, pairs in parsed if row[1] not in stored]
+
+        genres = None
+        if candidates and genre_lookup is not None:
+            genres = self._lookup_genres(genre_lookup, {aid for _, pairs in candidates for aid, _ in pairs})
+        new = []
+        with self._lock, self._conn:
+            for row, pairs in candidates:
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO plays VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)", row)
+                if not cur.rowcount:
+                    continue   # stored meanwhile by another writer, which rolled it up
+                new.append(row)
+                self._roll_up(row, pairs)
+                if genres is None:
+                    self._conn.execute("INSERT OR IGNORE INTO genre_pending VALUES (?, ?)", (user_id, row[1]))
+                else:
+                    self._roll_up_genres(row, [aid for aid, _ in pairs], genres)
+
+        if genre_lookup is not None and (genres is not None or not candidates):
+            self._retry_pending_genres(user_id, genre_lookup)
+        return new
+
+    def _roll_up(self, row: tuple, pairs: List[Tuple[str, str]]) -> None:
+        user_id, ts, duration = row[0], row[1], row[10] or 0
+        day = utc_day(ts)
+        self._conn.execute(_UPSERT_HOURLY, (user_id, ts - ts % _HOUR_MS, duration))
+        self._conn.execute(_UPSERT_DAILY, (user_id, day, duration))
+        for artist_id, name in pairs:
+            self._conn.execute(_UPSERT_ARTIST, (user_id, day, artist_id, name, duration))
+
+    def _roll_up_genres(self, row: tuple, artist_ids: List[str], genres: Dict[str, List[str]]) -> None:
+        day, duration = utc_day(row[1]), row[10] or 0
+        for genre in {g for aid in artist_ids for g in genres.get(aid) or [] if g}:
+            self._conn.execute(_UPSERT_GENRE, (row[0], day, genre, duration))
+
+    @staticmethod
+    def _lookup_genres(genre_lookup: GenreLookup, artist_ids: Iterable[str]) -> Optional[Dict[str, List[str]]]:
+        try:
+            return genre_lookup(sorted(artist_ids)) or {}
+        except Exception:
+            logger.exception("Genre lookup failed; genre rollups deferred")
+            return None
+
+    def _retry_pending_genres(self, user_id: str, genre_lookup: GenreLookup, limit: int = 500) -> None:
+        with self._lock:
+            plays = [tuple(r) for r in self._conn.execute(
+                "SELECT p.* FROM genre_pending g JOIN plays p ON p.user_id = g.user_id AND p.played_at = g.played_at "
+                "WHERE g.user_id = ? LIMIT ?", (user_id, limit))]
+        if not plays:
+            return
+        ids = {row: [i for i in (row[6] or "").split(",") if i] for row in plays}
+        genres = self._lookup_genres(genre_lookup, {aid for artist_ids in ids.values() for aid in artist_ids})
+        if genres is None:
+            return
+        with self._lock, self._conn:
+            for row, artist_ids in ids.items():
+                # Deleting first makes the retry count each play once, even with concurrent writers.
+                if self._conn.execute("DELETE FROM genre_pending WHERE user_id = ? AND played_at = ?",
+                                      (user_id, row[1])).rowcount:
+                    self._roll_up_genres(row, artist_ids, genres)
+
+    def _backfill_rollups(self) -> None:
+        """One-off: build rollups for plays stored before rollups existed (genres are not recoverable)."""
+        if self._conn.execute("SELECT 1 FROM rollup_hourly LIMIT 1").fetchone():
+            return
+        if not self._conn.execute("SELECT 1 FROM plays LIMIT 1").fetchone():
+            return
+        with self._conn:
+            for play in self._conn.execute("SELECT * FROM plays").fetchall():
+                ids = [i for i in (play["artist_ids"] or "").split(",") if i]
+                names = (play["artists"] or "").split(", ")
+                pairs = [(aid, names[i] if i < len(names) else "") for i, aid in enumerate(ids)]
+                self._roll_up(tuple(play), pairs)
+
+    def genres(self) -> List[str]:
+        """Every genre that has appeared in any user's rollups."""
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT DISTINCT genre FROM rollup_genre_daily")]
+
+    def aggregate(self, user_id: str, start_ms: int, end_ms: int, limit: int = 10) -> Dict[str, Any]:
+        """Plays/minutes/artists/genres for [start_ms, end_ms) read from the rollups.
+
+        Totals are exact to the hour: whole days come from the daily rollup and the partial days at
+        either edge from the hourly one. Artist and genre breakdowns use whole days.
+        """
+        first_full_day = -(-start_ms // _DAY_MS) * _DAY_MS
+        last_full_day = end_ms - end_ms % _DAY_MS
+        edge_hours: List[Tuple[int, int]] = []
+        if first_full_day >= last_full_day:
+            edge_hours.append((start_ms, end_ms))
+        else:
+            edge_hours.extend([(start_ms, first_full_day), (last_full_day, end_ms)])
+        start_day, end_day = utc_day(start_ms), utc_day(max(start_ms, end_ms - 1))
+
+        with self._lock:
+            plays = ms = 0
+            if first_full_day < last_full_day:
+                row = self._conn.execute(
+                    "SELECT COALESCE(SUM(plays), 0), COALESCE(SUM(ms), 0) FROM rollup_daily "
+                    "WHERE user_id = ? AND day >= ? AND day < ?",
+                    (user_id, utc_day(first_full_day), utc_day(last_full_day))).fetchone()
+                plays, ms = row[0], row[1]
+            for lo, hi in edge_hours:
+                row = self._conn.execute(
+                    "SELECT COALESCE(SUM(plays), 0), COALESCE(SUM(ms), 0) FROM rollup_hourly "
+                    "WHERE user_id = ? AND hour_start >= ? AND hour_start < ?",
+                    (user_id, lo - lo % _HOUR_MS, hi)).fetchone()
+                plays, ms = plays + row[0], ms + row[1]
+            by_day = [dict(r) for r in self._conn.execute(
+                "SELECT day, plays, ms FROM rollup_daily WHERE user_id = ? AND day >= ? AND day <= ? ORDER BY day",
+                (user_id, start_day, end_day))]
+            artists = [dict(r) for r in self._conn.execute(
+                "SELECT artist_id AS id, MAX(name) AS name, SUM(plays) AS plays, SUM(ms) AS ms "
+                "FROM rollup_artist_daily WHERE user_id = ? AND day >= ? AND day <= ? "
+                "GROUP BY artist_id ORDER BY plays DESC, ms DESC LIMIT ?",
+                (user_id, start_day, end_day, limit))]
+            genres = [dict(r) for r in self._conn.execute(
+                "SELECT genre, SUM(plays) AS plays FROM rollup_genre_daily "
+                "WHERE user_id = ? AND day >= ? AND day <= ? GROUP BY genre ORDER BY plays DESC",
+                (user_id, start_day, end_day))]
+
+        genre_total = sum(g["plays"] for g in genres)
+        return {
+            "plays": plays,
+            "minutes": round(ms / 60000),
+            "by_day": [{"day": d["day"], "plays": d["plays"], "minutes": round(d["ms"] / 60000)} for d in by_day],
+            "top_artists": [{"id": a["id"], "name": a["name"], "plays": a["plays"], "minutes": round(a["ms"] / 60000)}
+                            for a in artists],
+            "top_genres": [{"genre": g["genre"].title(), "count": g["plays"],
+                            "percentage": round(g["plays"] / genre_total * 100, 1)} for g in genres[:limit]],
+        }
+
+    def latest_played_at(self, user_id: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(played_at) FROM plays WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def plays_between(self, user_id: str, start_ms: int = 0, end_ms: Optional[int] = None,
+                      limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Plays in [start_ms, end_ms), newest first."""
+        end_ms = end_ms if end_ms is not None else int(time.time() * 1000) + 1
+        sql = "SELECT * FROM plays WHERE user_id = ? AND played_at >= ? AND played_at < ? ORDER BY played_at DESC"
+        params: List[Any] = [user_id, start_ms, end_ms]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [dict(r) for r in self._conn.execute(sql, params)]
+
+    def track_uris_since(self, user_id: str, since_ms: int) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT track_uri FROM plays WHERE user_id = ? AND played_at >= ? AND track_uri IS NOT NULL",
+                (user_id, since_ms)).fetchall()
+        return [r[0] for r in rows]
+
+    def count(self, user_id: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM plays WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+
+_store: Optional[HistoryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> HistoryStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
+
+
+def days_ago_ms(days: int) -> int:
+    return int(time.time() * 1000) - days * _DAY_MS
+
+
+def resolve_range(name: str, now_ms: Optional[int] = None) -> Optional[Tuple[int, int]]:
+    """Map a RANGE_PRESETS key to a [start_ms, end_ms) window (UTC)."""
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    now = datetime.fromtimestamp(now_ms / 1000, timezone.utc)
+    starts = {
+        "last_24_hours": now_ms - _DAY_MS,
+        "last_7_days": now_ms - 7 * _DAY_MS,
+        "last_30_days": now_ms - 30 * _DAY_MS,
+        "this_month": int(now.replace(day=1, hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000),
+        "this_year": int(now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000),
+        "all_time": 0,
+    }
+    if name not in starts:
+        return None
+    return starts[name], now_ms + 1
+
+
+# ---------- Collector ----------
+class _Leases:
+    """Which worker polls which user, shared by every worker on the host."""
+
+    def __init__(self, path=None):
+        self.path = path or data_dir() / "history_leases.sqlite3"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS leases "
+                               "(user_id TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self._conn.commit()
+
+    def claim(self, user_id: str, owner: str, ttl_s: float) -> bool:
+        """Take or renew the lease on user_id; False while another owner's lease is unexpired."""
+        now = time.time()
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT (user_id) DO UPDATE "
+                "SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (user_id, owner, now + ttl_s, now))
+            return cur.rowcount > 0
+
+    def release(self, user_id: str, owner: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM leases WHERE user_id = ? AND owner = ?", (user_id, owner))
+
+
+class HistoryCollector:
+    """Polls recently-played for every registered user and appends new plays to the store.
+
+    Each worker has one, fed with the users whose requests it served. Before polling a user it
+    claims that user's lease, so a user seen by several workers is still polled once per interval.
+    """
+
+    def __init__(self, interval_s: int = _POLL_INTERVAL_S):
+        self.interval_s = interval_s
+        self._tokens: Dict[str, str] = {}     # user_id -> token_store key
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._leases: Optional[_Leases] = None
+        self._owner = ""
+
+    def track(self, user_id: str, token_key: str) -> None:
+        if not HISTORY_ENABLED or not user_id or not token_key:
+            return
+        with self._lock:
+            self._tokens[user_id] = token_key
+            # Started lazily so preloaded gunicorn masters don't fork a running thread.
+            if self._thread is None or not self._thread.is_alive():
+                self._leases = self._leases or _Leases()
+                self._owner = f"{socket.gethostname()}:{os.getpid()}"
+                self._thread = threading.Thread(target=self._run, name="history-collector", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                users = list(self._tokens.items())
+            for user_id, token_key in users:
+                try:
+                    if not self._claim(user_id):
+                        continue
+                    self.collect(user_id, token_key)
+                except Exception:
+                    logger.exception("History collection failed for %s", user_id)
+            self._wake.wait(self.interval_s)
+            self._wake.clear()
+
+    def _claim(self, user_id: str) -> bool:
+        # Two missed renewals before another worker takes the user over.
+        try:
+            return self._leases.claim(user_id, self._owner, 2 * self.interval_s + 60)
+        except sqlite3.Error:
+            logger.exception("History lease unavailable; polling %s without it", user_id)
+            return True   # a duplicate poll is harmless: plays are only inserted once
+
+    def collect(self, user_id: str, token_key: str) -> int:
+        from spotify_client import lookup_artist_genres, spotify_for_token
+        from token_store import get_token_store
+
+        try:
+            access_token = get_token_store().access_token(token_key, touch=False)
+        except RuntimeError:
+            # Logged out, or dropped from the store after a long idle period.
+            with self._lock:
+                if self._tokens.get(user_id) == token_key:
+                    del self._tokens[user_id]
+            if self._leases is not None:
+                self._leases.release(user_id, self._owner)
+            return 0
+        sp = spotify_for_token(access_token)
+
+        store = get_store()
+        cursor = store.latest_played_at(user_id)
+        data = sp.current_user_recently_played(limit=50, after=cursor) if cursor else \
+            sp.current_user_recently_played(limit=50)
+        added = store.append_plays(user_id, (data or {}).get("items") or [],
+                                   genre_lookup=lambda ids: lookup_artist_genres(sp, ids))
+        if added:
+            logger.info("Collected %d new plays for %s", len(added), user_id)
+        return len(added)
+
+
+collector = HistoryCollector()
+
+
+def record_recent_items(user_id: str, items: Iterable[Dict[str, Any]],
+                        genre_lookup: Optional[GenreLookup] = None) -> None:
+    """Opportunistically persist recently-played items a route already fetched."""
+    if HISTORY_ENABLED and user_id:
+        try:
+            get_store().append_plays(user_id, items, genre_lookup)
+        except sqlite3.Error:
+            logger.exception("Could not append plays for %s", user_id)
+
+
+def history_row_to_track(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a stored play like the playlist rows api_playlist returns."""
+    return {
+        "id": row.get("track_id"),
+        "uri": row.get("track_uri"),
+        "name": row.get("name"),
+        "artists": row.get("artists") or "",
+        "album": row.get("album"),
+        "added_at": datetime.fromtimestamp(row["played_at"] / 1000, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "url": row.get("url"),
+        "explicit": bool(row.get("explicit")),
+        "duration_ms": row.get("duration_ms"),
+        "cover": proxied(row.get("cover")),
+    }
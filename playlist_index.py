@@ -0,0 +1,259 @@
+"""Per-user index of the playlists in a user's library, for the Manage Playlists grid.
+
+The first request lists every playlist once, with all pages in flight at the same time on the async
+client. Later pages are served from memory, globally sorted and filtered, so paging no longer
+re-sorts single 50-item Spotify pages or calls /me for each one.
+
+After _FRESH_S the listing is refreshed. The list pages revalidate through the Spotify ETag cache,
+and the sorted views are only rebuilt when a snapshot_id changed or a playlist appeared or
+disappeared.
+Mutating routes call invalidate(), which bumps the user's generation in a small SQLite table under
+data_dir(). Every worker compares that generation with the one its copy was built at, so the
+user's next page reflects their own edits at once, whichever worker serves it.
+
+Cursors encode the sort key of the last item returned, so paging stays stable while
+playlists are added or removed between requests.
+"""
+import base64
+import binascii
+import json
+import logging
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import spotipy
+
+from async_spotify import fetch_all_user_playlists, run_async
+from library_index import LIBRARY_ENABLED, get_library_index
+from spotify_client import async_available, get_async_sp, paginate
+from utils import data_dir, getenv_stripped, normalize, safe_get
+
+logger = logging.getLogger(__name__)
+
+# ---------- Constants ----------
+_FRESH_S = float(getenv_stripped("ORPHEUS_PLAYLIST_INDEX_TTL_S") or 60)
+_MAX_USERS = 500
+
+
+def _name_key(pl: Dict[str, Any]) -> Tuple:
+    return ((pl.get("name") or "").casefold(), pl.get("id") or "")
+
+
+def _tracks_key(pl: Dict[str, Any]) -> Tuple:
+    return (-int(safe_get(safe_get(pl, "tracks", {}), "total", 0) or 0), *_name_key(pl))
+
+
+SORTS: Dict[str, Callable[[Dict[str, Any]], Tuple]] = {"name": _name_key, "tracks": _tracks_key}
+_KEY_TYPES: Dict[str, Tuple[type, ...]] = {"name": (str, str), "tracks": (int, str, str)}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort: str, key: Tuple) -> str:
+    raw = json.dumps([sort, *key], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError) as err:
+        raise InvalidCursor("invalid_cursor") from err
+    types = _KEY_TYPES[sort]
+    # The key is compared against real sort keys, so its shape must match exactly (bool is not an int here).
+    if (not isinstance(data, list) or len(data) != len(types) + 1 or data[0] != sort
+            or not all(type(v) is t for v, t in zip(data[1:], types))):
+        raise InvalidCursor("invalid_cursor")
+    return tuple(data[1:])
+
+
+class _UserPlaylists:
+    """One user's playlists, pre-sorted for every entry in SORTS."""
+
+    def __init__(self, user_id: str, playlists: List[Dict[str, Any]]):
+        self.user_id = user_id
+        self.me_id = normalize(user_id)
+        self.fetched_at = 0.0
+        self.loaded = False
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.snapshots: Dict[str, Optional[str]] = {}
+        self.views: Dict[str, Tuple[List[Dict[str, Any]], List[Tuple]]] = {}
+        self.replace(playlists)
+
+    def replace(self, playlists: List[Dict[str, Any]]) -> None:
+        unique = list({pl["id"]: pl for pl in playlists if isinstance(pl, dict) and pl.get("id")}.values())
+        views = {}
+        for sort, key in SORTS.items():
+            ordered = sorted(unique, key=key)
+            views[sort] = (ordered, [key(pl) for pl in ordered])
+        # Swapped in whole so concurrent page() calls never see a half-built view.
+        self.views = views
+        self.snapshots = {pl["id"]: pl.get("snapshot_id") for pl in unique}
+
+    def is_owned(self, pl: Dict[str, Any]) -> bool:
+        return normalize(safe_get(safe_get(pl, "owner", {}), "id")) == self.me_id
+
+    def page(self, sort: str = "name", limit: int = 50, cursor: Optional[str] = None, offset: int = 0,
+             owned_only: bool = False, prefix: str = "") -> Dict[str, Any]:
+        ordered, keys = self.views[sort]
+        prefix = (prefix or "").casefold()
+
+        def matches(pl: Dict[str, Any]) -> bool:
+            if owned_only and not self.is_owned(pl):
+                return False
+            return not prefix or (pl.get("name") or "").casefold().startswith(prefix)
+
+        lo, hi = 0, len(ordered)
+        if prefix and sort == "name":
+            # Names sort first in the key, so a name prefix is one contiguous run.
+            lo = bisect_left(keys, (prefix,))
+            hi = bisect_left(keys, (prefix + "\U0010ffff",))
+        start = max(lo, bisect_right(keys, decode_cursor(cursor, sort))) if cursor else lo
+        total = sum(1 for pl in ordered[lo:hi] if matches(pl))
+
+        items: List[Dict[str, Any]] = []
+        skipped = 0
+        pos = start
+        while pos < hi and len(items) < limit + 1:
+            pl = ordered[pos]
+            pos += 1
+            if not matches(pl):
+                continue
+            if not cursor and skipped < offset:
+                skipped += 1
+                continue
+            items.append(pl)
+        has_more = len(items) > limit
+        items = items[:limit]
+        return {
+            "items": items,
+            "total": total,
+            "has_more": has_more,
+            "next_cursor": encode_cursor(sort, SORTS[sort](items[-1])) if has_more else None,
+        }
+
+
+class _Generations:
+    """Per-user invalidation counters shared by every worker process."""
+
+    def __init__(self, path=None):
+        self.path = path or data_dir() / "playlist_index.sqlite3"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS generations (user_id TEXT PRIMARY KEY, gen INTEGER NOT NULL)"
+            )
+            self._conn.commit()
+
+    def current(self, user_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT gen FROM generations WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, user_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO generations (user_id, gen) VALUES (?, 1) "
+                "ON CONFLICT(user_id) DO UPDATE SET gen = gen + 1",
+                (user_id,),
+            )
+            self._conn.commit()
+
+
+class PlaylistIndex:
+    def __init__(self, fresh_s: float = _FRESH_S, max_users: int = _MAX_USERS, generations_path=None):
+        self.fresh_s = fresh_s
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._users: Dict[str, _UserPlaylists] = {}
+        self._generations = _Generations(generations_path)
+
+    def get(self, sp: spotipy.Spotify, user_id: str) -> _UserPlaylists:
+        """The user's index, building it on first use and refreshing it once stale."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                entry = self._users[user_id] = _UserPlaylists(user_id, [])
+                while len(self._users) > self.max_users:
+                    self._users.pop(next(iter(self._users)))
+        generation = self._generation(user_id)
+        if not self._needs_refresh(entry, generation):
+            return entry
+        with entry.lock:
+            # Another request may have refreshed it while we waited for the lock.
+            if self._needs_refresh(entry, generation):
+                self._refresh(sp, entry, generation)
+        return entry
+
+    def _generation(self, user_id: str) -> int:
+        try:
+            return self._generations.current(user_id)
+        except sqlite3.Error:
+            logger.warning("Playlist index generation lookup failed", exc_info=True)
+            return -1   # unknown: never matches, so the listing is refreshed
+
+    def _needs_refresh(self, entry: _UserPlaylists, generation: int) -> bool:
+        return (not entry.loaded or entry.generation != generation
+                or time.time() - entry.fetched_at >= self.fresh_s)
+
+    def _refresh(self, sp: spotipy.Spotify, entry: _UserPlaylists, generation: int) -> None:
+        # The generation is read before listing, so an edit made while we list triggers another refresh.
+        start = time.perf_counter()
+        if async_available():
+            playlists = run_async(_list_playlists_async())
+        else:
+            playlists = list(paginate(lambda o, l: sp.current_user_playlists(limit=l, offset=o)))
+        current = {pl["id"]: pl.get("snapshot_id") for pl in playlists if isinstance(pl, dict) and pl.get("id")}
+        changed = [pid for pid, snap in current.items() if entry.snapshots.get(pid) != snap]
+        removed = [pid for pid in entry.snapshots if pid not in current]
+        first_load = not entry.loaded
+        if changed or removed or first_load:
+            entry.replace(playlists)
+        entry.loaded, entry.generation, entry.fetched_at = True, generation, time.time()
+        if removed and LIBRARY_ENABLED:
+            for pid in removed:
+                get_library_index().forget_playlist(entry.user_id, pid)
+        logger.info("Playlist index for %s: %d playlists (%d changed, %d removed) in %.0f ms", entry.user_id,
+                    len(current), 0 if first_load else len(changed), len(removed), (time.perf_counter() - start) * 1000)
+
+    def invalidate(self, user_id: Optional[str]) -> None:
+        """Force the next get() for this user to re-list (after creating, deleting or editing playlists).
+
+        The generation is shared, so the other workers' copies go stale too.
+        """
+        if not user_id:
+            return
+        try:
+            self._generations.bump(user_id)
+        except sqlite3.Error:
+            logger.warning("Playlist index invalidation failed", exc_info=True)
+            with self._lock:
+                entry = self._users.get(user_id)
+            if entry is not None:
+                entry.loaded = False
+
+
+async def _list_playlists_async() -> List[Dict[str, Any]]:
+    async with get_async_sp() as client:
+        return await fetch_all_user_playlists(client)
+
+
+_index: Optional[PlaylistIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_playlist_index() -> PlaylistIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PlaylistIndex()
+        return _index
@@ -0,0 +1,325 @@
+"""Build a new playlist by merging several sources in one streaming pass.
+
+Sources are playlists (owned or followed), Recently Played (RECENT_ID) and the local 30-day
+history (RECENT_30D_ID), merged in the order given. Tracks are deduplicated as they stream past,
+either by URI or by canonical title + artists (the Remove Duplicates key), and can be filtered
+(explicit, duration, "not already in these playlists").
+
+Memory stays bounded however large the sources are:
+  - the dedupe set holds 8-byte hashes, not track objects;
+  - on the async path at most _PAGES_AHEAD pages are in flight or buffered. They are fetched
+    concurrently across all sources but consumed in source order;
+  - accepted URIs are written 100 at a time while later pages are still being fetched, and the
+    playlist is only created once the first batch is ready.
+"""
+import asyncio
+import hashlib
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+import spotipy
+
+from async_spotify import run_async
+from listening_history import days_ago_ms, get_store as get_history_store
+from spotify_client import (
+    RECENT_30D_ID,
+    RECENT_ID,
+    async_available,
+    canonical_artists,
+    canonical_title,
+    current_user_id,
+    get_async_sp,
+    paginate,
+)
+from utils import safe_get
+
+logger = logging.getLogger(__name__)
+
+# ---------- Constants ----------
+MAX_SOURCES = 20
+MAX_PLAYLIST_TRACKS = 10_000     # Spotify's per-playlist limit
+DEDUPE_MODES = ("uri", "track")
+_PAGE_SIZE = 100
+_PAGES_AHEAD = 8
+_ADD_BATCH = 100
+_ADDABLE_PREFIXES = ("spotify:track:", "spotify:episode:")   # local files can't be added via the API
+
+
+class MergeUserError(Exception):
+    def __init__(self, message: str, status_code: int = 400, code: str = "user_error",
+                 playlist_id: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+        self.playlist_id = playlist_id   # a partly written playlist left behind, if any
+
+
+# ---------- Dedupe and filters ----------
+def dedupe_key(track: Dict[str, Any], mode: str) -> int:
+    if mode == "track":
+        raw = canonical_title(track.get("name")) + "||" + canonical_artists(track.get("artists"))
+    else:
+        raw = track.get("uri") or ""
+    return int.from_bytes(hashlib.blake2b(raw.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class MergeFilters:
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        data = data or {}
+        try:
+            self.exclude_explicit = bool(data.get("exclude_explicit"))
+            self.min_duration_ms = int(data.get("min_duration_ms") or 0)
+            self.max_duration_ms = int(data.get("max_duration_ms") or 0)
+            self.max_tracks = min(int(data.get("max_tracks") or MAX_PLAYLIST_TRACKS), MAX_PLAYLIST_TRACKS)
+        except (TypeError, ValueError) as err:
+            raise MergeUserError("Invalid filter value.", code="invalid_filters") from err
+        self.exclude_playlist_ids: List[str] = [pid for pid in data.get("exclude_playlist_ids") or [] if pid]
+        if len(self.exclude_playlist_ids) > MAX_SOURCES:
+            raise MergeUserError(f"At most {MAX_SOURCES} playlists can be excluded.", code="too_many_sources")
+
+    def allows(self, track: Dict[str, Any]) -> bool:
+        if self.exclude_explicit and track.get("explicit"):
+            return False
+        duration = track.get("duration_ms") or 0
+        if self.min_duration_ms and duration < self.min_duration_ms:
+            return False
+        return not (self.max_duration_ms and duration > self.max_duration_ms)
+
+
+class _Merger:
+    """Decides, one track at a time, whether it goes into the merged playlist."""
+
+    def __init__(self, mode: str, filters: MergeFilters, excluded: Set[int]):
+        self.mode = mode
+        self.filters = filters
+        self.excluded = excluded
+        self.seen: Set[int] = set()
+        self.scanned = self.duplicates = self.filtered = self.accepted = 0
+
+    @property
+    def full(self) -> bool:
+        return self.accepted >= self.filters.max_tracks
+
+    def accept(self, track: Optional[Dict[str, Any]]) -> Optional[str]:
+        uri = safe_get(track, "uri")
+        if not uri or not uri.startswith(_ADDABLE_PREFIXES) or self.full:
+            return None
+        self.scanned += 1
+        key = dedupe_key(track, self.mode)
+        if key in self.seen:
+            self.duplicates += 1
+            return None
+        self.seen.add(key)
+        if key in self.excluded or not self.filters.allows(track):
+            self.filtered += 1
+            return None
+        self.accepted += 1
+        return uri
+
+    def summary(self) -> Dict[str, int]:
+        return {"scanned": self.scanned, "added": self.accepted,
+                "duplicates": self.duplicates, "filtered": self.filtered}
+
+
+def _history_track(row: Dict[str, Any]) -> Dict[str, Any]:
+    """A stored play shaped enough like a track object for dedupe_key and MergeFilters."""
+    return {
+        "uri": row.get("track_uri"),
+        "name": row.get("name"),
+        "artists": [{"name": name} for name in (row.get("artists") or "").split(", ") if name],
+        "explicit": bool(row.get("explicit")),
+        "duration_ms": row.get("duration_ms"),
+    }
+
+
+def _tracks(items: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [track for track in (safe_get(it, "track") for it in items or []) if isinstance(track, dict)]
+
+
+# ---------- Writer ----------
+class _PlaylistWriter:
+    """Creates the target playlist on the first batch and appends to it in order."""
+
+    def __init__(self, sp: spotipy.Spotify, user_id: str, name: str, description: str):
+        self.sp = sp
+        self.user_id = user_id
+        self.name = name
+        self.description = description
+        self.playlist_id: Optional[str] = None
+        self.calls = 0
+
+    def add(self, uris: List[str]) -> None:
+        if not uris:
+            return
+        if self.playlist_id is None:
+            created = self.sp.user_playlist_create(user=self.user_id or current_user_id(self.sp), name=self.name,
+                                                   public=False, description=self.description) or {}
+            self.playlist_id = created.get("id")
+            if not self.playlist_id:
+                raise RuntimeError("playlist_creation_failed")
+        self.sp.playlist_add_items(self.playlist_id, uris)
+        self.calls += 1
+
+
+# ---------- Sync path ----------
+def _iter_source(sp: spotipy.Spotify, user_id: str, source: str) -> Iterator[Dict[str, Any]]:
+    if source == RECENT_ID:
+        yield from _tracks((sp.current_user_recently_played(limit=50) or {}).get("items"))
+    elif source == RECENT_30D_ID:
+        for row in get_history_store().plays_between(user_id, days_ago_ms(30)):
+            yield _history_track(row)
+    else:
+        for item in paginate(lambda o, l: sp.playlist_items(source, limit=l, offset=o), limit=_PAGE_SIZE):
+            track = safe_get(item, "track")
+            if isinstance(track, dict):
+                yield track
+
+
+def _merge_sync(sp: spotipy.Spotify, user_id: str, sources: List[str], merger: _Merger,
+                writer: _PlaylistWriter) -> None:
+    for source in merger.filters.exclude_playlist_ids:
+        merger.excluded.update(dedupe_key(track, merger.mode) for track in _iter_source(sp, user_id, source))
+    batch: List[str] = []
+    for source in sources:
+        for track in _iter_source(sp, user_id, source):
+            uri = merger.accept(track)
+            if uri:
+                batch.append(uri)
+                if len(batch) == _ADD_BATCH:
+                    writer.add(batch)
+                    batch = []
+            if merger.full:
+                break
+        if merger.full:
+            break
+    writer.add(batch)
+
+
+# ---------- Async path ----------
+PageFetcher = Callable[[], Awaitable[List[Dict[str, Any]]]]
+
+
+async def _page_fetchers(client, user_id: str, sources: List[str]) -> List[PageFetcher]:
+    """One fetcher per page of every source, in merge order.
+
+    The first page of every playlist is fetched up front, concurrently, to learn the totals.
+    """
+    def ready(tracks: List[Dict[str, Any]]) -> PageFetcher:
+        async def fetch():
+            return tracks
+        return fetch
+
+    def page(pid: str, offset: int) -> PageFetcher:
+        async def fetch():
+            return _tracks((await client.playlist_items(pid, limit=_PAGE_SIZE, offset=offset) or {}).get("items"))
+        return fetch
+
+    async def first(source: str) -> Dict[str, Any]:
+        if source == RECENT_ID:
+            return await client.current_user_recently_played(limit=50) or {}
+        if source == RECENT_30D_ID:
+            return {"plays": get_history_store().plays_between(user_id, days_ago_ms(30))}
+        return await client.playlist_items(source, limit=_PAGE_SIZE, offset=0) or {}
+
+    firsts = await asyncio.gather(*(first(source) for source in sources))
+    fetchers: List[PageFetcher] = []
+    for source, data in zip(sources, firsts):
+        if source == RECENT_30D_ID:
+            fetchers.append(ready([_history_track(row) for row in data["plays"]]))
+            continue
+        fetchers.append(ready(_tracks(data.get("items"))))
+        if source != RECENT_ID and data.get("next"):
+            fetchers.extend(page(source, offset) for offset in range(_PAGE_SIZE, data.get("total") or 0, _PAGE_SIZE))
+    return fetchers
+
+
+async def _ordered_pages(fetchers: List[PageFetcher], ahead: int = _PAGES_AHEAD) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Run up to `ahead` fetchers concurrently, yielding their pages in fetcher order."""
+    queue = iter(fetchers)
+    pending = deque(asyncio.ensure_future(fetch()) for fetch in _take(queue, ahead))
+    try:
+        while pending:
+            tracks = await pending.popleft()
+            for fetch in _take(queue, 1):
+                pending.append(asyncio.ensure_future(fetch()))
+            yield tracks
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _take(queue: Iterator[PageFetcher], count: int) -> List[PageFetcher]:
+    return [fetch for _, fetch in zip(range(count), queue)]
+
+
+async def _merge_async(user_id: str, sources: List[str], merger: _Merger, writer: _PlaylistWriter) -> None:
+    async with get_async_sp() as client:
+        if merger.filters.exclude_playlist_ids:
+            async for tracks in _ordered_pages(await _page_fetchers(client, user_id, merger.filters.exclude_playlist_ids)):
+                merger.excluded.update(dedupe_key(track, merger.mode) for track in tracks)
+
+        # One write in flight at a time keeps the batches in order while reads continue.
+        write: Optional[asyncio.Future] = None
+        batch: List[str] = []
+        pages = _ordered_pages(await _page_fetchers(client, user_id, sources))
+        try:
+            async for tracks in pages:
+                for track in tracks:
+                    uri = merger.accept(track)
+                    if uri:
+                        batch.append(uri)
+                    if len(batch) == _ADD_BATCH or (batch and merger.full):
+                        if write is not None:
+                            await write
+                        write = asyncio.ensure_future(asyncio.to_thread(writer.add, batch))
+                        batch = []
+                if merger.full:
+                    break
+        finally:
+            await pages.aclose()
+        if write is not None:
+            await write
+        await asyncio.to_thread(writer.add, batch)
+
+
+# ---------- Entry point ----------
+def _discard(sp: spotipy.Spotify, playlist_id: str) -> bool:
+    """Unfollow (Spotify's delete) a partly written merge target; False if that failed too."""
+    try:
+        sp.current_user_unfollow_playlist(playlist_id)
+        logger.warning("Merge failed; removed partial playlist %s", playlist_id)
+        return True
+    except Exception:
+        logger.exception("Merge failed; could not remove partial playlist %s", playlist_id)
+        return False
+
+
+def merge_playlists(sp: spotipy.Spotify, user_id: str, name: str, description: str, sources: List[str],
+                    dedupe: str = "uri", filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Create a playlist from `sources`; returns its id and merge counts. Raises MergeUserError."""
+    if not sources:
+        raise MergeUserError("Select at least one source.", code="missing_sources")
+    if len(sources) > MAX_SOURCES:
+        raise MergeUserError(f"At most {MAX_SOURCES} sources can be merged.", code="too_many_sources")
+    if dedupe not in DEDUPE_MODES:
+        raise MergeUserError("dedupe must be 'uri' or 'track'.", code="invalid_dedupe")
+
+    merger = _Merger(dedupe, MergeFilters(filters), excluded=set())
+    writer = _PlaylistWriter(sp, user_id, name, description)
+    try:
+        if async_available():
+            run_async(_merge_async(user_id, sources, merger, writer))
+        else:
+            _merge_sync(sp, user_id, sources, merger, writer)
+    except Exception as err:
+        if writer.playlist_id is not None and not _discard(sp, writer.playlist_id):
+            raise MergeUserError("The merge failed part way and the partial playlist could not be removed.",
+                                 status_code=502, code="merge_incomplete", playlist_id=writer.playlist_id) from err
+        raise
+
+    if writer.playlist_id is None:
+        raise MergeUserError("No tracks left to add after deduplication and filters.", code="no_tracks")
+    logger.info("Merged %d sources into %s: %s in %d add calls", len(sources), writer.playlist_id,
+                merger.summary(), writer.calls)
+    return {"playlist_id": writer.playlist_id, **merger.summary()}
@@ -0,0 +1,193 @@
+"""Sort a playlist in place with as few reorder calls as possible.
+
+Spotify can only reorder a playlist by moving one contiguous range at a time (range_start,
+range_length, insert_before). Removing everything and adding it back would cost one call per 100
+tracks and wipe the added_at dates. Instead, the engine:
+
+  1. ranks every item by the requested sort key. The sort is stable, so tied items keep their
+     current relative order;
+  2. groups tracks that already sit next to each other in their final order (an album added in
+     one go) into runs, which always move as a unit;
+  3. keeps the longest increasing subsequence of those runs in place. They are already in
+     sorted order relative to each other, so they never need to move;
+  4. moves every other run in ascending order, each directly after the already-placed run that
+     precedes it. Runs that have become adjacent share a single call.
+
+The moves are simulated locally, so each call's positions refer to the playlist as the previous
+call left it. Each call passes the snapshot_id returned by the previous one. A playlist that is
+mostly in order, or made of whole albums, sorts in a handful of calls.
+
+The calls run sequentially inside the request, so callers refuse sorts needing more than
+MAX_MOVES calls (ORPHEUS_REORDER_MAX_MOVES) instead of running into the worker timeout.
+"""
+import logging
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import spotipy
+
+from spotify_client import canonical_title
+from utils import getenv_stripped, safe_get
+
+logger = logging.getLogger(__name__)
+
+# ---------- Constants ----------
+MAX_MOVES = int(getenv_stripped("ORPHEUS_REORDER_MAX_MOVES") or 300)
+
+
+# ---------- Sort keys ----------
+def _first_artist(track: Dict[str, Any]) -> str:
+    artists = safe_get(track, "artists") or []
+    return (safe_get(artists[0], "name") or "").casefold() if artists else ""
+
+
+def _artist_key(item: Dict[str, Any]) -> Tuple:
+    track = safe_get(item, "track") or {}
+    album = safe_get(track, "album") or {}
+    return (
+        _first_artist(track),
+        safe_get(album, "release_date") or "",
+        (safe_get(album, "name") or "").casefold(),
+        safe_get(track, "disc_number") or 0,
+        safe_get(track, "track_number") or 0,
+    )
+
+
+def _added_key(item: Dict[str, Any]) -> Tuple:
+    return (safe_get(item, "added_at") or "",)
+
+
+def _title_key(item: Dict[str, Any]) -> Tuple:
+    track = safe_get(item, "track") or {}
+    return (canonical_title(safe_get(track, "name")), _first_artist(track))
+
+
+SORT_KEYS: Dict[str, Callable[[Dict[str, Any]], Tuple]] = {
+    "artist": _artist_key,
+    "added_at": _added_key,
+    "title": _title_key,
+}
+
+Move = Tuple[int, int, int]   # (range_start, range_length, insert_before)
+
+
+def target_ranks(items: List[Dict[str, Any]], sort: str, descending: bool = False) -> List[int]:
+    """ranks[i] = position the item currently at i should end up at."""
+    key = SORT_KEYS[sort]
+    keys = [key(it) for it in items]
+    # Python's sort is stable even with reverse=True, so ties keep the playlist's current order.
+    order = sorted(range(len(items)), key=keys.__getitem__, reverse=descending)
+    ranks = [0] * len(items)
+    for rank, pos in enumerate(order):
+        ranks[pos] = rank
+    return ranks
+
+
+def _longest_increasing(ranks: List[int]) -> List[int]:
+    """Ranks forming one longest increasing subsequence (patience sorting, O(n log n))."""
+    tails: List[int] = []          # tails[k] = smallest rank ending an increasing run of length k+1
+    tail_pos: List[int] = []
+    parent = [-1] * len(ranks)
+    for pos, rank in enumerate(ranks):
+        k = bisect_left(tails, rank)
+        if k == len(tails):
+            tails.append(rank)
+            tail_pos.append(pos)
+        else:
+            tails[k] = rank
+            tail_pos[k] = pos
+        parent[pos] = tail_pos[k - 1] if k else -1
+    keep = []
+    pos = tail_pos[-1] if tail_pos else -1
+    while pos != -1:
+        keep.append(ranks[pos])
+        pos = parent[pos]
+    return keep
+
+
+def plan_moves(ranks: List[int]) -> List[Move]:
+    """Range moves that turn the current order into the sorted one, each relative to the previous."""
+    # Tracks already adjacent in their final order (an album added in one go) move as a unit.
+    runs: List[List[int]] = []
+    for rank in ranks:
+        if runs and rank == runs[-1][-1] + 1:
+            runs[-1].append(rank)
+        else:
+            runs.append([rank])
+    by_first = sorted(range(len(runs)), key=lambda i: runs[i][0])
+    run_rank = [0] * len(runs)
+    for order, i in enumerate(by_first):
+        run_rank[i] = order
+
+    n = len(runs)
+    placed = [False] * n
+    for rank in _longest_increasing(run_rank):
+        placed[rank] = True
+
+    current = list(run_rank)       # simulated playlist, as run ranks
+    lengths = [len(run) for run in runs]   # track count of each entry in current
+    moves: List[Move] = []
+    rank = 0
+    while rank < n:
+        if placed[rank]:
+            rank += 1
+            continue
+        start = current.index(rank)
+        count = 1
+        while (rank + count < n and not placed[rank + count] and start + count < n
+               and current[start + count] == rank + count):
+            count += 1
+        # Everything placed so far is already in sorted order, so the runs belong right after
+        # their predecessor (or at the very top when they have none).
+        insert_before = current.index(rank - 1) + 1 if rank else 0
+        if insert_before not in (start, start + count):
+            moves.append((sum(lengths[:start]), sum(lengths[start:start + count]), sum(lengths[:insert_before])))
+            at = insert_before - count if insert_before > start else insert_before
+            for seq in (current, lengths):
+                block = seq[start:start + count]
+                del seq[start:start + count]
+                seq[at:at] = block
+        for r in range(rank, rank + count):
+            placed[r] = True
+        rank += count
+    return moves
+
+
+def plan_reorder(items: List[Dict[str, Any]], sort: str, descending: bool = False) -> List[Move]:
+    """Moves sorting the playlist whose current items (in order) are `items`."""
+    return plan_moves(target_ranks(items, sort, descending))
+
+
+def move_summary(moves: List[Move], dry_run: bool) -> Dict[str, Any]:
+    return {
+        "dry_run": dry_run,
+        "moves": len(moves),
+        "moved_tracks": sum(length for _, length, _ in moves),
+    }
+
+
+def apply_moves(sp: spotipy.Spotify, playlist_id: str, moves: List[Move], snapshot_id: str = None) -> str:
+    """Run planned moves in order, chaining snapshot ids; returns the final snapshot_id."""
+    for range_start, range_length, insert_before in moves:
+        result = sp.playlist_reorder_items(playlist_id, range_start=range_start, insert_before=insert_before,
+                                           range_length=range_length, snapshot_id=snapshot_id) or {}
+        snapshot_id = result.get("snapshot_id") or snapshot_id
+    return snapshot_id
+
+
+def reorder_playlist(sp: spotipy.Spotify, playlist_id: str, items: List[Dict[str, Any]], sort: str,
+                     descending: bool = False, snapshot_id: str = None, dry_run: bool = False,
+                     moves: Optional[List[Move]] = None) -> Dict[str, Any]:
+    """Sort the playlist whose current items (in order) are `items`; returns the moves made.
+
+    With dry_run the moves are only planned, so callers can show what a sort would cost. Pass
+    `moves` from plan_reorder() to skip planning again.
+    """
+    if moves is None:
+        moves = plan_reorder(items, sort, descending)
+    summary = move_summary(moves, dry_run)
+    if dry_run:
+        return {**summary, "snapshot_id": snapshot_id}
+    snapshot_id = apply_moves(sp, playlist_id, moves, snapshot_id)
+    logger.info("Sorted playlist %s by %s: %d tracks, %d moves", playlist_id, sort, len(items), len(moves))
+    return {**summary, "snapshot_id": snapshot_id}
@@ -0,0 +1,436 @@
+"""Version history of playlists, so destructive edits can be inspected and undone.
+
+Before Remove Duplicates, Filter Sweep, a reorder or a restore rewrites a playlist, its current
+track list is recorded as a new version (keyed by Spotify's snapshot_id). Identical contents are
+never stored twice.
+
+Storage is kept small:
+  - track URIs are interned once into integer ids (track_ids table);
+  - each version stores a delta from the previous one as copy runs ("positions start..start+n of
+    the previous version") and literal runs of new ids. Varint-packed and zlib-compressed, a
+    version that removed a handful of tracks costs a few dozen bytes;
+  - every _CHECKPOINT_EVERY versions (or when a delta would be no smaller) the full list is stored,
+    so rebuilding any version replays at most that many deltas;
+  - only the newest ORPHEUS_PLAYLIST_VERSIONS_MAX versions per playlist are kept.
+
+plan_restore() works out the fewest writes that turn the live playlist into a stored version: it
+removes surplus occurrences, appends missing tracks (100 per call) and then fixes the order with
+playlist_reorder's range moves, so tracks that survive keep their added_at dates. The plan is
+costed before restore_playlist() writes anything, so callers can refuse one that would not
+finish inside a request.
+"""
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict, deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import spotipy
+
+from playlist_reorder import Move, apply_moves, plan_moves
+from utils import data_dir, getenv_stripped, safe_get
+
+logger = logging.getLogger(__name__)
+
+# ---------- Constants ----------
+VERSIONS_ENABLED = getenv_stripped("ORPHEUS_PLAYLIST_VERSIONS") != "0"
+_MAX_VERSIONS = int(getenv_stripped("ORPHEUS_PLAYLIST_VERSIONS_MAX") or 1000)
+_CHECKPOINT_EVERY = 64
+_LATEST_CACHE = 64           # decoded newest versions kept in memory
+_ID_CACHE = 200_000          # interned URI -> id entries kept in memory
+_MATCH_CANDIDATES = 4        # previous positions tried per track when looking for a copy run
+_MIN_COPY = 3                # shorter matches are cheaper as literals
+_SQL_CHUNK = 500
+_WRITE_BATCH = 100
+_LOCAL_PREFIX = "spotify:local:"
+
+_COPY, _LITERAL = 0, 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS track_ids (
+    id  INTEGER PRIMARY KEY,
+    uri TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS versions (
+    user_id     TEXT    NOT NULL,
+    playlist_id TEXT    NOT NULL,
+    version     INTEGER NOT NULL,
+    snapshot_id TEXT,
+    ts          REAL    NOT NULL,
+    reason      TEXT,
+    tracks      INTEGER NOT NULL,
+    full        INTEGER NOT NULL,  -- 1: delta holds the whole list (checkpoint)
+    delta       BLOB    NOT NULL,
+    PRIMARY KEY (user_id, playlist_id, version)
+) WITHOUT ROWID;
+"""
+
+
+# ---------- Delta encoding ----------
+def _pack(values: List[int]) -> bytes:
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return zlib.compress(bytes(out))
+
+
+def _unpack(blob: bytes) -> List[int]:
+    values: List[int] = []
+    value = shift = 0
+    for byte in zlib.decompress(blob):
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+def encode_delta(previous: List[int], current: List[int]) -> List[int]:
+    """Ops rebuilding `current` from `previous`: [COPY, start, length] and [LITERAL, count, *ids]."""
+    positions: Dict[int, List[int]] = {}
+    for pos, tid in enumerate(previous):
+        positions.setdefault(tid, []).append(pos)
+    ops: List[int] = []
+    literal: List[int] = []
+
+    def flush() -> None:
+        if literal:
+            ops.extend((_LITERAL, len(literal), *literal))
+            literal.clear()
+
+    i, n, m = 0, len(current), len(previous)
+    while i < n:
+        best_start, best_len = 0, 0
+        for start in positions.get(current[i], ())[:_MATCH_CANDIDATES]:
+            length = 1
+            while i + length < n and start + length < m and current[i + length] == previous[start + length]:
+                length += 1
+            if length > best_len:
+                best_start, best_len = start, length
+        if best_len >= _MIN_COPY:
+            flush()
+            ops.extend((_COPY, best_start, best_len))
+            i += best_len
+        else:
+            literal.append(current[i])
+            i += 1
+    flush()
+    return ops
+
+
+def apply_delta(previous: List[int], ops: List[int]) -> List[int]:
+    out: List[int] = []
+    i = 0
+    while i < len(ops):
+        if ops[i] == _COPY:
+            out.extend(previous[ops[i + 1]:ops[i + 1] + ops[i + 2]])
+            i += 3
+        else:
+            count = ops[i + 1]
+            out.extend(ops[i + 2:i + 2 + count])
+            i += 2 + count
+    return out
+
+
+def diff_counts(before: Iterable[str], after: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """(added, removed) URIs between two track lists, counting repeated tracks."""
+    before_counts, after_counts = Counter(before), Counter(after)
+    added = list((after_counts - before_counts).elements())
+    removed = list((before_counts - after_counts).elements())
+    return added, removed
+
+
+# ---------- Store ----------
+class PlaylistVersionStore:
+    def __init__(self, path=None, max_versions: int = _MAX_VERSIONS):
+        self.path = path or data_dir() / "playlist_versions.sqlite3"
+        self.max_versions = max_versions
+        self._lock = threading.Lock()
+        self._latest: "OrderedDict[Tuple[str, str], Tuple[int, List[int]]]" = OrderedDict()
+        self._ids: Dict[str, int] = {}
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    # ---------- Writes ----------
+    def record(self, user_id: str, playlist_id: str, snapshot_id: Optional[str], uris: List[str],
+               reason: str) -> int:
+        """Store the playlist's track list as a new version (unless unchanged); returns its number."""
+        with self._lock:
+            ids = self._intern(uris)
+            # Other workers write to the same file, so the next number is read under the write lock
+            # rather than taken from this process's cache.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                latest_version, previous = self._latest_ids(user_id, playlist_id)
+                if latest_version and previous == ids:
+                    self._conn.rollback()
+                    return latest_version
+                version = latest_version + 1
+                last_full = self._conn.execute(
+                    "SELECT MAX(version) FROM versions WHERE user_id = ? AND playlist_id = ? AND full = 1",
+                    (user_id, playlist_id)).fetchone()[0] or 0
+                ops = encode_delta(previous, ids)
+                full = not latest_version or version - last_full >= _CHECKPOINT_EVERY or len(ops) >= len(ids) + 2
+                if full:
+                    ops = encode_delta([], ids)
+                self._conn.execute("INSERT INTO versions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (user_id, playlist_id, version, snapshot_id, time.time(), reason,
+                                    len(ids), int(full), _pack(ops)))
+                self._prune(user_id, playlist_id, version)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                self._latest.pop((user_id, playlist_id), None)
+                raise
+            self._remember(user_id, playlist_id, version, ids)
+        return version
+
+    def _prune(self, user_id: str, playlist_id: str, newest: int) -> None:
+        cutoff = newest - self.max_versions + 1
+        if cutoff <= 1:
+            return
+        # Keep the checkpoint the oldest retained version is rebuilt from.
+        keep_from = self._conn.execute(
+            "SELECT MAX(version) FROM versions WHERE user_id = ? AND playlist_id = ? AND full = 1 AND version <= ?",
+            (user_id, playlist_id, cutoff)).fetchone()[0]
+        if keep_from:
+            self._conn.execute("DELETE FROM versions WHERE user_id = ? AND playlist_id = ? AND version < ?",
+                               (user_id, playlist_id, keep_from))
+
+    def _intern(self, uris: List[str]) -> List[int]:
+        # Ids never change once assigned, so known ones are served from memory.
+        unknown = [u for u in dict.fromkeys(uris) if u not in self._ids]
+        if unknown:
+            if len(self._ids) + len(unknown) > _ID_CACHE:
+                self._ids.clear()
+            with self._conn:
+                self._conn.executemany("INSERT OR IGNORE INTO track_ids (uri) VALUES (?)", ((u,) for u in unknown))
+            for start in range(0, len(unknown), _SQL_CHUNK):
+                chunk = unknown[start:start + _SQL_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                for tid, uri in self._conn.execute(f"SELECT id, uri FROM track_ids WHERE uri IN ({marks})", chunk):
+                    self._ids[uri] = tid
+        return [self._ids[u] for u in uris]
+
+    def _uris(self, ids: List[int]) -> List[str]:
+        unique = list(dict.fromkeys(ids))
+        uris: Dict[int, str] = {}
+        for start in range(0, len(unique), _SQL_CHUNK):
+            chunk = unique[start:start + _SQL_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            uris.update((r[0], r[1]) for r in self._conn.execute(
+                f"SELECT id, uri FROM track_ids WHERE id IN ({marks})", chunk))
+        return [uris[i] for i in ids]
+
+    # ---------- Reads ----------
+    def _remember(self, user_id: str, playlist_id: str, version: int, ids: List[int]) -> None:
+        self._latest[(user_id, playlist_id)] = (version, ids)
+        self._latest.move_to_end((user_id, playlist_id))
+        while len(self._latest) > _LATEST_CACHE:
+            self._latest.popitem(last=False)
+
+    def _latest_ids(self, user_id: str, playlist_id: str) -> Tuple[int, List[int]]:
+        latest = self._conn.execute("SELECT MAX(version) FROM versions WHERE user_id = ? AND playlist_id = ?",
+                                    (user_id, playlist_id)).fetchone()[0]
+        if not latest:
+            return 0, []
+        cached = self._latest.get((user_id, playlist_id))
+        if cached is not None and cached[0] == latest:
+            return cached
+        ids = self._rebuild(user_id, playlist_id, latest)
+        self._remember(user_id, playlist_id, latest, ids)
+        return latest, ids
+
+    def _rebuild(self, user_id: str, playlist_id: str, version: int) -> List[int]:
+        rows = self._conn.execute(
+            "SELECT full, delta FROM versions WHERE user_id = ? AND playlist_id = ? AND version <= ? AND version >= "
+            "(SELECT MAX(version) FROM versions WHERE user_id = ? AND playlist_id = ? AND full = 1 AND version <= ?) "
+            "ORDER BY version", (user_id, playlist_id, version, user_id, playlist_id, version)).fetchall()
+        ids: List[int] = []
+        for row in rows:
+            ids = apply_delta([] if row["full"] else ids, _unpack(row["delta"]))
+        return ids
+
+    def exists(self, user_id: str, playlist_id: str, version: int) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM versions WHERE user_id = ? AND playlist_id = ? AND version = ?",
+                (user_id, playlist_id, version)).fetchone() is not None
+
+    def tracks(self, user_id: str, playlist_id: str, version: int) -> List[str]:
+        """Track URIs of one version, in playlist order."""
+        with self._lock:
+            cached = self._latest.get((user_id, playlist_id))
+            ids = cached[1] if cached and cached[0] == version else self._rebuild(user_id, playlist_id, version)
+            return self._uris(ids)
+
+    def versions(self, user_id: str, playlist_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, snapshot_id, ts, reason, tracks, full, LENGTH(delta) AS bytes FROM versions "
+                "WHERE user_id = ? AND playlist_id = ? ORDER BY version DESC LIMIT ?",
+                (user_id, playlist_id, limit)).fetchall()
+        return [{**dict(r), "full": bool(r["full"])} for r in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT playlist_id), COALESCE(SUM(LENGTH(delta)), 0) FROM versions"
+            ).fetchone()
+            tracks = self._conn.execute("SELECT COUNT(*) FROM track_ids").fetchone()[0]
+        return {"versions": row[0], "playlists": row[1], "delta_bytes": row[2], "interned_tracks": tracks}
+
+
+_store: Optional[PlaylistVersionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_version_store() -> PlaylistVersionStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PlaylistVersionStore()
+        return _store
+
+
+def item_uris(items: Iterable[Dict[str, Any]], keep_missing: bool = False) -> List[Optional[str]]:
+    """Track URIs of playlist items; with keep_missing, None holds the place of unavailable ones."""
+    uris = [safe_get(safe_get(it, "track"), "uri") for it in items or []]
+    return [uri or None for uri in uris] if keep_missing else [uri for uri in uris if uri]
+
+
+def record_playlist_uris(user_id: Optional[str], playlist_id: str, snapshot_id: Optional[str],
+                         uris: List[str], reason: str) -> Optional[int]:
+    """Record a track list as a new version; returns its number, or None when versions are off or it failed."""
+    if not (VERSIONS_ENABLED and user_id and playlist_id):
+        return None
+    try:
+        return get_version_store().record(user_id, playlist_id, snapshot_id, uris, reason)
+    except sqlite3.Error:
+        logger.exception("Could not record a version of playlist %s", playlist_id)
+        return None
+
+
+def record_playlist_version(user_id: Optional[str], playlist_id: str, snapshot_id: Optional[str],
+                            items: Iterable[Dict[str, Any]], reason: str) -> Optional[int]:
+    """Record playlist items a request already fetched, before it changes the playlist."""
+    return record_playlist_uris(user_id, playlist_id, snapshot_id, item_uris(items), reason)
+
+
+# ---------- Restore ----------
+class RestorePlan:
+    """Every write that turns a playlist from `current` into `target`, simulated up front.
+
+    Removal batches hold {"uri", "positions"} entries whose positions already account for the
+    batches before them, so the plan can be costed (and refused) before anything is written.
+    """
+
+    def __init__(self, removals: List[List[Dict[str, Any]]], adds: List[List[str]], moves: List[Move],
+                 target: List[str]):
+        self.removals = removals
+        self.adds = adds
+        self.moves = moves
+        self.target = target
+
+    @property
+    def calls(self) -> int:
+        return len(self.removals) + len(self.adds) + len(self.moves)
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "removed": sum(len(entry["positions"]) for batch in self.removals for entry in batch),
+            "added": sum(len(batch) for batch in self.adds),
+            "moves": len(self.moves),
+            "calls": self.calls,
+        }
+
+
+def plan_restore(current: List[Optional[str]], target: List[str]) -> RestorePlan:
+    """Plan the fewest writes from `current` to `target` (both URI lists).
+
+    `current` must hold one entry per playlist position (item_uris(..., keep_missing=True)), since
+    removals and moves address positions. Unavailable items (None) can't be addressed by URI, so
+    they are kept and end up after the restored tracks.
+    """
+    # Local files can't be added through the API, so ones no longer in the playlist are left out.
+    local_left = Counter(uri for uri in current if uri and uri.startswith(_LOCAL_PREFIX))
+    restorable: List[str] = []
+    for uri in target:
+        if uri.startswith(_LOCAL_PREFIX):
+            if not local_left[uri]:
+                continue
+            local_left[uri] -= 1
+        restorable.append(uri)
+    target = restorable
+
+    playlist = list(current)
+    wanted = Counter(target)
+
+    # 1. Remove surplus occurrences, keeping the earliest ones (and their added_at dates).
+    removals: List[List[Dict[str, Any]]] = []
+    while True:
+        kept: Counter = Counter()
+        surplus: Dict[str, List[int]] = {}
+        for pos, uri in enumerate(playlist):
+            if uri is None:
+                continue
+            kept[uri] += 1
+            if kept[uri] > wanted[uri] and (uri in surplus or len(surplus) < _WRITE_BATCH):
+                surplus.setdefault(uri, []).append(pos)
+        if not surplus:
+            break
+        removals.append([{"uri": uri, "positions": positions} for uri, positions in surplus.items()])
+        drop = {pos for positions in surplus.values() for pos in positions}
+        playlist = [uri for pos, uri in enumerate(playlist) if pos not in drop]
+
+    # 2. Append what is missing, in target order.
+    have = Counter(playlist)
+    missing: List[str] = []
+    for uri in target:
+        if have[uri]:
+            have[uri] -= 1
+        else:
+            missing.append(uri)
+    playlist.extend(missing)
+
+    # 3. Move everything into place; the k-th copy of a track goes to its k-th target position.
+    slots: Dict[Optional[str], deque] = {}
+    for pos, uri in enumerate(target):
+        slots.setdefault(uri, deque()).append(pos)
+    slots[None] = deque(range(len(target), len(playlist)))
+    moves = plan_moves([slots[uri].popleft() for uri in playlist])
+    adds = [missing[i:i + _WRITE_BATCH] for i in range(0, len(missing), _WRITE_BATCH)]
+    return RestorePlan(removals, adds, moves, target)
+
+
+def restore_playlist(sp: spotipy.Spotify, playlist_id: str, plan: RestorePlan,
+                     snapshot_id: Optional[str] = None) -> Dict[str, Any]:
+    """Run a plan_restore() plan; returns its counts and the final snapshot_id.
+
+    Each write depends on the positions the previous one left behind, so they are batched and
+    chained on snapshot_id rather than sent concurrently.
+    """
+    for batch in plan.removals:
+        result = sp.playlist_remove_specific_occurrences_of_items(playlist_id, batch, snapshot_id=snapshot_id) or {}
+        snapshot_id = result.get("snapshot_id") or snapshot_id
+    for batch in plan.adds:
+        result = sp.playlist_add_items(playlist_id, batch) or {}
+        snapshot_id = result.get("snapshot_id") or snapshot_id
+    snapshot_id = apply_moves(sp, playlist_id, plan.moves, snapshot_id)
+    summary = plan.summary()
+    logger.info("Restored playlist %s: %d removed, %d added, %d moves", playlist_id,
+                summary["removed"], summary["added"], summary["moves"])
+    return {**summary, "snapshot_id": snapshot_id}
@@ -0,0 +1,116 @@
+"""Opt-in sampling profiler for individual requests.
+
+A request is profiled when it carries `X-Orpheus-Profile: <ORPHEUS_PROFILE_TOKEN>` or when it is
+picked by ORPHEUS_PROFILE_SAMPLE_RATE (0.0-1.0). A background thread samples the request thread's
+stack every ORPHEUS_PROFILE_INTERVAL_MS and, when the request finishes, writes folded stacks
+(`frame;frame;frame count` per line) to ORPHEUS_PROFILE_DIR. The files feed straight into
+flamegraph.pl, speedscope or inferno.
+
+Sampled stacks include time blocked on I/O, so a stack ending in a socket read is upstream wait
+and one ending in canonical_title or JSON encoding is CPU.
+"""
+import hmac
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+from flask import Flask, Response, g, request
+
+from utils import getenv_stripped
+
+logger = logging.getLogger(__name__)
+
+# ---------- Constants ----------
+PROFILE_HEADER = "X-Orpheus-Profile"
+_PROFILE_TOKEN = getenv_stripped("ORPHEUS_PROFILE_TOKEN")
+_SAMPLE_RATE = float(getenv_stripped("ORPHEUS_PROFILE_SAMPLE_RATE") or 0)
+_INTERVAL_S = float(getenv_stripped("ORPHEUS_PROFILE_INTERVAL_MS") or 5) / 1000
+_PROFILE_DIR = Path(getenv_stripped("ORPHEUS_PROFILE_DIR") or "profiles")
+_MAX_DEPTH = 128
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a fixed interval and aggregates folded stacks."""
+
+    def __init__(self, thread_id: int, interval_s: float = _INTERVAL_S):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="orpheus-profiler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            parts = []
+            while frame is not None and len(parts) < _MAX_DEPTH:
+                code = frame.f_code
+                parts.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(parts))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _should_profile() -> bool:
+    header = request.headers.get(PROFILE_HEADER)
+    if header and _PROFILE_TOKEN and hmac.compare_digest(header, _PROFILE_TOKEN):
+        return True
+    return _SAMPLE_RATE > 0 and random.random() < _SAMPLE_RATE
+
+
+def _start_profile() -> None:
+    if _should_profile():
+        g.profiler = StackSampler(threading.get_ident()).start()
+
+
+def _finish_profile(resp: Response) -> Response:
+    sampler: Optional[StackSampler] = g.pop("profiler", None)
+    if sampler is None:
+        return resp
+    sampler.stop()
+    rule = (request.url_rule.rule if request.url_rule else request.path).strip("/").replace("/", "_")
+    rule = "".join(ch if ch.isalnum() or ch in "_-" else "" for ch in rule) or "root"
+    path = _PROFILE_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{rule}-{threading.get_ident()}.folded"
+    try:
+        _PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        path.write_text(sampler.folded())
+        resp.headers[PROFILE_HEADER] = f"{path.name}; samples={sampler.samples}"
+        logger.info("Wrote request profile %s (%d samples)", path, sampler.samples)
+    except OSError:
+        logger.exception("Could not write request profile %s", path)
+    return resp
+
+
+def _abandon_profile(_exc: Optional[BaseException]) -> None:
+    # Unhandled exceptions skip after_request; make sure the sampler thread still stops.
+    sampler: Optional[StackSampler] = g.pop("profiler", None)
+    if sampler is not None:
+        sampler.stop()
+
+
+def register_profiler(app: Flask) -> None:
+    """Enable per-request profiling when a profile token or sample rate is configured."""
+    if not _PROFILE_TOKEN and _SAMPLE_RATE <= 0:
+        return
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_abandon_profile)
@@ -0,0 +1,217 @@
+"""Local co-occurrence recommender over the playlists the library index holds for one user.
+
+Tracks that share playlists with the seeds are recommended. Each user gets their own model, built
+only from the playlists they loaded, so a recommendation can never surface a track that only
+appears in another user's (possibly private) playlist. The model keeps a track x playlist and
+an artist x playlist incidence matrix in CSR form (sparse.CSR, also behind genres.GenreMatrix),
+with the playlist x track orientation too. A request:
+
+  1. gives every playlist containing a seed a weight (1 / log2(2 + playlist length), so a 20-track
+     playlist says more about taste than a 5,000-track dump; artist and genre seeds count less
+     than track seeds),
+  2. sums those weights onto each track of the weighted playlists (one bincount),
+  3. divides by sqrt(track playlist count) so ubiquitous tracks do not win on volume alone.
+
+The model syncs with the library index on use. Only playlists whose indexed_at changed are
+re-read from SQLite, and the flat CSR arrays are then rebuilt from the per-playlist lists. Apart
+from a user's very first request, that rebuild runs on a background thread: requests keep scoring
+against the previous matrices until the new ones are swapped in.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from library_index import LibraryIndex, get_library_index
+from sparse import CSR
+from utils import getenv_stripped
+
+logger = logging.getLogger(__name__)
+
+# ---------- Constants ----------
+_SYNC_INTERVAL_S = float(getenv_stripped("ORPHEUS_RECS_SYNC_S") or 10)
+_MAX_MODELS = 32             # per-user models kept in memory, least recently used dropped first
+TRACK_SEED_WEIGHT = 1.0
+ARTIST_SEED_WEIGHT = 0.6
+GENRE_SEED_WEIGHT = 0.3
+
+
+class _Matrices:
+    """Immutable CSR snapshot; scoring reads it without holding the model lock."""
+
+    def __init__(self, playlists: List[Tuple[List[int], List[int]]], n_tracks: int, n_artists: int):
+        self.n_tracks = n_tracks
+        self.n_artists = n_artists
+        self.n_playlists = len(playlists)
+        self.playlist_tracks = CSR.from_rows([tracks for tracks, _ in playlists], n_tracks)
+        self.track_playlists = self.playlist_tracks.transpose()
+        self.artist_playlists = CSR.from_rows([artists for _, artists in playlists], n_artists).transpose()
+        self.playlist_weight = 1.0 / np.log2(2 + self.playlist_tracks.row_lengths())
+        self.track_degree = np.maximum(self.track_playlists.row_lengths(), 1).astype(np.float64)
+
+    def score(self, seed_tracks: Sequence[int], seed_artists: Sequence[Tuple[int, float]],
+              limit: int) -> List[Tuple[int, float]]:
+        if not self.n_playlists:
+            return []
+        pw = np.zeros(self.n_playlists, dtype=np.float64)
+        for t in seed_tracks:
+            idx = self.track_playlists.row(t)
+            pw[idx] += self.playlist_weight[idx] * TRACK_SEED_WEIGHT
+        for a, weight in seed_artists:
+            idx = self.artist_playlists.row(a)
+            pw[idx] += self.playlist_weight[idx] * weight
+
+        active = np.flatnonzero(pw)
+        if not active.size:
+            return []
+        entries = self.playlist_tracks.gather(active)
+        if not entries.size:
+            return []   # only empty playlists matched (an artist seed on a track-less playlist)
+        weights = np.repeat(pw[active], self.playlist_tracks.row_lengths(active))
+        scores = np.bincount(entries, weights=weights, minlength=self.n_tracks)
+        scores /= np.sqrt(self.track_degree)
+        if len(seed_tracks):
+            scores[np.asarray(seed_tracks, dtype=np.int64)] = 0.0
+
+        candidates = np.flatnonzero(scores)
+        if candidates.size > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(t), float(scores[t])) for t in ranked]
+
+
+class CooccurrenceModel:
+    """One user's model. Matrices are replaced whole, so a request scores against one snapshot."""
+
+    def __init__(self, user_id: str, index: Optional[LibraryIndex] = None):
+        self.user_id = user_id
+        self._index = index
+        self._lock = threading.Lock()
+        self._versions: Dict[str, float] = {}
+        self._playlists: Dict[str, Tuple[List[int], List[int]]] = {}
+        self.track_ids: Dict[str, int] = {}
+        self.track_keys: List[str] = []
+        self.artist_ids: Dict[str, int] = {}
+        self._matrices: Optional[_Matrices] = None
+        self._synced_at = 0.0
+
+    @property
+    def index(self) -> LibraryIndex:
+        return self._index or get_library_index()
+
+    def _intern(self, table: Dict[str, int], key: str, keys: Optional[List[str]] = None) -> int:
+        value = table.get(key)
+        if value is None:
+            value = table[key] = len(table)
+            if keys is not None:
+                keys.append(key)
+        return value
+
+    def sync(self, force: bool = False) -> bool:
+        """Pull playlists (re)indexed since the last sync; returns True when the model changed."""
+        with self._lock:
+            if not force and time.time() - self._synced_at < _SYNC_INTERVAL_S and self._matrices is not None:
+                return False
+            self._synced_at = time.time()
+            versions = self.index.playlist_versions(self.user_id)
+            changed = [pid for pid, ts in versions.items() if self._versions.get(pid) != ts]
+            removed = [pid for pid in self._versions if pid not in versions]
+            if not changed and not removed and self._matrices is not None:
+                return False
+
+            for pid in removed:
+                self._playlists.pop(pid, None)
+            for pid, rows in self.index.playlist_tracks(self.user_id, changed).items():
+                tracks = list(dict.fromkeys(self._intern(self.track_ids, tid, self.track_keys) for tid, _ in rows))
+                artists = list(dict.fromkeys(self._intern(self.artist_ids, aid)
+                                             for _, ids in rows for aid in (ids or "").split(",") if aid))
+                self._playlists[pid] = (tracks, artists)
+            self._versions = versions
+
+            start = time.perf_counter()
+            self._matrices = _Matrices(list(self._playlists.values()), len(self.track_ids), len(self.artist_ids))
+            logger.info("Rebuilt co-occurrence model for %s: %d playlists (%d changed, %d removed), "
+                        "%d tracks in %.0f ms", self.user_id, len(self._playlists), len(changed), len(removed),
+                        len(self.track_ids), (time.perf_counter() - start) * 1000)
+            return True
+
+    def sync_due(self) -> bool:
+        return self._matrices is None or time.time() - self._synced_at >= _SYNC_INTERVAL_S
+
+    def recommend(self, seed_tracks: Sequence[str], seed_artists: Sequence[str] = (),
+                  genre_artists: Sequence[str] = (), limit: int = 100) -> List[Tuple[str, float]]:
+        """[(track_id, score)] best first; seeds the model has never seen are ignored."""
+        if self._matrices is None:
+            self.sync()   # nothing to serve yet
+        elif self.sync_due():
+            _rebuilder.submit(self)
+        matrices = self._matrices
+        if matrices is None:
+            return []
+        # Ids interned by a rebuild still in progress are past the end of this snapshot.
+        tracks = [i for i in (self.track_ids.get(t) for t in seed_tracks) if i is not None and i < matrices.n_tracks]
+        artist_weights: Dict[int, float] = {}
+        for ids, weight in ((genre_artists, GENRE_SEED_WEIGHT), (seed_artists, ARTIST_SEED_WEIGHT)):
+            for aid in ids:
+                i = self.artist_ids.get(aid)
+                if i is not None and i < matrices.n_artists:
+                    artist_weights[i] = weight
+        if not tracks and not artist_weights:
+            return []
+        return [(self.track_keys[t], score)
+                for t, score in matrices.score(tracks, list(artist_weights.items()), limit)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"playlists": len(self._playlists), "tracks": len(self.track_ids),
+                "artists": len(self.artist_ids)}
+
+
+class _Rebuilder:
+    """Syncs models on one background thread, so requests never wait on a matrix rebuild."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: "OrderedDict[str, CooccurrenceModel]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, model: CooccurrenceModel) -> None:
+        with self._cond:
+            if model.user_id in self._pending:
+                return
+            self._pending[model.user_id] = model
+            # Started lazily so preloaded gunicorn masters don't fork a running thread.
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="recs-rebuilder", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                user_id, model = self._pending.popitem(last=False)
+            try:
+                model.sync()
+            except Exception:
+                logger.exception("Could not rebuild the co-occurrence model for %s", user_id)
+
+
+_rebuilder = _Rebuilder()
+
+_models: "OrderedDict[str, CooccurrenceModel]" = OrderedDict()
+_model_lock = threading.Lock()
+
+
+def get_model(user_id: str) -> CooccurrenceModel:
+    with _model_lock:
+        model = _models.get(user_id)
+        if model is None:
+            model = _models[user_id] = CooccurrenceModel(user_id)
+            while len(_models) > _MAX_MODELS:
+                _models.popitem(last=False)
+        _models.move_to_end(user_id)
+        return model
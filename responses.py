@@ -0,0 +1,141 @@
+import gzip
+import hashlib
+from typing import Any, Dict, Optional
+
+from flask import Flask, Response, current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to Flask's JSON provider
+    orjson = None
+
+# ---------- Constants ----------
+_MIN_COMPRESS_BYTES = 1024
+_GZIP_LEVEL = 6
+_BROTLI_QUALITY = 5
+_COMPRESSIBLE_MIMETYPES = {"application/json", "text/html", "text/plain", "text/css", "application/javascript"}
+_API_CACHE_CONTROL = "private, no-cache"
+
+
+# ---------- Encoding ----------
+def encode_json(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return current_app.json.dumps(data).encode("utf-8")
+
+
+def body_etag(body: bytes) -> str:
+    return hashlib.sha1(body).hexdigest()
+
+
+def json_bytes_response(body: bytes, etag: str, status: int = 200) -> Response:
+    resp = current_app.response_class(body, status=status, mimetype="application/json")
+    resp.set_etag(etag)
+    return resp
+
+
+def cached_json_response(entry: Dict[str, Any]) -> Response:
+    """Serve a cache entry ({"ts", "data"}) from bytes encoded and compressed once, on first use.
+
+    The entry gains "body", "etag" and "encoded" ({encoding: bytes}) keys; later hits only pick
+    the right variant, so neither JSON encoding nor compression is repeated.
+    """
+    body = entry.get("body")
+    if body is None:
+        body = encode_json(entry["data"])
+        entry["body"] = body
+        entry["etag"] = body_etag(body)
+        entry["encoded"] = {}
+    etag = entry["etag"]
+
+    matched = _matching_etag(etag)
+    if matched:
+        return _not_modified(matched)
+
+    encoding = _accepted_encoding() if len(body) >= _MIN_COMPRESS_BYTES else ""
+    if not encoding:
+        resp = json_bytes_response(body, etag)
+    else:
+        encoded = entry["encoded"].get(encoding)
+        if encoded is None:
+            encoded = _compress(body, encoding)
+            entry["encoded"][encoding] = encoded
+        resp = json_bytes_response(encoded, f"{etag}-{encoding}")
+        resp.headers["Content-Encoding"] = encoding
+    resp.headers["Cache-Control"] = _API_CACHE_CONTROL
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+# ---------- Conditional requests / compression ----------
+def _matching_etag(etag: str) -> Optional[str]:
+    # Compressed variants carry a suffixed ETag, so accept any of them as a match.
+    for candidate in (etag, f"{etag}-gzip", f"{etag}-br"):
+        if request.if_none_match.contains_weak(candidate):
+            return candidate
+    return None
+
+
+def _not_modified(etag: str) -> Response:
+    resp = current_app.response_class(status=304)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = _API_CACHE_CONTROL
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+def _accepted_encoding() -> str:
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return ""
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=_GZIP_LEVEL)
+
+
+def _finalize_response(resp: Response) -> Response:
+    if request.method not in ("GET", "HEAD") or resp.status_code != 200 or resp.direct_passthrough:
+        return resp
+    if resp.is_streamed or resp.headers.get("Content-Encoding"):
+        return resp
+
+    if resp.mimetype == "application/json":
+        resp.headers.setdefault("Cache-Control", _API_CACHE_CONTROL)
+        etag, _ = resp.get_etag()
+        if not etag:
+            etag = body_etag(resp.get_data())
+            resp.set_etag(etag)
+        matched = _matching_etag(etag)
+        if matched:
+            return _not_modified(matched)
+
+    if resp.mimetype not in _COMPRESSIBLE_MIMETYPES:
+        return resp
+    resp.vary.add("Accept-Encoding")
+    body = resp.get_data()
+    encoding = _accepted_encoding()
+    if not encoding or len(body) < _MIN_COMPRESS_BYTES:
+        return resp
+
+    resp.set_data(_compress(body, encoding))
+    resp.headers["Content-Encoding"] = encoding
+    etag, _ = resp.get_etag()
+    if etag:
+        resp.set_etag(f"{etag}-{encoding}")
+    return resp
+
+
+def register_response_hooks(app: Flask) -> None:
+    """Add strong ETags, 304 revalidation and gzip/brotli compression to API responses."""
+    app.after_request(_finalize_response)
@@ -1,6 +1,8 @@
 from flask import Blueprint, redirect, request, session, url_for
 
+from images import THUMB_PX, pick_image
 from spotify_client import get_sp, sp_oauth, vite_running
+from token_store import get_token_store, token_key
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -29,13 +31,15 @@ def callback():
         return f"Token exchange failed: {e}"
 
     session["token_info"] = token_info
+    get_token_store().admit(token_key(token_info), token_info)
 
     try:
         sp = get_sp()
         user = sp.current_user()
+        session["user_id"] = user.get("id")
         session["user_name"] = user.get("display_name", "User")
         images = user.get("images", [])
-        session["user_image"] = images[0]["url"] if images else None
+        session["user_image"] = pick_image(images, THUMB_PX)
     except Exception:
         pass
 
@@ -47,5 +51,8 @@ def callback():
 
 @auth_bp.route("/logout")
 def logout():
+    token_info = session.get("token_info")
+    if token_info:
+        get_token_store().forget(token_key(token_info))
     session.clear()
     return redirect(url_for("misc.index"))
@@ -0,0 +1,28 @@
+from flask import Blueprint, jsonify, redirect, send_file, session
+
+from images import IMAGE_ID_RE, PROXY_ENABLED, cdn_url, get_image_cache, sniff_mimetype
+
+images_bp = Blueprint("images", __name__)
+
+_IMMUTABLE = "private, max-age=31536000, immutable"
+
+
+@images_bp.route("/img/<image_id>")
+def proxied_image(image_id: str):
+    if not IMAGE_ID_RE.match(image_id):
+        return jsonify({"ok": False, "error": "invalid_image_id"}), 400
+    if not PROXY_ENABLED:
+        # URLs rewritten while the proxy was on may still sit in caches.
+        return redirect(cdn_url(image_id), code=302)
+    if "token_info" not in session:
+        return jsonify({"ok": False, "error": "not_authenticated"}), 401
+
+    path = get_image_cache().get(image_id)
+    if path is None:
+        # CDN hiccup or full disk: let the browser fetch the original directly.
+        return redirect(cdn_url(image_id), code=302)
+    with open(path, "rb") as fh:
+        mimetype = sniff_mimetype(fh.read(12))
+    resp = send_file(path, mimetype=mimetype, etag=image_id, conditional=True)
+    resp.headers["Cache-Control"] = _IMMUTABLE
+    return resp
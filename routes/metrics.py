@@ -0,0 +1,35 @@
+import hmac
+
+from flask import Blueprint, jsonify, request
+
+from artist_bios import get_bio_service
+from catalog_cache import get_catalog
+from genres import ARTIST_GENRE_CACHE
+from http_cache import etag_cache_stats
+from images import PROXY_ENABLED, get_image_cache
+from instrumentation import snapshot
+from playlist_versions import VERSIONS_ENABLED, get_version_store
+from token_store import get_token_store
+from utils import getenv_stripped
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/metrics")
+def metrics():
+    # Optional shared secret; the numbers are aggregate-only but needn't be public.
+    token = getenv_stripped("ORPHEUS_METRICS_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("X-Metrics-Token", ""), token):
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+
+    data = snapshot()
+    data["caches"]["spotify_etag"] = etag_cache_stats()
+    data["caches"]["artist_genres_store"] = ARTIST_GENRE_CACHE.stats()
+    data["caches"]["catalog_store"] = get_catalog().stats()
+    data["caches"]["bio_store"] = get_bio_service().stats()
+    if PROXY_ENABLED:
+        data["caches"]["image_store"] = get_image_cache().stats()
+    data["tokens"] = get_token_store().stats()
+    if VERSIONS_ENABLED:
+        data["playlist_versions"] = get_version_store().stats()
+    return jsonify({"ok": True, **data})
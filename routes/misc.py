@@ -20,7 +20,7 @@ def send_static(path):
 
 @misc_bp.route('/<path:path>')
 def catch_all(path):
-    if path.startswith('api/') or path in ['login', 'callback', 'logout', 'filter-sweep']:
+    if path.startswith('api/') or path in ['login', 'callback', 'logout', 'filter-sweep', 'metrics']:
         return ('Not found', 404)
     try:
         return current_app.send_static_file(path)
@@ -6,15 +6,36 @@ from spotipy.exceptions import SpotifyException
 
 logger = logging.getLogger(__name__)
 
+from images import THUMB_PX, TILE_PX, pick_image
+from listening_history import days_ago_ms, get_store as get_history_store, history_row_to_track, record_recent_items
+from playlist_index import SORTS as PLAYLIST_SORTS, InvalidCursor, get_playlist_index
+from playlist_merge import MergeUserError, merge_playlists
+from playlist_reorder import (
+    MAX_MOVES as MAX_REORDER_MOVES,
+    SORT_KEYS as REORDER_SORTS,
+    move_summary,
+    plan_reorder,
+    reorder_playlist,
+)
+from playlist_versions import (
+    VERSIONS_ENABLED,
+    diff_counts,
+    get_version_store,
+    item_uris,
+    plan_restore,
+    record_playlist_uris,
+    record_playlist_version,
+    restore_playlist,
+)
 from spotify_client import (
+    RECENT_30D_ID,
     RECENT_ID,
     chunks,
     current_user_id,
     get_all_track_uris,
     get_reference_uris,
     get_sp,
-    list_all_playlists,
-    list_owned_playlists,
+    lookup_artist_genres,
     playlist_items_with_positions,
     canonical_title,
     canonical_artists,
@@ -23,10 +44,17 @@ from utils import normalize, safe_get, is_valid_spotify_id
 
 playlists_bp = Blueprint("playlists", __name__)
 
+PSEUDO_PLAYLIST_IDS = {RECENT_ID, RECENT_30D_ID}
+
 
 # ---------- Playlists API ----------
 @playlists_bp.route("/api/playlists")
 def api_playlists():
+    """All playlists, or with ?limit= one globally sorted page of the cached playlist index.
+
+    Paged mode takes sort (name|tracks), owned_only, prefix (name prefix) and the next_cursor of the
+    previous page; offset is still accepted for the first page.
+    """
     if "token_info" not in session:
         return jsonify({"ok": False, "error": "not_authenticated"}), 401
     try:
@@ -34,61 +62,43 @@ def api_playlists():
         limit = request.args.get("limit", type=int)
         offset = request.args.get("offset", default=0, type=int)
         owned_only = (request.args.get("owned_only") or "").strip().lower() in {"1", "true", "yes", "on"}
+        user_profile = _session_profile(sp)
+        index = get_playlist_index().get(sp, user_profile.get("id") or "")
 
         if limit is not None:
-            per_page = max(1, min(limit, 50))
+            per_page = max(1, min(limit, 100))
             offset = max(offset, 0)
-            page = sp.current_user_playlists(limit=per_page, offset=offset) or {}
-            items = page.get("items", []) or []
-            has_more = bool(page.get("next"))
-            next_offset = offset + per_page if has_more else None
-            user_profile = sp.me() or {}
-            me_id = normalize(user_profile.get("id"))
-
-            def is_owned(pl: Dict[str, Any]) -> bool:
-                return normalize(safe_get(safe_get(pl, "owner", {}), "id")) == me_id
-
-            owned_items = [pl for pl in items if is_owned(pl)]
-            owned_items.sort(key=lambda p: (p.get("name") or "").lower())
-            payload_playlists = owned_items if owned_only else list(items)
-            if not owned_only:
-                payload_playlists.sort(key=lambda p: (p.get("name") or "").lower())
-
-            if not owned_only and offset == 0:
-                recent_entry = {
-                    "id": RECENT_ID,
-                    "name": "Recently Played",
-                    "owner": {
-                        "id": user_profile.get("id") or "me",
-                        "display_name": user_profile.get("display_name") or "You"
-                    },
-                }
-                payload_playlists.append(recent_entry)
+            sort = (request.args.get("sort") or "name").strip().lower()
+            if sort not in PLAYLIST_SORTS:
+                return jsonify({"ok": False, "error": "invalid_sort"}), 400
+            prefix = (request.args.get("prefix") or "").strip()
+            cursor = request.args.get("cursor") or None
+            try:
+                page = index.page(sort, per_page, cursor=cursor, offset=offset, owned_only=owned_only, prefix=prefix)
+            except InvalidCursor:
+                return jsonify({"ok": False, "error": "invalid_cursor"}), 400
+
+            payload_playlists = [_with_image(pl) for pl in page["items"]]
+            owned_items = [pl for pl in payload_playlists if index.is_owned(pl)]
+            if not owned_only and not prefix and not cursor and offset == 0:
+                payload_playlists.extend(_pseudo_playlists(user_profile))
 
             return jsonify({
                 "ok": True,
                 "playlists": payload_playlists,
                 "owned_playlists": owned_items,
-                "has_more": has_more,
-                "next_offset": next_offset,
-                "total": page.get("total", len(payload_playlists)),
+                "has_more": page["has_more"],
+                "next_cursor": page["next_cursor"],
+                "next_offset": offset + per_page if page["has_more"] and not cursor else None,
+                "total": page["total"],
                 "limit": per_page,
                 "offset": offset,
+                "sort": sort,
             })
 
-        owned = list_owned_playlists(sp)
-        all_pl = list_all_playlists(sp)
-
-        me = sp.me() or {}
-        recent_entry = {
-            "id": RECENT_ID,
-            "name": "Recently Played",
-            "owner": {"id": (me.get("id") or "me"), "display_name": me.get("display_name") or "You"},
-        }
-        all_pl.append(recent_entry)
-
-        owned.sort(key=lambda p: (p.get("name") or "").lower())
-        all_pl.sort(key=lambda p: (p.get("name") or "").lower())
+        all_pl = [_with_image(pl) for pl in index.views["name"][0]]
+        owned = [pl for pl in all_pl if index.is_owned(pl)]
+        all_pl.extend(_pseudo_playlists(user_profile))
 
         return jsonify({
             "ok": True,
@@ -100,9 +110,42 @@ def api_playlists():
         return jsonify({"ok": False, "error": "internal_error"}), 500
 
 
+def _with_image(pl: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of an indexed playlist with "image": the tile-sized cover variant (the index is shared, so no mutation)."""
+    return {**pl, "image": pick_image(pl.get("images"), TILE_PX)}
+
+
+def _session_profile(sp) -> Dict[str, Any]:
+    """id/display_name saved in the session at login; /me is only called for sessions that predate that."""
+    if not session.get("user_id"):
+        me = sp.me() or {}
+        session["user_id"] = me.get("id")
+        session["user_name"] = me.get("display_name") or "User"
+    return {"id": session.get("user_id"), "display_name": session.get("user_name")}
+
+
+def _playlists_changed() -> None:
+    get_playlist_index().invalidate(session.get("user_id"))
+
+
+def _record_version(sp, playlist_id: str, snapshot_id: Optional[str], items: List[Dict[str, Any]],
+                    reason: str) -> Optional[int]:
+    """Save the playlist as it is now, before a destructive edit, so it can be restored."""
+    return record_playlist_version(_session_profile(sp).get("id"), playlist_id, snapshot_id, items, reason)
+
+
+def _pseudo_playlists(user_profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """'Recently Played', plus 'Last 30 Days' once the local listening history has plays for this user."""
+    owner = {"id": user_profile.get("id") or "me", "display_name": user_profile.get("display_name") or "You"}
+    entries = [{"id": RECENT_ID, "name": "Recently Played", "owner": owner}]
+    if user_profile.get("id") and get_history_store().latest_played_at(user_profile["id"]):
+        entries.append({"id": RECENT_30D_ID, "name": "Last 30 Days", "owner": owner})
+    return entries
+
+
 @playlists_bp.route("/api/playlist/<playlist_id>", methods=["GET", "DELETE"])
 def api_playlist(playlist_id):
-    if playlist_id != RECENT_ID and not is_valid_spotify_id(playlist_id):
+    if playlist_id not in PSEUDO_PLAYLIST_IDS and not is_valid_spotify_id(playlist_id):
         return jsonify({"ok": False, "error": "invalid_playlist_id"}), 400
     if request.method == "DELETE":
         if "token_info" not in session:
@@ -110,6 +153,7 @@ def api_playlist(playlist_id):
         try:
             sp = get_sp()
             sp.current_user_unfollow_playlist(playlist_id)
+            _playlists_changed()
             return jsonify({"ok": True})
         except Exception:
             logger.exception("Error unfollowing playlist %s", playlist_id)
@@ -132,6 +176,7 @@ def api_playlist(playlist_id):
                 raise
 
             items = recent.get("items", []) or []
+            record_recent_items(me.get("id"), items, genre_lookup=lambda ids: lookup_artist_genres(sp, ids))
             rows = []
             for it in items:
                 tr = (it or {}).get("track") or {}
@@ -148,7 +193,7 @@ def api_playlist(playlist_id):
                     "url": (tr.get("external_urls") or {}).get("spotify"),
                     "explicit": tr.get("explicit"),
                     "duration_ms": tr.get("duration_ms"),
-                    "cover": images[0].get("url") if images else None,
+                    "cover": pick_image(images, THUMB_PX),
                 })
 
             return jsonify({
@@ -164,9 +209,26 @@ def api_playlist(playlist_id):
                 "tracks": rows,
             })
 
+        if playlist_id == RECENT_30D_ID:
+            me = sp.me() or {}
+            plays = get_history_store().plays_between(me.get("id") or "", days_ago_ms(30))
+            rows = [history_row_to_track(play) for play in plays]
+            return jsonify({
+                "ok": True,
+                "playlist": {
+                    "id": RECENT_30D_ID,
+                    "name": "Last 30 Days",
+                    "owner": me.get("display_name") or me.get("id") or "You",
+                    "total": len(rows),
+                    "url": None,
+                    "image": None,
+                },
+                "tracks": rows,
+            })
+
         pl = sp.playlist(playlist_id)
         imgs = pl.get("images") or []
-        img_url = imgs[0].get("url") if imgs else None
+        img_url = pick_image(imgs, TILE_PX)
         total_tracks = (pl.get("tracks") or {}).get("total", 0)
 
         if limit is not None:
@@ -174,7 +236,7 @@ def api_playlist(playlist_id):
             items = result.get("items", [])
             has_more = (offset + len(items)) < total_tracks
         else:
-            items = list(paginate(lambda o, l: sp.playlist_items(playlist_id, limit=l, offset=o)))
+            items = playlist_items_with_positions(sp, playlist_id)
             has_more = False
 
         rows = []
@@ -193,7 +255,7 @@ def api_playlist(playlist_id):
                 "url": (tr.get("external_urls") or {}).get("spotify"),
                 "explicit": tr.get("explicit"),
                 "duration_ms": tr.get("duration_ms"),
-                "cover": images[0].get("url") if images else None,
+                "cover": pick_image(images, THUMB_PX),
             })
 
         return jsonify({
@@ -338,12 +400,14 @@ def api_remove_duplicates(playlist_id):
         if not removal_map:
             return jsonify({"ok": True, "removed_count": 0, "playlist_name": playlist_name, "details": []})
 
+        _record_version(sp, playlist_id, pl.get("snapshot_id"), items, "remove_duplicates")
         payload = [{"uri": uri, "positions": sorted(pos_list)} for uri, pos_list in removal_map.items()]
         removed_count = sum(len(p["positions"]) for p in payload)
 
         for batch_start in range(0, len(payload), 100):
             batch = payload[batch_start:batch_start + 100]
             sp.playlist_remove_specific_occurrences_of_items(playlist_id, batch)
+        _playlists_changed()
 
         return jsonify({"ok": True, "removed_count": removed_count, "playlist_name": playlist_name, "details": details})
 
@@ -355,6 +419,179 @@ def api_remove_duplicates(playlist_id):
         return jsonify({"ok": False, "error": "internal_error"}), 500
 
 
+# ---------- Reorder ----------
+@playlists_bp.route("/api/reorder/<playlist_id>", methods=["POST"])
+def api_reorder(playlist_id):
+    """Sort an owned playlist in place by sort= (artist, added_at, title), keeping added_at dates.
+
+    dry_run=1 only reports how many reorder calls the sort would take. Sorts needing more than
+    MAX_REORDER_MOVES calls are refused with 422 and those dry-run numbers.
+    """
+    if not is_valid_spotify_id(playlist_id):
+        return jsonify({"ok": False, "error": "invalid_playlist_id"}), 400
+    if "token_info" not in session:
+        return jsonify({"ok": False, "error": "not_authenticated"}), 401
+    data = request.get_json(silent=True) or {}
+    sort = data.get("sort") or request.args.get("sort", "artist")
+    descending = bool(data.get("descending")) or request.args.get("descending") == "1"
+    dry_run = bool(data.get("dry_run")) or request.args.get("dry_run") == "1"
+    if sort not in REORDER_SORTS:
+        return jsonify({"ok": False, "error": "invalid_sort"}), 400
+    try:
+        sp = get_sp()
+
+        try:
+            pl = sp.playlist(playlist_id)
+            owner_id = normalize((pl.get("owner") or {}).get("id") or "")
+            if owner_id != normalize(current_user_id(sp)):
+                return jsonify({"ok": False, "error": "playlist_not_owned"}), 403
+        except Exception:
+            return jsonify({"ok": False, "error": "ownership_check_failed"}), 400
+
+        items = playlist_items_with_positions(sp, playlist_id)
+        moves = plan_reorder(items, sort, descending)
+        if not dry_run and len(moves) > MAX_REORDER_MOVES:
+            # The calls run one after another in this request; this many would outlast the worker timeout.
+            return jsonify({"ok": False, "error": "too_many_moves", "max_moves": MAX_REORDER_MOVES,
+                            "playlist_name": pl.get("name", ""), "sort": sort,
+                            **move_summary(moves, dry_run=True)}), 422
+        if not dry_run:
+            _record_version(sp, playlist_id, pl.get("snapshot_id"), items, f"reorder:{sort}")
+        result = reorder_playlist(sp, playlist_id, items, sort, descending,
+                                  snapshot_id=pl.get("snapshot_id"), dry_run=dry_run, moves=moves)
+        if result["moves"] and not dry_run:
+            _playlists_changed()
+
+        return jsonify({"ok": True, "playlist_name": pl.get("name", ""), "sort": sort, **result})
+
+    except SpotifyException as e:
+        logger.error("Spotify error in reorder %s: %s", playlist_id, e)
+        return jsonify({"ok": False, "error": "spotify_error"}), 500
+    except Exception:
+        logger.exception("Unexpected error in reorder %s", playlist_id)
+        return jsonify({"ok": False, "error": "internal_error"}), 500
+
+
+# ---------- Versions ----------
+def _versions_guard(playlist_id: str):
+    if not is_valid_spotify_id(playlist_id):
+        return jsonify({"ok": False, "error": "invalid_playlist_id"}), 400
+    if "token_info" not in session:
+        return jsonify({"ok": False, "error": "not_authenticated"}), 401
+    if not VERSIONS_ENABLED:
+        return jsonify({"ok": False, "error": "versions_disabled"}), 404
+    return None
+
+
+@playlists_bp.route("/api/playlist/<playlist_id>/versions")
+def api_playlist_versions(playlist_id):
+    """Saved versions of a playlist, newest first."""
+    denied = _versions_guard(playlist_id)
+    if denied:
+        return denied
+    try:
+        user_id = _session_profile(get_sp()).get("id") or ""
+        return jsonify({"ok": True, "versions": get_version_store().versions(user_id, playlist_id)})
+    except Exception:
+        logger.exception("Unexpected error listing versions of %s", playlist_id)
+        return jsonify({"ok": False, "error": "internal_error"}), 500
+
+
+@playlists_bp.route("/api/playlist/<playlist_id>/versions/diff")
+def api_playlist_versions_diff(playlist_id):
+    """Tracks added and removed between ?from= and ?to= (default: the playlist as it is now).
+
+    Diffing against the live playlist reads it without recording a version.
+    """
+    denied = _versions_guard(playlist_id)
+    if denied:
+        return denied
+    from_version = request.args.get("from", type=int)
+    to_version = request.args.get("to", type=int)
+    if from_version is None:
+        return jsonify({"ok": False, "error": "missing_from"}), 400
+    try:
+        sp = get_sp()
+        user_id = _session_profile(sp).get("id") or ""
+        store = get_version_store()
+        for version in (from_version, to_version):
+            if version is not None and not store.exists(user_id, playlist_id, version):
+                return jsonify({"ok": False, "error": "version_not_found"}), 404
+
+        before = store.tracks(user_id, playlist_id, from_version)
+        if to_version is None:
+            after = item_uris(playlist_items_with_positions(sp, playlist_id))
+        else:
+            after = store.tracks(user_id, playlist_id, to_version)
+        added, removed = diff_counts(before, after)
+        return jsonify({
+            "ok": True,
+            "from": from_version,
+            "to": to_version,
+            "added": added,
+            "removed": removed,
+            "reordered": not added and not removed and before != after,
+        })
+    except SpotifyException as e:
+        logger.error("Spotify error in versions diff %s: %s", playlist_id, e)
+        return jsonify({"ok": False, "error": "spotify_error"}), 500
+    except Exception:
+        logger.exception("Unexpected error in versions diff %s", playlist_id)
+        return jsonify({"ok": False, "error": "internal_error"}), 500
+
+
+@playlists_bp.route("/api/playlist/<playlist_id>/versions/<int:version>/restore", methods=["POST"])
+def api_playlist_restore(playlist_id, version):
+    """Bring an owned playlist back to a saved version; the current state is saved first.
+
+    Restores needing more than MAX_REORDER_MOVES writes are refused with 422 and the planned counts.
+    """
+    denied = _versions_guard(playlist_id)
+    if denied:
+        return denied
+    try:
+        sp = get_sp()
+        user_id = _session_profile(sp).get("id") or ""
+        store = get_version_store()
+        if not store.exists(user_id, playlist_id, version):
+            return jsonify({"ok": False, "error": "version_not_found"}), 404
+
+        try:
+            pl = sp.playlist(playlist_id)
+            owner_id = normalize((pl.get("owner") or {}).get("id") or "")
+            if owner_id != normalize(user_id):
+                return jsonify({"ok": False, "error": "playlist_not_owned"}), 403
+        except Exception:
+            return jsonify({"ok": False, "error": "ownership_check_failed"}), 400
+
+        target = store.tracks(user_id, playlist_id, version)
+        items = playlist_items_with_positions(sp, playlist_id)
+        plan = plan_restore(item_uris(items, keep_missing=True), target)
+        if plan.calls > MAX_REORDER_MOVES:
+            # Same limit as api_reorder: the writes run one after another inside this request.
+            return jsonify({"ok": False, "error": "too_many_moves", "max_moves": MAX_REORDER_MOVES,
+                            "playlist_name": pl.get("name", ""), "restored_from": version,
+                            **plan.summary()}), 422
+        saved = _record_version(sp, playlist_id, pl.get("snapshot_id"), items, "before_restore")
+        if saved is None:
+            # Without a saved copy of the current state the restore could not itself be undone.
+            return jsonify({"ok": False, "error": "version_save_failed"}), 503
+        result = restore_playlist(sp, playlist_id, plan, snapshot_id=pl.get("snapshot_id"))
+        restored = record_playlist_uris(user_id, playlist_id, result["snapshot_id"], plan.target,
+                                        f"restore:{version}")
+        _playlists_changed()
+
+        return jsonify({"ok": True, "playlist_name": pl.get("name", ""), "restored_from": version,
+                        "previous_version": saved, "version": restored, **result})
+
+    except SpotifyException as e:
+        logger.error("Spotify error in restore %s: %s", playlist_id, e)
+        return jsonify({"ok": False, "error": "spotify_error"}), 500
+    except Exception:
+        logger.exception("Unexpected error in restore %s", playlist_id)
+        return jsonify({"ok": False, "error": "internal_error"}), 500
+
+
 # ---------- Filter Sweep ----------
 class FilterSweepUserError(Exception):
     def __init__(self, message: str, status_code: int = 400, code: str = "user_error"):
@@ -411,6 +648,7 @@ def run_filter_sweep(sp, playlist_a: Optional[str], playlist_b_list: Optional[Li
     if not to_remove:
         raise FilterSweepUserError(f"No overlap found. Nothing to remove from \"{playlist_a_name}\".", code="no_overlap")
 
+    _record_version(sp, playlist_a, (playlist_a_obj or {}).get("snapshot_id"), playlist_a_items, "filter_sweep")
     to_remove.sort(key=lambda uri: (track_details.get(uri, {}).get("name") or "").lower())
     removed_tracks: List[Dict[str, Any]] = []
     for uri in to_remove:
@@ -421,6 +659,8 @@ def run_filter_sweep(sp, playlist_a: Optional[str], playlist_b_list: Optional[Li
 
     for batch in chunks(to_remove, 100):
         sp.playlist_remove_all_occurrences_of_items(playlist_a, batch)
+    if to_remove:
+        _playlists_changed()
 
     return {
         "removed": removed_total,
@@ -471,30 +711,47 @@ def api_create_playlist():
     name = data.get("name", "").strip()
     description = data.get("description", "").strip()
     track_uris = data.get("track_uris", [])
+    sources = data.get("sources")
 
     if not name:
         return jsonify({"ok": False, "error": "missing_name"}), 400
-    if not track_uris:
+    if not track_uris and not sources:
         return jsonify({"ok": False, "error": "no_tracks_provided"}), 400
 
     try:
-        user_id = current_user_id(sp)
-        if not user_id:
-            return jsonify({"ok": False, "error": "could_not_get_user_id"}), 400
-
-        playlist = sp.user_playlist_create(
-            user=user_id,
-            name=name,
-            public=False,
-            description=description
-        )
-
-        playlist_id = playlist.get("id")
-        if not playlist_id:
-            return jsonify({"ok": False, "error": "playlist_creation_failed"}), 500
-
-        for batch in chunks(track_uris, 100):
-            sp.playlist_add_items(playlist_id, batch)
+        if sources:
+            # Server-side merge: sources are playlist ids (or the pseudo playlists), merged in order.
+            filters = data.get("filters") or {}
+            if not isinstance(sources, list) or not isinstance(filters, dict) or not all(
+                    pid in PSEUDO_PLAYLIST_IDS or is_valid_spotify_id(pid)
+                    for pid in sources + list(filters.get("exclude_playlist_ids") or [])):
+                return jsonify({"ok": False, "error": "invalid_playlist_id"}), 400
+            user_id = _session_profile(sp).get("id") or ""
+            merged = merge_playlists(sp, user_id, name, description, sources,
+                                     dedupe=data.get("dedupe") or "uri", filters=filters)
+            playlist_id = merged.pop("playlist_id")
+            track_count = merged["added"]
+        else:
+            user_id = current_user_id(sp)
+            if not user_id:
+                return jsonify({"ok": False, "error": "could_not_get_user_id"}), 400
+
+            playlist = sp.user_playlist_create(
+                user=user_id,
+                name=name,
+                public=False,
+                description=description
+            )
+
+            playlist_id = playlist.get("id")
+            if not playlist_id:
+                return jsonify({"ok": False, "error": "playlist_creation_failed"}), 500
+
+            for batch in chunks(track_uris, 100):
+                sp.playlist_add_items(playlist_id, batch)
+            merged = None
+            track_count = len(track_uris)
+        _playlists_changed()
 
         final_playlist = sp.playlist(playlist_id)
         images = final_playlist.get("images") or []
@@ -505,11 +762,17 @@ def api_create_playlist():
                 "id": final_playlist.get("id"),
                 "name": final_playlist.get("name"),
                 "url": (final_playlist.get("external_urls") or {}).get("spotify"),
-                "image": images[0].get("url") if images else None,
-                "total_tracks": len(track_uris)
-            }
+                "image": pick_image(images, TILE_PX),
+                "total_tracks": track_count
+            },
+            **({"merge": merged} if merged is not None else {}),
         })
 
+    except MergeUserError as e:
+        if e.playlist_id:
+            _playlists_changed()
+        return jsonify({"ok": False, "error": str(e), "code": e.code,
+                        **({"playlist_id": e.playlist_id} if e.playlist_id else {})}), e.status_code
     except SpotifyException as e:
         logger.error("Spotify error in create-playlist: %s", e)
         return jsonify({"ok": False, "error": "spotify_error"}), 500
@@ -1,12 +1,18 @@
 import logging
+from typing import Any, Dict, List, Optional
 
 from flask import Blueprint, jsonify, request, session
 
 logger = logging.getLogger(__name__)
 from spotipy.exceptions import SpotifyException
 
+from genres import ARTIST_GENRE_CACHE
+from images import THUMB_PX, pick_image, proxied
+from library_index import get_library_index
+from recommender import get_model
+from seed_validation import SeedValidationError, validate_seeds
 from spotify_client import get_sp
-from utils import filter_existing_artists, filter_existing_tracks, normalize_genre_list, normalize_seed_list
+from utils import normalize_genre_list, normalize_seed_list
 
 recommendations_bp = Blueprint("recommendations", __name__)
 
@@ -29,8 +35,11 @@ def api_recommendations():
     if not seed_tracks_raw and not seed_artists_raw and not seed_genres:
         return jsonify({"ok": False, "error": "no_seeds_provided"}), 400
 
-    seed_tracks = filter_existing_tracks(sp, seed_tracks_raw)
-    seed_artists = filter_existing_artists(sp, seed_artists_raw)
+    try:
+        seed_tracks, seed_artists = validate_seeds(sp, seed_tracks_raw, seed_artists_raw)
+    except SeedValidationError as err:
+        logger.warning("Seed validation failed: %s", err)
+        return jsonify({"ok": False, "error": "seed_validation_failed", "details": "Spotify could not check the selected tracks or artists right now. Try again in a moment."}), 503
 
     if not seed_tracks and not seed_artists and not seed_genres:
         return jsonify({"ok": False, "error": "no_valid_seeds", "details": "Spotify could not use the selected tracks or artists. Try different picks."}), 400
@@ -42,6 +51,21 @@ def api_recommendations():
     if total_seeds < 1:
         return jsonify({"ok": False, "error": "insufficient_seeds", "details": "At least 1 seed required"}), 400
 
+    # Local co-occurrence model first; Spotify's deprecated endpoint only when it has nothing
+    local = _local_recommendations(session.get("user_id"), seed_tracks, seed_artists, seed_genres, limit)
+    if local:
+        return jsonify({
+            "ok": True,
+            "recommendations": local,
+            "engine": "local",
+            "seed_info": {
+                "tracks": len(seed_tracks),
+                "artists": len(seed_artists),
+                "genres": len(seed_genres),
+                "total": total_seeds
+            }
+        })
+
     try:
         recommendations = sp.recommendations(
             seed_tracks=seed_tracks[:5] if seed_tracks else None,
@@ -67,7 +91,7 @@ def api_recommendations():
                 "album": album.get("name"),
                 "album_id": album.get("id"),
                 "album_year": release_year,
-                "cover": album_images[0].get("url") if album_images else None,
+                "cover": pick_image(album_images, THUMB_PX),
                 "url": (track.get("external_urls") or {}).get("spotify"),
                 "duration_ms": track.get("duration_ms"),
                 "explicit": track.get("explicit"),
@@ -77,6 +101,7 @@ def api_recommendations():
         return jsonify({
             "ok": True,
             "recommendations": tracks,
+            "engine": "spotify",
             "seed_info": {
                 "tracks": len(seed_tracks),
                 "artists": len(seed_artists),
@@ -97,3 +122,39 @@ def api_recommendations():
     except Exception:
         logger.exception("Unexpected error in recommendations")
         return jsonify({"ok": False, "error": "internal_error"}), 500
+
+
+def _local_recommendations(user_id: Optional[str], seed_tracks: List[str], seed_artists: List[str],
+                           seed_genres: List[str], limit: int) -> List[Dict[str, Any]]:
+    if not user_id:
+        return []
+    genre_artists = ARTIST_GENRE_CACHE.artists_with_genres(seed_genres) if seed_genres else []
+    try:
+        ranked = get_model(user_id).recommend(seed_tracks, seed_artists, genre_artists, limit=limit)
+    except Exception:
+        logger.exception("Local recommender failed")
+        return []
+    details = get_library_index().track_details(user_id, (tid for tid, _ in ranked))
+
+    tracks = []
+    for track_id, score in ranked:
+        row = details.get(track_id)
+        if row is None:
+            continue
+        tracks.append({
+            "id": track_id,
+            "uri": row["uri"],
+            "name": row["name"],
+            "artists": row["artists"],
+            "artist_ids": [a for a in (row["artist_ids"] or "").split(",") if a],
+            "album": row["album"],
+            "album_id": row["album_id"],
+            "album_year": row["album_year"],
+            "cover": proxied(row["cover"]),
+            "url": f"https://open.spotify.com/track/{track_id}",
+            "duration_ms": row["duration_ms"],
+            "explicit": bool(row["explicit"]) if row["explicit"] is not None else None,
+            "popularity": None,
+            "score": round(score, 4),
+        })
+    return tracks
@@ -1,8 +1,11 @@
+import asyncio
 import logging
+import sqlite3
+import threading
 import time
-from typing import Any, Dict, List
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
 
-import requests as http_requests
 import spotipy
 from flask import Blueprint, jsonify, request, session
 from spotipy.exceptions import SpotifyException
@@ -10,23 +13,43 @@ from spotipy.exceptions import SpotifyException
 logger = logging.getLogger(__name__)
 
 # ---------- In-process caches ----------
-_STATS_CACHE: Dict[str, Any] = {}   # {user_id: {"ts": float, "data": dict}}
+_STATS_CACHE: Dict[str, Any] = {}   # {user_id[:section][:range]: {"ts": float, "data": dict}} response payloads
+_STATS_PARTS: Dict[Tuple[str, str, str], Any] = {}   # {(user_id, part, range): {"ts", "data"}} formatted top items
 _STATS_TTL = 300                     # 5 minutes
+_STATS_MAX_ENTRIES = 4096            # per cache; expired entries are dropped first, then the oldest
+_STATS_LOCK = threading.Lock()       # guards inserts/evictions; lookups are plain dict reads
 
-_ARTIST_CACHE: Dict[str, Any] = {}  # {artist_id: {"ts": float, "data": dict}}
-_ARTIST_TTL = 1800                   # 30 minutes
-
-_BIO_CACHE: Dict[str, Any] = {}     # {artist_id: {"ts": float, "bio": str|None, "source": str|None}}
-_BIO_TTL = 86400                     # 24 hours (bios don't change)
+STATS_SECTIONS = ("artists", "tracks", "albums", "genres", "recent")
+_RECENT_MINUTES_RANGE = "last_24_hours"   # window of recent_minutes_listened when the history store is on
+_RECENT_PLAYS = 30                        # recently played items fetched; the minutes window without history
+_RECENT_PLAYS_RANGE = f"last_{_RECENT_PLAYS}_plays"
+_RECENT_MINUTES_LABELS = {_RECENT_MINUTES_RANGE: "Last 24 Hours", _RECENT_PLAYS_RANGE: f"Last {_RECENT_PLAYS} Plays"}
 
+from artist_bios import get_bio_service
+from async_spotify import run_async
 from spotify_client import (
     TIME_RANGE_KEYS,
     TIME_RANGE_LABELS,
+    async_available,
     build_artist_genre_lookup,
+    get_async_sp,
     get_sp,
-    summarize_genres,
-    summarize_genres_from_tracks,
+    lookup_artist_genres,
+)
+from catalog_cache import CatalogCache, get_catalog
+from genres import summarize_genres_all_ranges
+from instrumentation import record_cache
+from images import FULL_PX, THUMB_PX, TILE_PX, pick_image
+from library_index import get_library_index
+from listening_history import (
+    HISTORY_ENABLED,
+    RANGE_PRESETS,
+    get_store as get_history_store,
+    record_recent_items,
+    resolve_range,
 )
+from responses import cached_json_response
+from search_cache import cached_search
 from utils import is_valid_spotify_id
 
 stats_bp = Blueprint("stats", __name__)
@@ -34,137 +57,33 @@ stats_bp = Blueprint("stats", __name__)
 
 @stats_bp.route("/api/user-stats")
 def api_user_stats():
+    """The whole dashboard; ?range=<time range> limits the per-range sections to that one range.
+
+    The dashboard loads its default range first and the full payload in the background.
+    """
     if "token_info" not in session:
         return jsonify({"ok": False, "error": "not_authenticated"}), 401
+    range_key = request.args.get("range") or None
+    if range_key is not None and range_key not in TIME_RANGE_KEYS:
+        return jsonify({"ok": False, "error": "invalid_range"}), 400
     try:
         sp = get_sp()
-
-        user = sp.current_user()
-        user_id = user.get("id") or ""
-        user_name = user.get("display_name", "User")
-        user_images = user.get("images", [])
-        user_image = user_images[0].get("url") if user_images else None
+        user_id, user_name, user_image = _stats_user(sp)
 
         # Return cached stats if still fresh
-        cached = _STATS_CACHE.get(user_id)
-        if cached and (time.time() - cached["ts"]) < _STATS_TTL:
-            return jsonify(cached["data"])
-
-        def format_artist(artist: Dict[str, Any]) -> Dict[str, Any]:
-            images = artist.get("images") or []
-            name = artist.get("name") or "Unknown Artist"
-            genres = (artist.get("genres") or [])[:3]
-            followers_raw = artist.get("followers") or {}
-            followers_total = followers_raw.get("total") if isinstance(followers_raw, dict) else None
-            popularity = artist.get("popularity")
-            primary_genre = genres[0] if genres else None
-
-            bio_parts = []
-            if primary_genre:
-                bio_parts.append(f"{name} is a {primary_genre} artist")
-            else:
-                bio_parts.append(f"{name} is an artist")
-            if isinstance(followers_total, int) and followers_total > 0:
-                bio_parts.append(f"followed by {followers_total:,} Spotify listeners")
-            if isinstance(popularity, int):
-                bio_parts.append(f"with a popularity score of {popularity}/100")
-            biography = ", ".join(bio_parts).strip()
-            if biography and not biography.endswith("."):
-                biography += "."
-
-            return {
-                "id": artist.get("id"),
-                "name": name,
-                "url": (artist.get("external_urls") or {}).get("spotify"),
-                "image": images[0].get("url") if images else None,
-                "genres": genres,
-                "followers": followers_total,
-                "popularity": popularity,
-                "bio": biography,
-            }
-
-        def format_track(track: Dict[str, Any]) -> Dict[str, Any]:
-            artists = track.get("artists") or []
-            artist_ids = [a.get("id") for a in artists if a.get("id")]
-            album = track.get("album") or {}
-            album_images = album.get("images") or []
-            release_date = album.get("release_date") or ""
-            release_year = release_date[:4] if isinstance(release_date, str) else None
-            return {
-                "name": track.get("name"),
-                "artists": ", ".join(a.get("name", "") for a in artists),
-                "url": (track.get("external_urls") or {}).get("spotify"),
-                "album": album.get("name"),
-                "album_year": release_year,
-                "album_id": album.get("id"),
-                "album_url": (album.get("external_urls") or {}).get("spotify"),
-                "cover": album_images[0].get("url") if album_images else None,
-                "artist_ids": artist_ids,
-            }
-
-        top_artists: Dict[str, List[Dict[str, Any]]] = {}
-        for range_key in TIME_RANGE_KEYS:
-            data = sp.current_user_top_artists(limit=50, time_range=range_key) or {}
-            items = data.get("items") or []
-            top_artists[range_key] = [format_artist(artist) for artist in items if isinstance(artist, dict)]
-
-        top_tracks: Dict[str, List[Dict[str, Any]]] = {}
-        track_artist_ids: List[str] = []
-        for range_key in TIME_RANGE_KEYS:
-            data = sp.current_user_top_tracks(limit=50, time_range=range_key) or {}
-            items = data.get("items") or []
-            formatted_tracks = [format_track(track) for track in items if isinstance(track, dict)]
-            top_tracks[range_key] = formatted_tracks
-            for t in formatted_tracks:
-                track_artist_ids.extend(t.get("artist_ids") or [])
-
-        artist_genre_lookup = build_artist_genre_lookup(sp, top_artists, track_artist_ids)
-
-        top_genres = {
-            "artists": {range_key: summarize_genres(top_artists, range_key) for range_key in TIME_RANGE_KEYS},
-            "tracks": {range_key: summarize_genres_from_tracks(top_tracks, artist_genre_lookup, range_key) for range_key in TIME_RANGE_KEYS},
-        }
-
-        top_albums: Dict[str, List[Dict[str, Any]]] = {}
-        for range_key, tracks in top_tracks.items():
-            album_map: Dict[str, Any] = {}
-            for t in tracks:
-                aid = t.get('album_id')
-                if not aid:
-                    continue
-                if aid not in album_map:
-                    album_map[aid] = {
-                        'id': aid,
-                        'name': t.get('album'),
-                        'cover': t.get('cover'),
-                        'artists': t.get('artists'),
-                        'year': t.get('album_year'),
-                        'url': t.get('album_url'),
-                        'track_count': 0,
-                    }
-                album_map[aid]['track_count'] += 1
-            top_albums[range_key] = sorted(album_map.values(), key=lambda x: x['track_count'], reverse=True)
-
-        recent_data = sp.current_user_recently_played(limit=30) or {}
-        recently_played = []
-        recent_total_ms = 0
-        for item in (recent_data.get('items') or []):
-            track = item.get('track') or {}
-            artists = track.get('artists') or []
-            duration_ms = track.get('duration_ms')
-            if isinstance(duration_ms, (int, float)):
-                recent_total_ms += duration_ms
-            album_images = (track.get('album') or {}).get('images') or []
-            cover = album_images[0].get('url') if album_images else None
-            recently_played.append({
-                'name': track.get('name'),
-                'artists': ', '.join(a.get('name', '') for a in artists),
-                'url': (track.get('external_urls') or {}).get('spotify'),
-                'played_at': item.get('played_at'),
-                'duration_ms': duration_ms,
-                'cover': cover,
-            })
-        recent_minutes = round(recent_total_ms / 60000) if recent_total_ms else None
+        cache_key = f"{user_id}:{range_key}" if range_key else user_id
+        cached = _STATS_CACHE.get(cache_key)
+        fresh = _is_fresh(cached)
+        record_cache("stats", fresh)
+        if fresh:
+            return cached_json_response(cached)
+
+        ranges = [range_key] if range_key else list(TIME_RANGE_KEYS)
+        parts = _stats_parts(sp, user_id, [(kind, r) for kind in ("artists", "tracks") for r in ranges]
+                             + [("recent", "")])
+        top_artists = {r: parts[("artists", r)] for r in ranges}
+        top_tracks = {r: parts[("tracks", r)] for r in ranges}
+        recently_played, recent_minutes, recent_range = parts[("recent", "")]
 
         payload = {
             "ok": True,
@@ -173,13 +92,18 @@ def api_user_stats():
             "top_tracks": top_tracks,
             "recently_played": recently_played,
             "range_labels": TIME_RANGE_LABELS,
-            "top_genres": top_genres,
-            "top_albums": top_albums,
+            "top_genres": _top_genres(sp, top_artists, top_tracks),
+            "top_albums": {r: _top_albums(tracks) for r, tracks in top_tracks.items()},
             "recent_minutes_listened": recent_minutes,
+            "recent_minutes_range": recent_range,
+            "recent_minutes_label": _RECENT_MINUTES_LABELS[recent_range],
         }
+        if range_key:
+            payload["ranges_loaded"] = ranges
+        entry = {"ts": time.time(), "data": payload}
         if user_id:
-            _STATS_CACHE[user_id] = {"ts": time.time(), "data": payload}
-        return jsonify(payload)
+            _cache_put(_STATS_CACHE, cache_key, entry)
+        return cached_json_response(entry)
 
     except SpotifyException as e:
         logger.error("Spotify error in user-stats: %s", e)
@@ -189,25 +113,359 @@ def api_user_stats():
         return jsonify({"ok": False, "error": "internal_error"}), 500
 
 
+@stats_bp.route("/api/user-stats/<section>")
+def api_user_stats_section(section: str):
+    """One dashboard section for one range (?range=, default short_term), from the same cache.
+
+    artists and tracks cost one Spotify call each, albums reuses tracks, recent ignores the range.
+    """
+    if "token_info" not in session:
+        return jsonify({"ok": False, "error": "not_authenticated"}), 401
+    if section not in STATS_SECTIONS:
+        return jsonify({"ok": False, "error": "invalid_section"}), 400
+    range_key = request.args.get("range") or "short_term"
+    if range_key not in TIME_RANGE_KEYS:
+        return jsonify({"ok": False, "error": "invalid_range"}), 400
+    try:
+        sp = get_sp()
+        user_id, _, _ = _stats_user(sp)
+        cache_key = f"{user_id}:{section}:{range_key}"
+        cached = _STATS_CACHE.get(cache_key)
+        fresh = _is_fresh(cached)
+        record_cache("stats", fresh)
+        if fresh:
+            return cached_json_response(cached)
+
+        payload: Dict[str, Any] = {"ok": True, "section": section, "range": range_key,
+                                   "range_label": TIME_RANGE_LABELS.get(range_key)}
+        if section == "recent":
+            recently_played, recent_minutes, recent_range = _stats_parts(sp, user_id, [("recent", "")])[("recent", "")]
+            payload.update(recently_played=recently_played, recent_minutes_listened=recent_minutes,
+                           recent_minutes_range=recent_range, recent_minutes_label=_RECENT_MINUTES_LABELS[recent_range])
+        elif section == "artists":
+            payload["top_artists"] = _stats_parts(sp, user_id, [("artists", range_key)])[("artists", range_key)]
+        elif section in ("tracks", "albums"):
+            tracks = _stats_parts(sp, user_id, [("tracks", range_key)])[("tracks", range_key)]
+            payload["top_tracks" if section == "tracks" else "top_albums"] = \
+                tracks if section == "tracks" else _top_albums(tracks)
+        else:
+            parts = _stats_parts(sp, user_id, [("artists", range_key), ("tracks", range_key)])
+            genres = _top_genres(sp, {range_key: parts[("artists", range_key)]},
+                                 {range_key: parts[("tracks", range_key)]})
+            payload["top_genres"] = {
+                "artists": genres["artists"].get(range_key, []),
+                "tracks": genres["tracks"].get(range_key, []),
+                "parents": {kind: genres["parents"][kind].get(range_key, []) for kind in ("artists", "tracks")},
+            }
+
+        entry = {"ts": time.time(), "data": payload}
+        if user_id:
+            _cache_put(_STATS_CACHE, cache_key, entry)
+        return cached_json_response(entry)
+
+    except SpotifyException as e:
+        logger.error("Spotify error in user-stats/%s: %s", section, e)
+        return jsonify({"ok": False, "error": "spotify_error"}), 500
+    except Exception:
+        logger.exception("Unexpected error in user-stats/%s", section)
+        return jsonify({"ok": False, "error": "internal_error"}), 500
+
+
+# ---------- Dashboard building blocks ----------
+def _is_fresh(entry: Any) -> bool:
+    return bool(entry) and (time.time() - entry["ts"]) < _STATS_TTL
+
+
+def _cache_put(cache: Dict[Any, Any], key: Any, entry: Dict[str, Any]) -> None:
+    """Store entry as the newest in cache, pruning expired entries and any beyond _STATS_MAX_ENTRIES.
+
+    Entries are stored with ts=now and re-inserted on update, so the dict stays ordered oldest
+    first and pruning only looks at its head.
+    """
+    with _STATS_LOCK:
+        cache.pop(key, None)
+        cache[key] = entry
+        while cache:
+            oldest = next(iter(cache))
+            if len(cache) <= _STATS_MAX_ENTRIES and _is_fresh(cache[oldest]):
+                break
+            del cache[oldest]
+
+
+def _stats_user(sp: spotipy.Spotify) -> Tuple[str, str, Any]:
+    """(id, display name, avatar) saved in the session at login; /me only for sessions without them."""
+    if not session.get("user_id") or "user_name" not in session:
+        user = sp.current_user() or {}
+        session["user_id"] = user.get("id") or ""
+        session["user_name"] = user.get("display_name", "User")
+        session["user_image"] = pick_image(user.get("images", []), THUMB_PX)
+    return session["user_id"], session["user_name"], session.get("user_image")
+
+
+def _stats_parts(sp: spotipy.Spotify, user_id: str, wanted: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Any]:
+    """Formatted ("artists"|"tracks", range) top items and ("recent", "") plays, cached per user.
+
+    Misses are fetched together: concurrently on the async client, else one call at a time.
+    """
+    found: Dict[Tuple[str, str], Any] = {}
+    for part in wanted:
+        entry = _STATS_PARTS.get((user_id, *part))
+        if _is_fresh(entry):
+            found[part] = entry["data"]
+    missing = [part for part in wanted if part not in found]
+    if not missing:
+        return found
+
+    if async_available():
+        raw = dict(zip(missing, run_async(_fetch_parts_async(missing))))
+    else:
+        raw = {part: _fetch_part(sp, part) for part in missing}
+
+    now = time.time()
+    # Recent plays last, so their genre lookup finds the top artists' genres already cached.
+    for part in sorted(raw, key=lambda p: p[0] == "recent"):
+        kind, data = part[0], raw[part]
+        if kind == "artists":
+            value: Any = [_format_artist(a) for a in (data or {}).get("items") or [] if isinstance(a, dict)]
+        elif kind == "tracks":
+            value = [_format_track(t) for t in (data or {}).get("items") or [] if isinstance(t, dict)]
+        else:
+            items = (data or {}).get("items") or []
+            # The top artists' genres are already in hand; only the other artists are looked up.
+            known = build_artist_genre_lookup(sp, {r: v for (k, r), v in found.items() if k == "artists"}, [])
+            record_recent_items(user_id, items, genre_lookup=lambda ids: {
+                **known, **lookup_artist_genres(sp, [aid for aid in ids if aid not in known])})
+            value = _format_recent(items, _history_minutes(user_id))
+        found[part] = value
+        if user_id:
+            _cache_put(_STATS_PARTS, (user_id, *part), {"ts": now, "data": value})
+    return found
+
+
+def _fetch_part(sp: spotipy.Spotify, part: Tuple[str, str]) -> Any:
+    kind, range_key = part
+    if kind == "artists":
+        return sp.current_user_top_artists(limit=50, time_range=range_key)
+    if kind == "tracks":
+        return sp.current_user_top_tracks(limit=50, time_range=range_key)
+    return sp.current_user_recently_played(limit=_RECENT_PLAYS)
+
+
+async def _fetch_parts_async(parts: List[Tuple[str, str]]) -> List[Any]:
+    """Same as _fetch_part for every part, with all Spotify calls in flight at once."""
+    async with get_async_sp() as client:
+        def call(kind: str, range_key: str):
+            if kind == "artists":
+                return client.current_user_top_artists(limit=50, time_range=range_key)
+            if kind == "tracks":
+                return client.current_user_top_tracks(limit=50, time_range=range_key)
+            return client.current_user_recently_played(limit=_RECENT_PLAYS)
+        return await asyncio.gather(*(call(*part) for part in parts))
+
+
+def _format_artist(artist: Dict[str, Any]) -> Dict[str, Any]:
+    images = artist.get("images") or []
+    name = artist.get("name") or "Unknown Artist"
+    genres = (artist.get("genres") or [])[:3]
+    followers_raw = artist.get("followers") or {}
+    followers_total = followers_raw.get("total") if isinstance(followers_raw, dict) else None
+    popularity = artist.get("popularity")
+    primary_genre = genres[0] if genres else None
+
+    bio_parts = []
+    if primary_genre:
+        bio_parts.append(f"{name} is a {primary_genre} artist")
+    else:
+        bio_parts.append(f"{name} is an artist")
+    if isinstance(followers_total, int) and followers_total > 0:
+        bio_parts.append(f"followed by {followers_total:,} Spotify listeners")
+    if isinstance(popularity, int):
+        bio_parts.append(f"with a popularity score of {popularity}/100")
+    biography = ", ".join(bio_parts).strip()
+    if biography and not biography.endswith("."):
+        biography += "."
+
+    return {
+        "id": artist.get("id"),
+        "name": name,
+        "url": (artist.get("external_urls") or {}).get("spotify"),
+        "image": pick_image(images, TILE_PX),
+        "genres": genres,
+        "followers": followers_total,
+        "popularity": popularity,
+        "bio": biography,
+    }
+
+
+def _format_track(track: Dict[str, Any]) -> Dict[str, Any]:
+    artists = track.get("artists") or []
+    artist_ids = [a.get("id") for a in artists if a.get("id")]
+    album = track.get("album") or {}
+    album_images = album.get("images") or []
+    release_date = album.get("release_date") or ""
+    release_year = release_date[:4] if isinstance(release_date, str) else None
+    return {
+        "name": track.get("name"),
+        "artists": ", ".join(a.get("name", "") for a in artists),
+        "url": (track.get("external_urls") or {}).get("spotify"),
+        "album": album.get("name"),
+        "album_year": release_year,
+        "album_id": album.get("id"),
+        "album_url": (album.get("external_urls") or {}).get("spotify"),
+        "cover": pick_image(album_images, TILE_PX),
+        "artist_ids": artist_ids,
+    }
+
+
+def _history_minutes(user_id: Optional[str]) -> Optional[int]:
+    """Minutes listened in _RECENT_MINUTES_RANGE from the history rollups; None without a history store."""
+    if not (HISTORY_ENABLED and user_id):
+        return None
+    try:
+        start_ms, end_ms = resolve_range(_RECENT_MINUTES_RANGE)
+        return get_history_store().aggregate(user_id, start_ms, end_ms, limit=1)["minutes"]
+    except sqlite3.Error:
+        logger.exception("Could not read recent listening minutes for %s", user_id)
+        return None
+
+
+def _format_recent(items: List[Dict[str, Any]],
+                   history_minutes: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Any, str]:
+    """Formatted plays, minutes listened, and the window those minutes cover (_RECENT_MINUTES_LABELS key)."""
+    recently_played = []
+    recent_total_ms = 0
+    for item in items:
+        track = item.get('track') or {}
+        artists = track.get('artists') or []
+        duration_ms = track.get('duration_ms')
+        if isinstance(duration_ms, (int, float)):
+            recent_total_ms += duration_ms
+        album_images = (track.get('album') or {}).get('images') or []
+        cover = pick_image(album_images, THUMB_PX)
+        recently_played.append({
+            'name': track.get('name'),
+            'artists': ', '.join(a.get('name', '') for a in artists),
+            'url': (track.get('external_urls') or {}).get('spotify'),
+            'played_at': item.get('played_at'),
+            'duration_ms': duration_ms,
+            'cover': cover,
+        })
+    if history_minutes is not None:
+        return recently_played, history_minutes or None, _RECENT_MINUTES_RANGE
+    # Without the history store only the fetched plays are known.
+    recent_minutes = round(recent_total_ms / 60000) if recent_total_ms else None
+    return recently_played, recent_minutes, _RECENT_PLAYS_RANGE
+
+
+def _top_genres(sp: spotipy.Spotify, top_artists: Dict[str, List[Dict[str, Any]]],
+                top_tracks: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    track_artist_ids = [aid for tracks in top_tracks.values() for t in tracks for aid in t.get("artist_ids") or []]
+    artist_genre_lookup = build_artist_genre_lookup(sp, top_artists, track_artist_ids)
+    get_bio_service().prefetch({a["id"]: a["name"] for artists in top_artists.values() for a in artists
+                                if a.get("id")})
+    return summarize_genres_all_ranges(top_artists, top_tracks, artist_genre_lookup)
+
+
+def _top_albums(tracks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    album_map: Dict[str, Any] = {}
+    for t in tracks:
+        aid = t.get('album_id')
+        if not aid:
+            continue
+        if aid not in album_map:
+            album_map[aid] = {
+                'id': aid,
+                'name': t.get('album'),
+                'cover': t.get('cover'),
+                'artists': t.get('artists'),
+                'year': t.get('album_year'),
+                'url': t.get('album_url'),
+                'track_count': 0,
+            }
+        album_map[aid]['track_count'] += 1
+    return sorted(album_map.values(), key=lambda x: x['track_count'], reverse=True)
+
+
+@stats_bp.route("/api/listening-stats")
+def api_listening_stats():
+    """Plays, minutes, top artists and genres for an arbitrary window, from the local history rollups.
+
+    ?range=<RANGE_PRESETS key> (default last_7_days) or ?start=YYYY-MM-DD&end=YYYY-MM-DD (UTC, end inclusive).
+    """
+    if "token_info" not in session:
+        return jsonify({"ok": False, "error": "not_authenticated"}), 401
+    user_id = session.get("user_id")
+    if not user_id:
+        try:
+            user_id = (get_sp().current_user() or {}).get("id")
+        except SpotifyException as e:
+            logger.error("Spotify error in listening-stats: %s", e)
+            return jsonify({"ok": False, "error": "spotify_error"}), 500
+        if not user_id:
+            return jsonify({"ok": False, "error": "user_not_found"}), 400
+        session["user_id"] = user_id
+
+    start_arg, end_arg = request.args.get("start"), request.args.get("end")
+    if start_arg or end_arg:
+        try:
+            start = datetime.strptime(start_arg or "", "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            end = datetime.strptime(end_arg or "", "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+        except ValueError:
+            return jsonify({"ok": False, "error": "invalid_date"}), 400
+        if end <= start:
+            return jsonify({"ok": False, "error": "invalid_range"}), 400
+        range_key = "custom"
+        label = f"{start_arg} to {end_arg}"
+        window = (int(start.timestamp() * 1000), int(end.timestamp() * 1000))
+    else:
+        range_key = request.args.get("range") or "last_7_days"
+        window = resolve_range(range_key)
+        if window is None:
+            return jsonify({"ok": False, "error": "invalid_range"}), 400
+        label = RANGE_PRESETS[range_key]
+
+    limit = max(1, min(request.args.get("limit", default=10, type=int), 50))
+    stats = get_history_store().aggregate(user_id, window[0], window[1], limit=limit)
+    return jsonify({
+        "ok": True,
+        "range": range_key,
+        "label": label,
+        "start": window[0],
+        "end": window[1],
+        "ranges": RANGE_PRESETS,
+        **stats,
+    })
+
+
 @stats_bp.route("/api/search")
 def api_search():
-    token_info = session.get("token_info")
-    if not token_info:
+    if not session.get("token_info"):
         return jsonify({"ok": False, "error": "not_logged_in"}), 401
 
-    sp = spotipy.Spotify(auth=token_info.get("access_token"))
-
     query = request.args.get("q", "").strip()
     raw_types = request.args.get("type", "track,album")
     requested_types = [t.strip() for t in raw_types.split(',') if t.strip()]
     search_types = ','.join(requested_types) if requested_types else 'track'
     limit = min(int(request.args.get("limit", 5)), 20)
+    scope = request.args.get("scope", "catalog")
 
     if not query:
         return jsonify({"ok": True, "results": []})
 
+    # scope=library: tracks/albums from the user's own indexed playlists, no Spotify call
+    if scope == "library":
+        user_id = session.get("user_id")
+        results = get_library_index().search(user_id, query, search_types.split(","), limit) if user_id else []
+        return jsonify({"ok": True, "results": results, "source": "library"})
+
     try:
-        results = sp.search(q=query, type=search_types, limit=limit)
+        sp = get_sp()
+    except RuntimeError as err:
+        return jsonify({"ok": False, "error": str(err)}), 401
+
+    try:
+        results, source = cached_search(lambda q, t, n: sp.search(q=q, type=t, limit=n),
+                                        query, search_types, limit)
         items = []
 
         if "tracks" in results:
@@ -221,7 +479,7 @@ def api_search():
                     "seedType": "track",
                     "name": track.get("name"),
                     "artist": ", ".join(a.get("name") for a in (track.get("artists") or []) if a.get("name")),
-                    "image": album_images[0]["url"] if album_images else None,
+                    "image": pick_image(album_images, TILE_PX),
                     "id": track.get("id"),
                     "uri": track.get("uri"),
                     "album": album_info.get("name"),
@@ -239,7 +497,7 @@ def api_search():
                     "seedType": "artist",
                     "name": artist.get("name"),
                     "artist": artist.get("name"),
-                    "image": images[0]["url"] if images else None,
+                    "image": pick_image(images, TILE_PX),
                     "id": artist.get("id"),
                     "uri": (artist.get("external_urls") or {}).get("spotify"),
                     "genres": (artist.get("genres") or [])[:3],
@@ -255,7 +513,7 @@ def api_search():
                     "type": "album",
                     "name": album.get("name"),
                     "artist": ", ".join(a.get("name") for a in (album.get("artists") or []) if a.get("name")),
-                    "image": album_images[0]["url"] if album_images else None,
+                    "image": pick_image(album_images, TILE_PX),
                     "id": album.get("id"),
                     "uri": album.get("uri"),
                     "album": album.get("name"),
@@ -263,7 +521,7 @@ def api_search():
                     "album_year": release_year
                 })
 
-        return jsonify({"ok": True, "results": items})
+        return jsonify({"ok": True, "results": items, "source": source})
 
     except SpotifyException as e:
         logger.error("Spotify error in search: %s", e)
@@ -278,10 +536,11 @@ def api_artist_details(artist_id: str):
     if not is_valid_spotify_id(artist_id):
         return jsonify({"ok": False, "error": "invalid_artist_id"}), 400
 
-    # Return cached artist if still fresh
-    cached = _ARTIST_CACHE.get(artist_id)
-    if cached and (time.time() - cached["ts"]) < _ARTIST_TTL:
-        return jsonify(cached["data"])
+    # Artist pages are identical for every user, so they live in the shared catalog cache
+    catalog = get_catalog()
+    entry = catalog.get_entry("artist_page", artist_id)
+    if entry is not None:
+        return cached_json_response(entry)
 
     try:
         sp = get_sp()
@@ -289,13 +548,18 @@ def api_artist_details(artist_id: str):
         return jsonify({"ok": False, "error": str(err)}), 401
 
     try:
-        artist = sp.artist(artist_id) or {}
+        entry = catalog.get_or_fetch("artist_page", artist_id, lambda: _build_artist_page(sp, catalog, artist_id))
     except SpotifyException as err:
         status = err.http_status or 500
         return jsonify({"ok": False, "error": "spotify_artist_error"}), status
     except Exception:
         logger.exception("Unexpected error fetching artist %s", artist_id)
         return jsonify({"ok": False, "error": "artist_fetch_failed"}), 500
+    return cached_json_response(entry)
+
+
+def _build_artist_page(sp: spotipy.Spotify, catalog: CatalogCache, artist_id: str) -> Dict[str, Any]:
+    artist = (catalog.get_or_fetch("artist", artist_id, lambda: sp.artist(artist_id)) or {}).get("data") or {}
 
     images = artist.get("images") or []
     genres = artist.get("genres") or []
@@ -304,14 +568,15 @@ def api_artist_details(artist_id: str):
 
     top_tracks_list: List[Dict[str, Any]] = []
     try:
-        top_tracks = sp.artist_top_tracks(artist_id) or {}
+        top_tracks = (catalog.get_or_fetch("artist_top_tracks", artist_id,
+                                           lambda: sp.artist_top_tracks(artist_id)) or {}).get("data") or {}
         for track in (top_tracks.get("tracks") or [])[:10]:
             album = track.get("album") or {}
             album_images = album.get("images") or []
             top_tracks_list.append({
                 "id": track.get("id"),
                 "name": track.get("name"),
-                "cover": album_images[0].get("url") if album_images else None,
+                "cover": pick_image(album_images, TILE_PX),
                 "album": album.get("name"),
                 "url": (track.get("external_urls") or {}).get("spotify"),
             })
@@ -320,25 +585,26 @@ def api_artist_details(artist_id: str):
 
     albums_list: List[Dict[str, Any]] = []
     try:
-        albums = sp.artist_albums(artist_id, album_type='album', limit=50) or {}
+        albums = (catalog.get_or_fetch("artist_albums", artist_id,
+                                       lambda: sp.artist_albums(artist_id, album_type='album', limit=50)) or {}).get("data") or {}
         for album in (albums.get("items") or []):
             album_images = album.get("images") or []
             albums_list.append({
                 "id": album.get("id"),
                 "name": album.get("name"),
-                "cover": album_images[0].get("url") if album_images else None,
+                "cover": pick_image(album_images, TILE_PX),
                 "release_date": album.get("release_date"),
                 "url": (album.get("external_urls") or {}).get("spotify"),
             })
     except Exception:
         pass
 
-    payload = {
+    return {
         "ok": True,
         "artist": {
             "id": artist.get("id") or artist_id,
             "name": artist.get("name"),
-            "image": images[0].get("url") if images else None,
+            "image": pick_image(images, FULL_PX),
             "genres": genres,
             "followers": followers_total,
             "popularity": artist.get("popularity"),
@@ -347,8 +613,6 @@ def api_artist_details(artist_id: str):
             "albums": albums_list,
         }
     }
-    _ARTIST_CACHE[artist_id] = {"ts": time.time(), "data": payload}
-    return jsonify(payload)
 
 
 @stats_bp.route("/api/artists/<artist_id>/bio")
@@ -356,60 +620,31 @@ def api_artist_bio(artist_id: str):
     if not is_valid_spotify_id(artist_id):
         return jsonify({"ok": False, "error": "invalid_artist_id"}), 400
 
-    # Return cached bio if still fresh (24h — bios rarely change)
-    cached = _BIO_CACHE.get(artist_id)
-    if cached and (time.time() - cached["ts"]) < _BIO_TTL:
-        return jsonify({"ok": True, "bio": cached["bio"], "source": cached["source"]})
-
-    # Resolve artist name — reuse artist detail cache if available
-    artist_name = ""
-    artist_cached = _ARTIST_CACHE.get(artist_id)
-    if artist_cached:
-        artist_name = (artist_cached["data"].get("artist") or {}).get("name", "")
-
-    if not artist_name:
+    # Stored bio (24h, shared across workers and restarts; usually prefetched by /api/user-stats)
+    bios = get_bio_service()
+    cached = bios.cached([artist_id]).get(artist_id)
+    record_cache("bio", cached is not None)
+    if cached is not None:
+        return jsonify({"ok": True, **cached})
+
+    # Resolve artist name through the shared catalog (usually warm from the artist page)
+    catalog = get_catalog()
+    artist = catalog.get("artist", artist_id)
+    if artist is None:
         try:
             sp = get_sp()
-            artist = sp.artist(artist_id) or {}
-            artist_name = artist.get("name", "")
+            artist = (catalog.get_or_fetch("artist", artist_id, lambda: sp.artist(artist_id)) or {}).get("data")
         except Exception:
             logger.exception("Error fetching artist name for bio: %s", artist_id)
             return jsonify({"ok": False, "error": "internal_error"}), 500
+    artist_name = (artist or {}).get("name", "")
 
     if not artist_name:
         return jsonify({"ok": False, "error": "artist_not_found"}), 404
 
-    # Fetch full intro section from Wikipedia (much more detailed than /page/summary)
+    # Full intro section from Wikipedia (much more detailed than /page/summary)
     try:
-        params = {
-            "action": "query",
-            "titles": artist_name,
-            "prop": "extracts|info",
-            "exintro": True,
-            "explaintext": True,
-            "inprop": "url",
-            "format": "json",
-            "redirects": 1,
-        }
-        resp = http_requests.get(
-            "https://en.wikipedia.org/w/api.php",
-            params=params,
-            timeout=8,
-            headers={"User-Agent": "Orpheus/2.0"},
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        pages = (data.get("query") or {}).get("pages") or {}
-        page = next(iter(pages.values()), {})
-
-        if page.get("pageid") == -1 or not page.get("extract"):
-            _BIO_CACHE[artist_id] = {"ts": time.time(), "bio": None, "source": None}
-            return jsonify({"ok": True, "bio": None, "source": None})
-
-        bio = page["extract"].strip()
-        source = page.get("fullurl")
-        _BIO_CACHE[artist_id] = {"ts": time.time(), "bio": bio, "source": source}
-        return jsonify({"ok": True, "bio": bio, "source": source})
+        return jsonify({"ok": True, **bios.get_many({artist_id: artist_name}, record=False)[artist_id]})
     except Exception:
         logger.exception("Error fetching Wikipedia bio for %s", artist_id)
         return jsonify({"ok": False, "error": "bio_unavailable"}), 500
@@ -420,13 +655,18 @@ def api_album_details(album_id: str):
     if not is_valid_spotify_id(album_id):
         return jsonify({"ok": False, "error": "invalid_album_id"}), 400
 
+    catalog = get_catalog()
+    entry = catalog.get_entry("album_page", album_id)
+    if entry is not None:
+        return cached_json_response(entry)
+
     try:
         sp = get_sp()
     except RuntimeError as err:
         return jsonify({"ok": False, "error": str(err)}), 401
 
     try:
-        album = sp.album(album_id) or {}
+        entry = catalog.get_or_fetch("album_page", album_id, lambda: _build_album_page(sp, album_id))
     except SpotifyException as err:
         logger.error("Spotify error fetching album %s: %s", album_id, err)
         status = err.http_status or 500
@@ -434,12 +674,17 @@ def api_album_details(album_id: str):
     except Exception:
         logger.exception("Unexpected error fetching album %s", album_id)
         return jsonify({"ok": False, "error": "album_fetch_failed"}), 500
+    return cached_json_response(entry)
+
+
+def _build_album_page(sp: spotipy.Spotify, album_id: str) -> Dict[str, Any]:
+    album = sp.album(album_id) or {}
 
     release_date = album.get("release_date") or ""
     release_year = release_date[:4] if isinstance(release_date, str) else None
     images = album.get("images") or []
     artists = [a.get("name") for a in (album.get("artists") or []) if a.get("name")]
-    cover = images[0].get("url") if images else None
+    cover = pick_image(images, FULL_PX)
 
     tracks: List[Dict[str, Any]] = []
     try:
@@ -458,7 +703,7 @@ def api_album_details(album_id: str):
     except Exception:
         pass
 
-    return jsonify({
+    return {
         "ok": True,
         "album": {
             "id": album.get("id") or album_id,
@@ -470,4 +715,4 @@ def api_album_details(album_id: str):
             "total_tracks": album.get("total_tracks"),
             "tracks": tracks,
         }
-    })
+    }
@@ -0,0 +1,90 @@
+"""Cached Spotify catalog search for the as-you-type search box.
+
+Search results are catalog data, so they go through the shared CatalogCache (kind "search", short
+TTL) keyed by normalized query, type set and limit, and concurrent identical searches share one
+upstream call.
+
+Typing extends a query one character at a time. When a shorter prefix of the new query is cached
+and was complete (Spotify reported no more matches than it returned for every type), the longer
+query can only match a subset of it, so it is answered by filtering that result set locally.
+"""
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from catalog_cache import get_catalog
+from instrumentation import record_cache
+
+# ---------- Constants ----------
+_MIN_PREFIX = 2
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join((query or "").lower().split())
+
+
+def search_key(query: str, types: str, limit: int) -> str:
+    return f"{','.join(sorted(types.split(',')))}|{limit}|{normalize_query(query)}"
+
+
+def _trim(results: Dict[str, Any]) -> Dict[str, Any]:
+    # Keep only what the search route reads; paging links and hrefs are dead weight in the cache.
+    return {kind: {"items": [i for i in (page or {}).get("items") or [] if i],
+                   "total": (page or {}).get("total") or 0}
+            for kind, page in (results or {}).items() if isinstance(page, dict)}
+
+
+def _complete(results: Dict[str, Any]) -> bool:
+    return all(page["total"] <= len(page["items"]) for page in results.values())
+
+
+def _item_words(item: Dict[str, Any]) -> List[str]:
+    parts = [item.get("name") or ""]
+    parts.extend(a.get("name") or "" for a in item.get("artists") or [])
+    parts.append((item.get("album") or {}).get("name") or "")
+    return _WORD_RE.findall(" ".join(parts).lower())
+
+
+def _filter(results: Dict[str, Any], query: str) -> Dict[str, Any]:
+    terms = _WORD_RE.findall(query)
+    filtered = {}
+    for kind, page in results.items():
+        items = [item for item in page["items"]
+                 if all(any(word.startswith(t) for word in _item_words(item)) for t in terms)]
+        filtered[kind] = {"items": items, "total": len(items)}
+    return filtered
+
+
+def _from_prefix(types: str, limit: int, query: str) -> Optional[Dict[str, Any]]:
+    if len(query) <= _MIN_PREFIX:
+        return None
+    keys = [search_key(query[:n], types, limit) for n in range(len(query) - 1, _MIN_PREFIX - 1, -1)]
+    cached = get_catalog().get_many("search", keys, record=False)
+    for key in keys:
+        results = cached.get(key)
+        if results is not None and _complete(results):
+            return _filter(results, query)
+    return None
+
+
+def cached_search(search: Callable[[str, str, int], Dict[str, Any]], query: str, types: str,
+                  limit: int) -> Tuple[Dict[str, Any], str]:
+    """Search results for query, plus where they came from: "cache", "prefix" or "spotify".
+
+    search(query, types, limit) performs the upstream call (normally sp.search).
+    """
+    norm = normalize_query(query)
+    key = search_key(norm, types, limit)
+    catalog = get_catalog()
+    entry = catalog.get_entry("search", key)
+    if entry is not None:
+        return entry["data"], "cache"
+
+    local = _from_prefix(types, limit, norm)
+    record_cache("search.prefix", local is not None)
+    if local is not None:
+        catalog.put("search", key, local)
+        return local, "prefix"
+
+    entry = catalog.get_or_fetch("search", key, lambda: _trim(search(norm, types, limit)))
+    return (entry or {}).get("data") or {}, "spotify"
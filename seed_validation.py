@@ -0,0 +1,135 @@
+"""Cached existence checks for recommendation seeds.
+
+Seed ids are checked against the shared CatalogCache before Spotify is asked:
+
+  - a track/artist object cached under kind "track"/"artist" means the id exists (the artist
+    entries are the same ones the genre lookups write),
+  - a marker under "missing_track"/"missing_artist" means Spotify recently returned null for it;
+    those expire after an hour so a re-released id is not blocked for long.
+
+Whatever is left is checked in one step: tracks and artists are fetched concurrently on the async
+client when it is available. When Spotify cannot vouch for an id either way (rate limit, outage),
+SeedValidationError is raised rather than passing an unchecked id on; nothing is cached for it.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import spotipy
+from spotipy.exceptions import SpotifyException
+
+from async_spotify import run_async
+from catalog_cache import get_catalog
+from spotify_client import async_available, chunked, get_async_sp
+
+logger = logging.getLogger(__name__)
+
+# ---------- Constants ----------
+# kind -> (catalog kind for misses, response key, batch size Spotify accepts)
+_SEED_KINDS: Dict[str, Tuple[str, str, int]] = {
+    "track": ("missing_track", "tracks", 50),
+    "artist": ("missing_artist", "artists", 50),
+}
+
+# None in a result map = could not verify; not cached, and validate_seeds raises.
+Verdicts = Dict[str, Optional[Any]]
+
+
+class SeedValidationError(Exception):
+    """Spotify could not confirm or reject some seeds (rate limit, outage)."""
+
+    def __init__(self, unverified: List[str]):
+        super().__init__(f"{len(unverified)} seeds could not be validated")
+        self.unverified = unverified
+
+
+def _pending(kind: str, ids: Sequence[str]) -> Tuple[Dict[str, bool], List[str]]:
+    catalog = get_catalog()
+    known = {i: True for i in catalog.get_many(kind, ids)}
+    rest = [i for i in ids if i not in known]
+    known.update({i: False for i in catalog.get_many(_SEED_KINDS[kind][0], rest)})
+    return known, [i for i in rest if i not in known]
+
+
+def _verdicts(ids: Sequence[str], response: Dict[str, Any], key: str) -> Verdicts:
+    objects = {obj["id"]: obj for obj in (response or {}).get(key) or [] if obj and obj.get("id")}
+    return {i: objects.get(i, False) for i in ids}
+
+
+def _on_error(kind: str, ids: List[str], err: SpotifyException) -> Verdicts:
+    # A 400 for a single id means Spotify rejects the id itself; anything else says nothing about it.
+    if err.http_status == 400 and len(ids) == 1:
+        return {ids[0]: False}
+    logger.warning("Could not validate %d %s seeds: %s", len(ids), kind, err)
+    return {i: None for i in ids}
+
+
+def _fetch_sync(sp: spotipy.Spotify, kind: str, ids: List[str]) -> Verdicts:
+    key, size = _SEED_KINDS[kind][1:]
+    fetch = sp.tracks if kind == "track" else sp.artists
+    out: Verdicts = {}
+    for batch in chunked(ids, size):
+        try:
+            out.update(_verdicts(batch, fetch(batch), key))
+        except SpotifyException as err:
+            if err.http_status == 400 and len(batch) > 1:
+                # One malformed id fails the whole batch; retry individually to find it.
+                for item_id in batch:
+                    out.update(_fetch_sync(sp, kind, [item_id]))
+            else:
+                out.update(_on_error(kind, batch, err))
+    return out
+
+
+async def _fetch_async(pending: Dict[str, List[str]]) -> Dict[str, Verdicts]:
+    async with get_async_sp() as client:
+        async def fetch(kind: str, ids: List[str]) -> Verdicts:
+            key, size = _SEED_KINDS[kind][1:]
+            get = client.tracks if kind == "track" else client.artists
+            out: Verdicts = {}
+            for batch in chunked(ids, size):
+                try:
+                    out.update(_verdicts(batch, await get(batch), key))
+                except SpotifyException as err:
+                    if err.http_status == 400 and len(batch) > 1:
+                        for item_id in batch:
+                            out.update(await fetch(kind, [item_id]))
+                    else:
+                        out.update(_on_error(kind, batch, err))
+            return out
+
+        kinds = [k for k, ids in pending.items() if ids]
+        results = await asyncio.gather(*(fetch(k, pending[k]) for k in kinds))
+    return dict(zip(kinds, results))
+
+
+def validate_seeds(sp: spotipy.Spotify, track_ids: Sequence[str],
+                   artist_ids: Sequence[str]) -> Tuple[List[str], List[str]]:
+    """(track_ids, artist_ids) with ids Spotify does not know removed; input order is kept.
+
+    Raises SeedValidationError when Spotify could not check some of the ids.
+    """
+    requested = {"track": list(track_ids or []), "artist": list(artist_ids or [])}
+    known: Dict[str, Dict[str, bool]] = {}
+    pending: Dict[str, List[str]] = {}
+    for kind, ids in requested.items():
+        known[kind], pending[kind] = _pending(kind, ids)
+
+    if any(pending.values()):
+        if async_available():
+            fetched = run_async(_fetch_async(pending))
+        else:
+            fetched = {kind: _fetch_sync(sp, kind, ids) for kind, ids in pending.items() if ids}
+        catalog = get_catalog()
+        unverified: List[str] = []
+        for kind, verdicts in fetched.items():
+            catalog.put_many(kind, {i: obj for i, obj in verdicts.items() if obj})
+            catalog.put_many(_SEED_KINDS[kind][0], {i: True for i, obj in verdicts.items() if obj is False})
+            known[kind].update({i: bool(obj) for i, obj in verdicts.items()})
+            unverified.extend(i for i, obj in verdicts.items() if obj is None)
+        if unverified:
+            # Verdicts for the other ids are cached above, so a retry only re-checks these.
+            raise SeedValidationError(unverified)
+
+    return ([i for i in requested["track"] if known["track"].get(i)],
+            [i for i in requested["artist"] if known["artist"].get(i)])
@@ -0,0 +1,59 @@
+"""Compressed sparse row (CSR) incidence matrices, shared by the genre aggregation and the recommender.
+
+Row i's column ids are indices[indptr[i]:indptr[i + 1]], two flat NumPy arrays. Both users only
+need the same few operations: build from per-row id lists, transpose, and read many rows at once
+(gather), which is what lets them score or count with a single bincount.
+"""
+from typing import Sequence
+
+import numpy as np
+
+
+class CSR:
+    """Immutable rows x n_cols 0/1 matrix."""
+
+    __slots__ = ("indptr", "indices", "n_cols")
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, n_cols: int):
+        self.indptr = indptr
+        self.indices = indices
+        self.n_cols = n_cols
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Sequence[int]], n_cols: int) -> "CSR":
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter((len(r) for r in rows), dtype=np.int64, count=len(rows)), out=indptr[1:])
+        indices = np.fromiter((c for r in rows for c in r), dtype=np.int32, count=int(indptr[-1]))
+        return cls(indptr, indices, n_cols)
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.indptr) - 1
+
+    def row(self, i: int) -> np.ndarray:
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def row_lengths(self, rows=None) -> np.ndarray:
+        if rows is None:
+            return np.diff(self.indptr)
+        rows = np.asarray(rows, dtype=np.int64)
+        return self.indptr[rows + 1] - self.indptr[rows]
+
+    def gather(self, rows) -> np.ndarray:
+        """Column ids of the given rows, concatenated in the order the rows are given."""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        if not lengths.size:
+            return self.indices[:0]
+        # Offset of each output slot into indices, built without a Python loop over rows.
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        return self.indices[offsets + np.arange(int(lengths.sum()))]
+
+    def transpose(self) -> "CSR":
+        """n_cols x n_rows matrix; each of its rows lists the original rows in ascending order."""
+        rows = np.repeat(np.arange(self.n_rows, dtype=np.int32), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind="stable")
+        indptr = np.zeros(self.n_cols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=self.n_cols), out=indptr[1:])
+        return CSR(indptr, rows[order], self.n_rows)
@@ -1,22 +1,34 @@
 import re
 import time
-from collections import Counter
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import spotipy
 import requests
-from flask import session
+from flask import has_request_context, session
 from spotipy.oauth2 import SpotifyOAuth
 from spotipy.exceptions import SpotifyException
 from spotipy.cache_handler import MemoryCacheHandler
 
+from async_spotify import ASYNC_ENABLED, AsyncSpotify, fetch_all_playlist_items, run_async
+from catalog_cache import get_catalog
+from genres import ARTIST_GENRE_CACHE
+from http_cache import SPOTIFY_API_PREFIX, ConditionalSession
+from library_index import index_playlist_items
+from listening_history import (
+    collector as history_collector,
+    days_ago_ms,
+    get_store as get_history_store,
+    record_recent_items,
+)
+from token_store import get_token_store, token_key
 from utils import getenv_stripped, normalize, safe_get
 
 # ---------- Constants ----------
 DOTENV_PATH = Path(__file__).with_name(".env")
 
 RECENT_ID = "__recent__"
+RECENT_30D_ID = "__recent_30d__"   # served from the local listening history
 
 SCOPES = " ".join([
     "playlist-read-private",
@@ -58,19 +70,41 @@ def sp_oauth() -> SpotifyOAuth:
     )
 
 
-def get_sp() -> spotipy.Spotify:
+def get_access_token() -> str:
+    """Return the session's access token from the server-side token store.
+
+    The store renews tokens in the background before they expire; the session's token_info only
+    seeds it the first time this worker sees the login.
+    """
     token_info = session.get("token_info")
     if not token_info:
         raise RuntimeError("Not authenticated. Click 'Login with Spotify'.")
 
-    oauth = sp_oauth()
-    if token_info.get("refresh_token") and oauth.is_token_expired(token_info):
-        token_info = oauth.refresh_access_token(token_info["refresh_token"])
-        session["token_info"] = token_info
+    key = token_key(token_info)
+    access_token = get_token_store().access_token(key, seed=token_info)
+    history_collector.track(session.get("user_id"), key)
+    return access_token
+
+
+def spotify_for_token(access_token: str) -> spotipy.Spotify:
+    # ETag-aware session: unchanged GET resources come back as tiny 304s and are served from cache.
+    sp = spotipy.Spotify(auth=access_token, requests_session=ConditionalSession())
+    sp.prefix = SPOTIFY_API_PREFIX
+    return sp
+
+
+def get_sp() -> spotipy.Spotify:
+    return spotify_for_token(get_access_token())
+
 
-    if not token_info.get("access_token"):
-        raise RuntimeError("Missing access token. Please log in again.")
-    return spotipy.Spotify(auth=token_info["access_token"])
+def async_available() -> bool:
+    """True when the async fan-out path can run: httpx is installed and we're inside an authenticated request."""
+    return ASYNC_ENABLED and has_request_context() and bool(session.get("token_info"))
+
+
+def get_async_sp() -> AsyncSpotify:
+    """Async client sharing get_sp()'s token handling; use inside `async with` under run_async()."""
+    return AsyncSpotify(get_access_token())
 
 
 # ---------- Pagination ----------
@@ -132,6 +166,8 @@ def canonical_artists(artists: Optional[List[Dict[str, Any]]]) -> str:
 def get_recent_track_uris(sp: spotipy.Spotify, limit: int = 50) -> List[str]:
     data = sp.current_user_recently_played(limit=limit) or {}
     items = data.get("items", []) or []
+    record_recent_items(session.get("user_id") if has_request_context() else None, items,
+                        genre_lookup=lambda ids: lookup_artist_genres(sp, ids))
     uris: List[str] = []
     for it in items:
         tr = (it or {}).get("track") or {}
@@ -144,10 +180,23 @@ def get_recent_track_uris(sp: spotipy.Spotify, limit: int = 50) -> List[str]:
 def get_reference_uris(sp: spotipy.Spotify, playlist_id: str) -> List[str]:
     if playlist_id == RECENT_ID:
         return get_recent_track_uris(sp, limit=50)
+    if playlist_id == RECENT_30D_ID:
+        live = get_recent_track_uris(sp, limit=50)
+        stored = get_history_store().track_uris_since(current_user_id(sp), days_ago_ms(30))
+        return list(dict.fromkeys(live + stored))
     return get_all_track_uris(sp, playlist_id)
 
 
 def playlist_items_with_positions(sp: spotipy.Spotify, playlist_id: str) -> List[Dict[str, Any]]:
+    items = _fetch_playlist_items(sp, playlist_id)
+    index_playlist_items(session.get("user_id") if has_request_context() else None, playlist_id, items)
+    return items
+
+
+def _fetch_playlist_items(sp: spotipy.Spotify, playlist_id: str) -> List[Dict[str, Any]]:
+    if async_available():
+        return run_async(_playlist_items_async(playlist_id))
+
     items: List[Dict[str, Any]] = []
     offset = 0
     limit = 100
@@ -163,9 +212,19 @@ def playlist_items_with_positions(sp: spotipy.Spotify, playlist_id: str) -> List
     return items
 
 
+async def _playlist_items_async(playlist_id: str) -> List[Dict[str, Any]]:
+    async with get_async_sp() as client:
+        return await fetch_all_playlist_items(client, playlist_id)
+
+
 def get_all_track_uris(sp: spotipy.Spotify, playlist_id: str) -> List[str]:
     uris: List[str] = []
-    for it in paginate(lambda o, l: sp.playlist_items(playlist_id, limit=l, offset=o)):
+    if async_available():
+        items = playlist_items_with_positions(sp, playlist_id)
+    else:
+        items = list(paginate(lambda o, l: sp.playlist_items(playlist_id, limit=l, offset=o)))
+        index_playlist_items(session.get("user_id") if has_request_context() else None, playlist_id, items)
+    for it in items:
         if not isinstance(it, dict):
             continue
         track = safe_get(it, "track")
@@ -186,61 +245,7 @@ def user_owns_playlist(sp: spotipy.Spotify, playlist_id: str) -> bool:
     return normalize(safe_get(owner, "id")) == normalize(current_user_id(sp))
 
 
-def list_owned_playlists(sp: spotipy.Spotify) -> List[Dict[str, Any]]:
-    me_id = normalize(current_user_id(sp))
-    return [pl for pl in paginate(lambda o, l: sp.current_user_playlists(limit=l, offset=o))
-            if normalize(safe_get(safe_get(pl, "owner", {}), "id")) == me_id]
-
-
-def list_all_playlists(sp: spotipy.Spotify) -> List[Dict[str, Any]]:
-    return list(paginate(lambda o, l: sp.current_user_playlists(limit=l, offset=o)))
-
-
 # ---------- Genre / stats helpers ----------
-def summarize_genres(top_artists: Dict[str, List[Dict[str, Any]]], range_key: str = "short_term", limit: int = 10) -> List[Dict[str, Any]]:
-    artists = top_artists.get(range_key) if isinstance(top_artists, dict) else []
-    counter = Counter()
-    for artist in artists or []:
-        for genre in (artist.get("genres") or []):
-            name = (genre or "").strip()
-            if name:
-                counter[name] += 1
-    total = sum(counter.values())
-    if not total:
-        return []
-    genres = []
-    for genre_name, count in counter.most_common(limit):
-        genres.append({
-            "genre": genre_name.title(),
-            "count": count,
-            "percentage": round((count / total) * 100, 1),
-        })
-    return genres
-
-
-def summarize_genres_from_tracks(top_tracks: Dict[str, List[Dict[str, Any]]], artist_genres: Dict[str, List[str]],
-                                  range_key: str = "short_term", limit: int = 10) -> List[Dict[str, Any]]:
-    tracks = top_tracks.get(range_key) if isinstance(top_tracks, dict) else []
-    counter = Counter()
-    for track in tracks or []:
-        for artist_id in (track.get("artist_ids") or []):
-            for genre in artist_genres.get(artist_id, []):
-                name = (genre or "").strip()
-                if name:
-                    counter[name] += 1
-    total = sum(counter.values())
-    if not total:
-        return []
-    genres = []
-    for genre_name, count in counter.most_common(limit):
-        genres.append({
-            "genre": genre_name.title(),
-            "count": count,
-            "percentage": round((count / total) * 100, 1),
-        })
-    return genres
-
-
 def build_artist_genre_lookup(sp: spotipy.Spotify, top_artists: Dict[str, List[Dict[str, Any]]],
                                extra_artist_ids: Iterable[str]) -> Dict[str, List[str]]:
     """Create a lookup of artist_id -> genres using cached data from top_artists and additional Spotify lookups."""
@@ -251,15 +256,31 @@ def build_artist_genre_lookup(sp: spotipy.Spotify, top_artists: Dict[str, List[D
             if aid and aid not in genre_map:
                 genre_map[aid] = artist.get("genres") or []
 
+    ARTIST_GENRE_CACHE.put_many(genre_map)
+
     missing_ids = {aid for aid in (extra_artist_ids or []) if aid and aid not in genre_map}
-    for chunk in chunked(missing_ids, 50):
+    genre_map.update(lookup_artist_genres(sp, missing_ids))
+    return genre_map
+
+
+def lookup_artist_genres(sp: spotipy.Spotify, artist_ids: Iterable[str]) -> Dict[str, List[str]]:
+    """artist_id -> genres: in-process genre cache, then the shared catalog, then batched /artists calls (50 ids each)."""
+    genre_map, missing = ARTIST_GENRE_CACHE.get_many(artist_ids or [])
+    catalog = get_catalog()
+    fetched: Dict[str, List[str]] = {}
+    if missing:
+        for aid, artist in catalog.get_many("artist", missing).items():
+            fetched[aid] = (artist or {}).get("genres") or []
+    for chunk in chunked([aid for aid in missing if aid not in fetched], 50):
         if not chunk:
             continue
         resp = sp.artists(chunk) or {}
-        for artist in (resp.get("artists") or []):
-            aid = artist.get("id")
-            if aid:
-                genre_map[aid] = artist.get("genres") or []
+        artists = {a["id"]: a for a in (resp.get("artists") or []) if (a or {}).get("id")}
+        catalog.put_many("artist", artists)
+        for aid, artist in artists.items():
+            fetched[aid] = artist.get("genres") or []
+    ARTIST_GENRE_CACHE.put_many(fetched)
+    genre_map.update(fetched)
     return genre_map
 
 
@@ -0,0 +1,329 @@
+"""Server-side store for Spotify OAuth tokens.
+
+The signed session cookie keeps the token_info issued at login. That copy only seeds this store
+and lets a fresh worker recover after a restart. Refreshed tokens live here: in process memory,
+or in Redis when ORPHEUS_REDIS_URL is set, so every worker sees the same token.
+
+A background thread renews tokens ORPHEUS_TOKEN_REFRESH_AHEAD_S before they expire, so requests
+normally find a valid token and never wait on accounts.spotify.com. Only tokens a user request
+used within the last _RENEW_IF_USED_S are renewed ahead; background users such as the history
+collector pass touch=False and refresh inline when they find the token expired, so a user who
+stops visiting is dropped after _IDLE_DROP_S. Concurrent refreshes of one token are coalesced: per
+process with a lock, and across processes with a short Redis lock.
+
+Logging out deletes the Redis copy, and a Redis miss drops the local copy in every worker. Without
+Redis, logouts are also written to a small SQLite table under data_dir() that every worker checks
+before using a token from its own memory.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from utils import data_dir, getenv_stripped
+
+try:
+    import redis
+except ImportError:  # optional: tokens stay in process memory
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# ---------- Constants ----------
+_REDIS_URL = getenv_stripped("ORPHEUS_REDIS_URL")
+_REDIS_PREFIX = "orpheus:token:"
+_REDIS_RETRY_S = 30
+_REFRESH_AHEAD_S = int(getenv_stripped("ORPHEUS_TOKEN_REFRESH_AHEAD_S") or 300)
+_EXPIRY_MARGIN_S = 60            # same margin as SpotifyOAuth.is_token_expired
+_SWEEP_INTERVAL_S = 30
+_RENEW_IF_USED_S = 3600          # renew ahead only tokens a user request used this recently
+_IDLE_DROP_S = 30 * 86400        # forget tokens no user request used for this long
+_LOCK_TTL_MS = 15_000
+_LOCK_WAIT_S = 10
+
+TokenInfo = Dict[str, Any]
+
+
+def token_key(token_info: TokenInfo) -> str:
+    """Stable store key for one login: derived from the refresh token the session was issued."""
+    secret = token_info.get("refresh_token") or token_info.get("access_token") or ""
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:32]
+
+
+def _expires_in(token_info: TokenInfo) -> float:
+    return float(token_info.get("expires_at") or 0) - time.time()
+
+
+def _default_refresh(refresh_token: str) -> TokenInfo:
+    # Imported lazily: spotify_client imports this module.
+    from spotify_client import sp_oauth
+    return sp_oauth().refresh_access_token(refresh_token)
+
+
+class _Logouts:
+    """Keys logged out in any worker, so the memory backend's other workers stop using them."""
+
+    def __init__(self, path=None):
+        self.path = path or data_dir() / "token_logouts.sqlite3"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS logouts (key TEXT PRIMARY KEY, ts REAL NOT NULL)")
+            self._conn.commit()
+
+    def add(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO logouts VALUES (?, ?)", (key, time.time()))
+
+    def remove(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM logouts WHERE key = ?", (key,))
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM logouts WHERE key = ?", (key,)).fetchone() is not None
+
+
+class TokenStore:
+    def __init__(self, redis_url: Optional[str] = _REDIS_URL,
+                 refresh: Callable[[str], TokenInfo] = _default_refresh,
+                 refresh_ahead_s: int = _REFRESH_AHEAD_S, logouts_path=None):
+        self.refresh_ahead_s = refresh_ahead_s
+        self._refresh_token = refresh
+        self._logouts = _Logouts(logouts_path)
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, TokenInfo] = {}
+        self._used: Dict[str, float] = {}
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.refreshes = 0
+
+        self._redis = None
+        self._redis_down_until = 0.0
+        if redis_url and redis is not None:
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        elif redis_url:
+            logger.warning("ORPHEUS_REDIS_URL is set but the redis package is not installed")
+
+    # ---------- Storage ----------
+    def get(self, key: str) -> Optional[TokenInfo]:
+        if self._redis_available():
+            try:
+                raw = self._redis.get(_REDIS_PREFIX + key)
+                info = json.loads(raw) if raw else None
+                with self._lock:
+                    # Redis is the shared copy: a miss means logged out (or expired) in some worker.
+                    if info is None:
+                        self._drop_local(key)
+                    else:
+                        self._tokens[key] = info
+                return info
+            except redis.RedisError:
+                self._redis_failed()
+        if self._logged_out(key):
+            with self._lock:
+                self._drop_local(key)
+            return None
+        with self._lock:
+            return self._tokens.get(key)
+
+    def put(self, key: str, token_info: TokenInfo, keep_ttl: bool = False) -> TokenInfo:
+        info = dict(token_info)
+        with self._lock:
+            self._tokens[key] = info
+            if not keep_ttl:
+                self._used.setdefault(key, time.time())
+        if self._redis_available():
+            try:
+                if keep_ttl:
+                    # A refresh is not a visit: the idle expiry keeps counting from the last user request.
+                    self._redis.set(_REDIS_PREFIX + key, json.dumps(info), keepttl=True)
+                else:
+                    self._redis.set(_REDIS_PREFIX + key, json.dumps(info), ex=_IDLE_DROP_S)
+            except redis.RedisError:
+                self._redis_failed()
+        self._ensure_refresher()
+        return info
+
+    def admit(self, key: str, token_info: TokenInfo) -> TokenInfo:
+        """Store the token of a fresh login, lifting any earlier logout of the same key."""
+        try:
+            self._logouts.remove(key)
+        except sqlite3.Error:
+            logger.warning("Could not clear the logout record of a token", exc_info=True)
+        return self.put(key, token_info)
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._drop_local(key)
+        if self._redis_available():
+            try:
+                self._redis.delete(_REDIS_PREFIX + key)
+            except redis.RedisError:
+                self._redis_failed()
+        try:
+            self._logouts.add(key)
+        except sqlite3.Error:
+            logger.warning("Could not record a logout for the other workers", exc_info=True)
+
+    def _drop_local(self, key: str) -> None:
+        self._tokens.pop(key, None)
+        self._used.pop(key, None)
+
+    def _logged_out(self, key: str) -> bool:
+        try:
+            return self._logouts.contains(key)
+        except sqlite3.Error:
+            logger.warning("Could not check the logout record of a token", exc_info=True)
+            return False
+
+    # ---------- Access ----------
+    def access_token(self, key: str, seed: Optional[TokenInfo] = None, touch: bool = True) -> str:
+        """A valid access token for key; seeds the store from the session's token_info if needed.
+
+        touch=False is for background callers: their use neither keeps the token renewed ahead
+        nor counts as activity for the idle drop. Raises RuntimeError when there is no token for
+        key and no seed, or when key was logged out.
+        """
+        info = self.get(key)
+        if info is None:
+            if not seed or self._logged_out(key):
+                raise RuntimeError("Not authenticated. Click 'Login with Spotify'.")
+            info = self.put(key, seed)
+        if touch:
+            self._touch(key)
+        if _expires_in(info) < _EXPIRY_MARGIN_S and info.get("refresh_token"):
+            info = self.refresh(key, info)
+        if not info.get("access_token"):
+            raise RuntimeError("Missing access token. Please log in again.")
+        return info["access_token"]
+
+    def refresh(self, key: str, stale: TokenInfo) -> TokenInfo:
+        """Renew the token for key once, however many threads or workers ask at the same time."""
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            current = self.get(key) or stale
+            if current.get("access_token") != stale.get("access_token"):
+                return current  # another thread renewed it while we waited
+            if not self._acquire_redis_lock(key):
+                return self._wait_for_refresh(key, current)
+            try:
+                renewed = self._refresh_token(current["refresh_token"])
+                renewed.setdefault("refresh_token", current["refresh_token"])
+                self.refreshes += 1
+                return self.put(key, renewed, keep_ttl=True)
+            finally:
+                self._release_redis_lock(key)
+
+    def _touch(self, key: str) -> None:
+        now = time.time()
+        with self._lock:
+            last = self._used.get(key, 0.0)
+            self._used[key] = now
+        if now - last > _RENEW_IF_USED_S and self._redis_available():
+            # Extend the shared idle expiry, at most once an hour per worker.
+            try:
+                self._redis.expire(_REDIS_PREFIX + key, _IDLE_DROP_S)
+            except redis.RedisError:
+                self._redis_failed()
+
+    # ---------- Background refresher ----------
+    def _ensure_refresher(self) -> None:
+        with self._lock:
+            # Started lazily so preloaded gunicorn masters don't fork a running thread.
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="token-refresher", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(_SWEEP_INTERVAL_S)
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Renew recently used tokens expiring within refresh_ahead_s and drop long-idle ones; returns renewals."""
+        now = time.time()
+        with self._lock:
+            keys = list(self._tokens)
+            # Tokens only background callers used here have no entry in _used.
+            idle = [k for k in keys if now - self._used.get(k, 0.0) > _IDLE_DROP_S]
+            active = [k for k in keys if now - self._used.get(k, 0.0) <= _RENEW_IF_USED_S]
+            for key in idle:
+                # Only this process's copy: the user did not log out, so no logout is recorded.
+                self._drop_local(key)
+        renewed = 0
+        for key in active:
+            info = self.get(key)
+            if not info or not info.get("refresh_token") or _expires_in(info) > self.refresh_ahead_s:
+                continue
+            try:
+                self.refresh(key, info)
+                renewed += 1
+            except Exception:
+                logger.warning("Background token refresh failed", exc_info=True)
+        return renewed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tokens = list(self._tokens.values())
+        return {
+            "tokens": len(tokens),
+            "expiring_soon": sum(1 for t in tokens if _expires_in(t) < self.refresh_ahead_s),
+            "refreshes": self.refreshes,
+            "backend": "redis" if self._redis is not None else "memory",
+        }
+
+    # ---------- Redis ----------
+    def _redis_available(self) -> bool:
+        return self._redis is not None and time.time() >= self._redis_down_until
+
+    def _redis_failed(self) -> None:
+        logger.warning("Redis token store unavailable; using process memory for %ss", _REDIS_RETRY_S)
+        self._redis_down_until = time.time() + _REDIS_RETRY_S
+
+    def _acquire_redis_lock(self, key: str) -> bool:
+        if not self._redis_available():
+            return True
+        try:
+            return bool(self._redis.set(f"{_REDIS_PREFIX}lock:{key}", "1", nx=True, px=_LOCK_TTL_MS))
+        except redis.RedisError:
+            self._redis_failed()
+            return True
+
+    def _release_redis_lock(self, key: str) -> None:
+        if self._redis_available():
+            try:
+                self._redis.delete(f"{_REDIS_PREFIX}lock:{key}")
+            except redis.RedisError:
+                self._redis_failed()
+
+    def _wait_for_refresh(self, key: str, stale: TokenInfo) -> TokenInfo:
+        """Another worker holds the refresh lock: wait for its result instead of refreshing again."""
+        deadline = time.time() + _LOCK_WAIT_S
+        while time.time() < deadline:
+            time.sleep(0.1)
+            current = self.get(key)
+            if current and current.get("access_token") != stale.get("access_token"):
+                return current
+        renewed = self._refresh_token(stale["refresh_token"])
+        renewed.setdefault("refresh_token", stale["refresh_token"])
+        self.refreshes += 1
+        return self.put(key, renewed, keep_ttl=True)
+
+
+_store: Optional[TokenStore] = None
+_store_lock = threading.Lock()
+
+
+def get_token_store() -> TokenStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TokenStore()
+        return _store
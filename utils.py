@@ -1,16 +1,21 @@
 import os
 import re
+from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Set
 
-import spotipy
-from spotipy.exceptions import SpotifyException
-
 
 def getenv_stripped(key: str) -> Optional[str]:
     v = os.getenv(key)
     return v.strip() if isinstance(v, str) else v
 
 
+def data_dir() -> Path:
+    """Directory for Orpheus' local persistent stores (ORPHEUS_DATA_DIR, default ./.orpheus_data)."""
+    path = Path(getenv_stripped("ORPHEUS_DATA_DIR") or Path(__file__).with_name(".orpheus_data"))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
 def normalize(s: Optional[str]) -> str:
     return (s or "").strip().lower()
 
@@ -78,25 +83,3 @@ def normalize_genre_list(values: Iterable[Any]) -> List[str]:
             continue
         genres.append(token)
     return dedupe_preserve_order(genres)
-
-
-def filter_existing_tracks(sp: spotipy.Spotify, track_ids: List[str]) -> List[str]:
-    if not track_ids:
-        return []
-    try:
-        resp = sp.tracks(track_ids) or {}
-    except SpotifyException:
-        return track_ids
-    valid = {(track or {}).get("id") for track in (resp.get("tracks") or []) if (track or {}).get("id")}
-    return [tid for tid in track_ids if tid in valid]
-
-
-def filter_existing_artists(sp: spotipy.Spotify, artist_ids: List[str]) -> List[str]:
-    if not artist_ids:
-        return []
-    try:
-        resp = sp.artists(artist_ids) or {}
-    except SpotifyException:
-        return artist_ids
-    valid = {(artist or {}).get("id") for artist in (resp.get("artists") or []) if (artist or {}).get("id")}
-    return [aid for aid in artist_ids if aid in valid]